@@ -1,3 +1,33 @@
-from .client import User
-from .productdata import ProductData
-from .productdata import ProductStatistics
\ No newline at end of file
+import importlib
+
+# The public classes are imported on first access, so that `import aecdata` and the constants
+# of aecdata.utils do not load requests, pandas, numpy and pyarrow
+_lazy_attributes = {
+    'User': 'client',
+    'ProductData': 'productdata',
+    'ProductStatistics': 'productdata',
+    'StatisticsSketch': 'sketches',
+}
+
+_submodules = {
+    'auth', 'cache', 'client', 'compact', 'fetch', 'filterindex', 'groupstats', 'incremental',
+    'instrumentation', 'merge', 'montecarlo', 'outliers', 'parallel', 'planner', 'productdata', 'profiling', 'query',
+    'search', 'sketches', 'snapshot', 'spool', 'streaming', 'tensor', 'textsearch', 'utils',
+}
+
+__all__ = list(_lazy_attributes)
+
+
+def __getattr__(name):
+    if name in _lazy_attributes:
+        value = getattr(importlib.import_module(f'.{_lazy_attributes[name]}', __name__), name)
+    elif name in _submodules:
+        value = importlib.import_module(f'.{name}', __name__)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_attributes) | _submodules)
@@ -1,21 +1,24 @@
+import time
 import requests
 from .utils import *
+from .instrumentation import Instrumentation
 
 class Authenticator:
-    def __init__(self, developer_token, base_api_url = production_base_url):
+    def __init__(self, developer_token, base_api_url = production_base_url, instrumentation=None):
         self.base_api_url = base_api_url
         self.developer_token = developer_token
         self.api_token = None
         self.refresh_token = None
+        # Events of the requests are sent to the hooks of the instrumentation
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation()
 
     def get_token(self):
         base_token_url = f'{self.base_api_url}developer/api/token/getapitoken/'
         get_token_headers = {'Authorization': f'Bearer {self.developer_token}'}
 
         try:
-            response = requests.get(base_token_url, headers=get_token_headers)
+            response, token_data = self.instrumentation.request('GET', base_token_url, 'token', headers=get_token_headers)
             response.raise_for_status()
-            token_data = response.json()
             self.api_token = token_data['api_token']
             return self.api_token
         except requests.RequestException as e:
@@ -26,9 +29,8 @@ class Authenticator:
         get_token_headers = {'Authorization': f'Bearer {self.developer_token}'}
 
         try:
-            response = requests.get(base_token_url, headers=get_token_headers)
+            response, token_data = self.instrumentation.request('GET', base_token_url, 'token', headers=get_token_headers)
             response.raise_for_status()
-            token_data = response.json()
             self.api_token = token_data['api_token']
             self.refresh_token = token_data['refresh_token']
             return self.api_token, self.refresh_token
@@ -49,10 +51,10 @@ class Authenticator:
         }
 
         try:
-            refresh_response = requests.post(refresh_url, headers=refresh_headers, data=refresh_data)
+            refresh_response, refresh_data = self.instrumentation.request('POST', refresh_url, 'refresh', headers=refresh_headers, data=refresh_data)
             refresh_response.raise_for_status()  # This will raise an exception for HTTP errors
-            refresh_data = refresh_response.json()
             self.api_token = refresh_data['api_token']  # Update the api_token with the new one
+            self.instrumentation.emit({'event': 'token_refresh', 'timestamp': time.time(), 'success': True, 'error': None})
         except requests.RequestException as e:
+            self.instrumentation.emit({'event': 'token_refresh', 'timestamp': time.time(), 'success': False, 'error': str(e)})
             raise Exception(f"Failed to refresh API token: {e}")
-
@@ -0,0 +1,208 @@
+import copy
+import functools
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import sys
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+
+# Kinds (pandas.api.types.infer_dtype) of the object columns holding only numbers
+numerical_kinds = {'floating', 'integer', 'mixed-integer-float', 'empty'}
+# Kinds of the object columns holding only immutable values, their cells are not copied
+immutable_kinds = numerical_kinds | {'string', 'boolean'}
+
+
+def get_dataframe_fingerprint(df):
+    """
+    Computes a fingerprint of the content of a DataFrame (index, columns and values), so
+    that equal DataFrames get the same fingerprint across processes.
+
+    :return: Hexadecimal string.
+    """
+    fingerprint = hashlib.blake2b(digest_size=16)
+    fingerprint.update(pd.util.hash_pandas_object(df.index.to_series(), index=False).to_numpy().tobytes())
+    for column in df.columns:
+        series = df[column]
+        dtype = series.dtype
+        # Object columns of numbers (with None for missing values) are hashed as numbers, the
+        # kind of their values is part of the fingerprint so that '12' and 12.0 differ
+        kind = pd.api.types.infer_dtype(series, skipna=True) if dtype == object else None
+        if isinstance(dtype, np.dtype) and dtype.kind in 'biufcmM':
+            content = series.to_numpy().tobytes()
+        elif kind in numerical_kinds:
+            content = series.to_numpy(dtype=float).tobytes()
+        else:
+            try:
+                content = pd.util.hash_pandas_object(series, index=False, categorize=False).to_numpy().tobytes()
+            except (TypeError, ValueError):
+                # Columns that contain lists
+                content = repr(series.tolist()).encode()
+        fingerprint.update(repr(column).encode())
+        fingerprint.update(f'{dtype}:{kind}'.encode())
+        fingerprint.update(content)
+    return fingerprint.hexdigest()
+
+
+def get_query_key(name, arguments, fingerprint):
+    """
+    Builds the cache key of a query from the method name, its arguments and the data fingerprint.
+    """
+    def canonical(value):
+        if isinstance(value, (set, frozenset)):
+            return sorted(value, key=repr)
+        if isinstance(value, np.generic):
+            return value.item()
+        return repr(value)
+
+    signature = json.dumps([name, arguments, fingerprint], sort_keys=True, default=canonical)
+    return hashlib.blake2b(signature.encode(), digest_size=16).hexdigest()
+
+
+def get_size(value):
+    """Approximate memory used by a cached result in bytes."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(np.sum(value.memory_usage(deep=True)))
+    if isinstance(value, dict):
+        return sum(get_size(v) for v in value.values())
+    return sys.getsizeof(value)
+
+
+def copy_cell(value):
+    return copy.deepcopy(value) if isinstance(value, (list, dict, set, np.ndarray)) else value
+
+
+def copy_series(series):
+    series = series.copy()
+    if series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) not in immutable_kinds:
+        # Lists and arrays in the cells (e.g. outlier_ids, quartiles) are copied as well
+        series = series.map(copy_cell)
+    return series
+
+
+def copy_result(value):
+    """
+    Returns a copy of a cached result that callers can modify without changing the cache,
+    including the lists and arrays in the cells of DataFrames.
+    """
+    if isinstance(value, pd.DataFrame):
+        value = value.copy()
+        for position, dtype in enumerate(value.dtypes):
+            if dtype == object:
+                value.isetitem(position, copy_series(value.iloc[:, position]))
+        return value
+    if isinstance(value, pd.Series):
+        return copy_series(value)
+    if isinstance(value, dict):
+        return {k: copy_result(v) for k, v in value.items()}
+    return value
+
+
+class ResultCache:
+    """
+    LRU cache of query results bounded by the number of entries and their memory use.
+    When cache_dir is set, results are also pickled to that directory and reloaded from it
+    on a miss, so they survive restarts and can be shared between processes.
+    """
+
+    def __init__(self, max_entries=128, max_bytes=256 * 2 ** 20, cache_dir=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.pkl')
+
+    def _store(self, key, value):
+        size = get_size(value)
+        if size > self.max_bytes:
+            return
+        self.entries[key] = value
+        self.sizes[key] = size
+        self.n_bytes += size
+        while len(self.entries) > self.max_entries or self.n_bytes > self.max_bytes:
+            evicted, _ = self.entries.popitem(last=False)
+            self.n_bytes -= self.sizes.pop(evicted)
+
+    def get(self, key):
+        """
+        :return: tuple (found, value).
+        """
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True, self.entries[key]
+        if self.cache_dir is not None and os.path.exists(self._path(key)):
+            with open(self._path(key), 'rb') as f:
+                value = pickle.load(f)
+            self._store(key, value)
+            self.hits += 1
+            return True, value
+        self.misses += 1
+        return False, None
+
+    def set(self, key, value):
+        if key in self.entries:
+            self.n_bytes -= self.sizes.pop(key)
+            del self.entries[key]
+        self._store(key, value)
+        if self.cache_dir is not None:
+            # Write to a temporary file first so other processes never read a partial file
+            temporary_path = f'{self._path(key)}.{os.getpid()}.tmp'
+            with open(temporary_path, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary_path, self._path(key))
+
+    def clear(self):
+        """Empties the cache, including the files in cache_dir."""
+        self.entries.clear()
+        self.sizes.clear()
+        self.n_bytes = 0
+        if self.cache_dir is not None:
+            for file_name in os.listdir(self.cache_dir):
+                if file_name.endswith('.pkl'):
+                    os.remove(os.path.join(self.cache_dir, file_name))
+
+
+def memoized(*ignored_arguments):
+    """
+    Decorator caching the results of a ProductStatistics method in its ResultCache (if one is
+    enabled), keyed by the method arguments and the fingerprint of the DataFrame. Arguments
+    that do not change the result (e.g. n_jobs) can be listed in ignored_arguments.
+    """
+    def decorator(method):
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            cache = getattr(self, 'cache', None)
+            if cache is None:
+                return method(self, *args, **kwargs)
+
+            bound_arguments = signature.bind(self, *args, **kwargs)
+            bound_arguments.apply_defaults()
+            arguments = {name: value for name, value in list(bound_arguments.arguments.items())[1:]
+                         if name not in ignored_arguments}
+            key = get_query_key(method.__name__, arguments, self.get_fingerprint())
+
+            found, result = cache.get(key)
+            if not found:
+                result = method(self, *args, **kwargs)
+                cache.set(key, result)
+            return copy_result(result)
+
+        return wrapper
+
+    return decorator
+
@@ -1,16 +1,25 @@
+import logging
 import requests
 import warnings
 from .auth import Authenticator
+from .fetch import AIMDController, PageFetcher
+from .filterindex import FilterIndex
+from .instrumentation import Instrumentation
+from .spool import Spool
 from .utils import *
 from urllib.parse import urlencode
 
 # Ensure all instances of this specific warning are always shown
 warnings.simplefilter('always', UserWarning)
 
+logger = logging.getLogger(__name__)
+
 class User:
-    def __init__(self, developer_token, base_api_url = production_base_url):
+    def __init__(self, developer_token, base_api_url = production_base_url, hooks=None):
         self.base_api_url = base_api_url
-        self.authenticator = Authenticator(developer_token, base_api_url)
+        # Hooks receive the events of the requests to the API, see Instrumentation
+        self.instrumentation = Instrumentation(hooks)
+        self.authenticator = Authenticator(developer_token, base_api_url, self.instrumentation)
         self.api_token, self.refresh_token = self.authenticator.get_api_and_refresh_token()
         self._filters = None
         self._field_description = None
@@ -35,9 +44,19 @@ class User:
         try:
             self.authenticator.refresh_api_token()  # This updates the authenticator's api_token
             self.api_token = self.authenticator.api_token  # Update the User's api_token
-            print("API Token refreshed successfully.")
+            logger.info("API Token refreshed successfully.")
         except Exception as e:
-            print(f"Error refreshing API token: {e}")
+            logger.error(f"Error refreshing API token: {e}")
+
+    def add_hook(self, hook):
+        """
+        Adds a callable receiving the events of the requests to the API (start and end of every
+        request, token refreshes), e.g. an instrumentation.MetricsCollector.
+        """
+        self.instrumentation.add_hook(hook)
+
+    def remove_hook(self, hook):
+        self.instrumentation.remove_hook(hook)
 
     def get_filters_template(self):
         field_description = self.field_description
@@ -93,9 +112,8 @@ class User:
             'Content-Type': 'application/json',
         }
         try:
-            response = requests.get(get_filters_url, headers=headers)
+            response, filters = self.instrumentation.request('GET', get_filters_url, 'get_product_filters', headers=headers)
             response.raise_for_status()
-            filters = response.json()
             return filters
         except requests.RequestException as e:
             raise Exception(f"Failed call to get_filters API: {e}")
@@ -109,39 +127,47 @@ class User:
                         i in ['product_type', 'material_types', 'company', 'manufacturing_country', 'continent']}
         return open_filters
 
-    def get_filters_mapping(self):
-        filters = self.filters  # Retrieve the filters
-        filter_mappings = {}
-
-        for filter_key, filter_def in filters.items():
-            opts = filter_def.get('filter_options') or []
-            category_mapping = {}
-
-            for item in opts:
-                # Skip anything that isn't a dict
-                if not isinstance(item, dict):
-                    continue
-
-                # In the new format, each item should have 'value' as the human-readable label
-                # and 'id' as the identifier (if present)
-                label = item.get('value')
-                if label is None or label == '':
-                    # Skip items without a readable value
-                    continue
+    def get_filter_index(self):
+        """
+        Returns the FilterIndex of the filter options, mapping labels to ids (ignoring case) and
+        ids to labels, with prefix lookups. It is built once for every snapshot of the filters.
+        """
+        cached = getattr(self, '_filter_index', None)
+        if cached is None or cached[0] is not self.filters:
+            cached = (self.filters, FilterIndex(self.filters))
+            self._filter_index = cached
+        return cached[1]
 
-                # Use 'id' if available, otherwise fall back to 'value' for the mapping
-                identifier = item.get('id', label)
-                
-                category_mapping[label] = identifier
+    def get_filters_mapping(self):
+        """
+        Returns the mapping of every filter from the labels of its options to their ids.
+        The dicts are copies, modifying them does not change the FilterIndex.
+        """
+        return {filter_key: dict(label_to_id) for filter_key, label_to_id in self.get_filter_index().mapping.items()}
 
-            # Only include categories that actually had something
-            if category_mapping:
-                filter_mappings[filter_key] = category_mapping
+    def save_filters(self, path):
+        """
+        Saves the filters and their index to a file, so that other processes can load them
+        with load_filters instead of calling get_filters.
+        """
+        self.get_filter_index().save(path, self.filters)
 
-        return filter_mappings
+    def load_filters(self, path):
+        """Loads the filters and their index saved with save_filters."""
+        filters, index = FilterIndex.load(path)
+        self._filters = filters
+        self._filter_index = (filters, index)
 
+    def request_products_page(self, page=1, openapi=False, retries=0, token_refreshes=0, decode=None, **filters):
+        """
+        Sends the request of a page of products without raising on error statuses.
 
-    def get_products_page(self, page=1, openapi=False, **filters):
+        :param retries: The number of previous attempts of the request, reported to the hooks.
+        :param token_refreshes: The number of token refreshes for the request, reported to the hooks.
+        :param decode: Optional function decoding the page from the chunks of bytes of the
+                       streamed response, see streaming.decode_page.
+        :return: tuple (response, data) with data None if the status is an error.
+        """
         endpoint = 'get_products_open_api' if openapi else 'get_products'
         base_url = f"{self.base_api_url}developer/api/{endpoint}"
 
@@ -156,11 +182,14 @@ class User:
             'Authorization': f'Bearer {self.api_token}',
             'Content-Type': 'application/json',
         }
+        return self.instrumentation.request('GET', url, endpoint, page=page, retries=retries,
+                                            token_refreshes=token_refreshes, decode=decode, headers=headers)
 
+    def get_products_page(self, page=1, openapi=False, **filters):
+        resp, data = self.request_products_page(page, openapi, **filters)
         try:
-            resp = requests.get(url, headers=headers)
             resp.raise_for_status()
-            return resp.json()
+            return data
         except requests.HTTPError as e:
             if resp.status_code == 401:
                 raise Exception(
@@ -190,9 +219,9 @@ class User:
         }
 
         try:
-            response = requests.get(url, headers=headers)
+            response, data = self.instrumentation.request('GET', url, 'get_products', page=1, headers=headers)
             response.raise_for_status()
-            total_products = response.json()['TotalProducts']
+            total_products = data['TotalProducts']
             return total_products
         except requests.RequestException as e:
             if e.response.status_code == 401:  # Unauthorized
@@ -201,40 +230,181 @@ class User:
             else:
                 raise Exception(f"Failed call to get_products: {e}")
 
-    def get_products(self, openapi=False, **filters):
-        items_per_page = 200
+    def get_products(self, openapi=False, page_size=None, max_concurrency=1, controller=None, stream=False, **filters):
+        """
+        Fetches all the products matching the filters, page by page. With max_concurrency above
+        1, the pages after the first one are fetched with several requests in flight, adapted by
+        an AIMDController: more while the latency stays flat, fewer when the API throttles (429),
+        fails (5xx) or slows down. Throttled and failed requests are retried and expired API
+        tokens refreshed.
+
+        :param openapi: Whether to use the free Open API.
+        :param page_size: The number of products per page requested, if the API allows it.
+                          If None, the default of the API.
+        :param max_concurrency: The highest number of requests in flight. The default fetches
+                                the pages one by one, e.g. 8 to fetch them concurrently.
+        :param controller: An AIMDController replacing the default one with max_concurrency.
+        :param stream: Whether to decode the pages product by product while they are received,
+                       instead of holding the text of every page with its decoded products.
+        :param filters: The filters of the products.
+        :return: list of the products.
+        """
+        decode = None
+        if stream:
+            from .streaming import decode_page as decode
+
+        pages = self.fetch_pages(openapi, page_size, max_concurrency, controller, decode, filters)
         all_products = []  # This will store all products across pages
-        page = 1  # Start from the first page
+        for page in sorted(pages):
+            all_products.extend(pages[page])
+        return all_products
 
+    def get_product_data(self, openapi=False, page_size=None, max_concurrency=1, controller=None, **filters):
+        """
+        Fetches all the products matching the filters like get_products and returns them as
+        ProductData. The pages are streamed and every product is flattened into the columns of
+        the DataFrame as soon as it is decoded, so that neither the text of the pages nor the
+        nested products are held all together, and pd.json_normalize is not needed.
+
+        :return: ProductData with the products, its data is built from the DataFrame if needed.
+        """
+        from .productdata import ProductData, add_scaling_factor
+        from .streaming import ColumnBuffers, decode_page_to_buffers
+
+        def decode(chunks):
+            return decode_page_to_buffers(chunks, add_scaling_factor)
+
+        pages = self.fetch_pages(openapi, page_size, max_concurrency, controller, decode, filters)
+        buffers = ColumnBuffers()
+        for page in sorted(pages):
+            buffers.extend(pages.pop(page))
+        return ProductData(ProductData.order_columns(buffers.to_dataframe()))
+
+    def fetch_pages(self, openapi, page_size, max_concurrency, controller, decode, filters):
+        """Fetches all the pages of a query, returns a dict mapping the pages to their results."""
         if not filters:
             warnings.warn(
                 "You are retrieving all products. No filters were applied. This will take a while..",
                 UserWarning  # This is the default, but specifying it makes the intention clear
             )
 
-        response = self.get_products_page(page, openapi=openapi, **filters)
-
+        fetcher = self.get_page_fetcher(openapi, page_size, max_concurrency, controller, filters, decode)
+        response = fetcher.fetch_page(1)
         total_products = response['TotalProducts']
-        # integer division trick to get one more page if there is a remainder
-        total_pages = (total_products + items_per_page - 1) // items_per_page
+        total_pages = self.get_number_of_pages(response, page_size)[1]
         if total_pages > 1:
-            print(f'Total products {total_products}.')
+            logger.info(f'Total products {total_products}.')
+            logger.info(f'Finished fetching page 1 out of {total_pages}')
 
-        while page <= total_pages:
+        pages = {1: response['results']}
 
-            all_products.extend(response['results'])  # Append the current page's products
+        def add_page(page, data):
+            pages[page] = data['results']
+            logger.info(f'Finished fetching page {page} out of {total_pages}')
 
-            if total_pages>1:
-                print(f'Finished fetching page {page} out of {total_pages}')
+        fetcher.fetch(range(2, total_pages + 1), add_page)
+        return pages
 
-            page += 1  # Go to the next page
+    def get_page_fetcher(self, openapi, page_size, max_concurrency, controller, filters, decode=None):
+        if page_size is not None:
+            filters = {**filters, 'page_size': page_size}
+        if controller is None:
+            controller = AIMDController(maximum=max_concurrency)
+        return PageFetcher(self, openapi, filters, controller, decode=decode)
 
-            if not response['next']:
-                break  # If no response, exit the loop
-            else:
-                response = self.get_products_page(page, openapi=openapi, **filters)
+    @staticmethod
+    def get_number_of_pages(response, page_size=None):
+        """
+        Returns (products per page, number of pages) of a query from its first page. The
+        products per page are those of the first page, as the API may not allow page_size.
+        """
+        results, total_products = response['results'], response['TotalProducts']
+        if not response['next'] or not results:
+            return max(len(results), 1), 1
+        if page_size is not None and len(results) != page_size:
+            warnings.warn(f"The API returned {len(results)} products per page instead of page_size={page_size}.", UserWarning)
+        # integer division trick to get one more page if there is a remainder
+        return len(results), (total_products + len(results) - 1) // len(results)
 
-        return all_products
+    def download_products(self, directory, openapi=False, page_size=None, max_concurrency=1, controller=None, **filters):
+        """
+        Fetches the products like get_products, saving every page to a spool directory as soon
+        as it is fetched, with a manifest of the filters, TotalProducts and pages done. If the
+        download fails, calling it again with the same directory fetches only the missing pages,
+        or all of them again if TotalProducts changed in between. A complete download is loaded
+        from the directory.
+
+        :param directory: The spool directory, one per download.
+        :param openapi: Whether to use the free Open API.
+        :param page_size: The number of products per page requested, see get_products.
+        :param max_concurrency: The highest number of requests in flight, see get_products.
+        :param controller: An AIMDController replacing the default one with max_concurrency.
+        :param filters: The filters of get_products.
+        :return: ProductData with the products of all the pages.
+        :raises ValueError: If the directory holds a download with other filters or page_size.
+        """
+        from .productdata import ProductData
+
+        fetcher = self.get_page_fetcher(openapi, page_size, max_concurrency, controller, filters)
+        spool = Spool(directory, fetcher.filters, openapi)
+        if not spool.complete:
+            if not filters and not spool.started:
+                warnings.warn(
+                    "You are retrieving all products. No filters were applied. This will take a while..",
+                    UserWarning
+                )
+            # Page 1 is fetched again on resume, the pages done are discarded if TotalProducts changed
+            response = fetcher.fetch_page(1)
+            total_products, items_per_page = response['TotalProducts'], self.get_number_of_pages(response, page_size)[0]
+            if not spool.started or (spool.manifest['total_products'], spool.manifest['items_per_page']) != (total_products, items_per_page):
+                spool.start(total_products, items_per_page)
+            if 1 in spool.missing_pages:
+                spool.save_page(1, response['results'])
+
+        missing_pages = spool.missing_pages
+        if missing_pages:
+            logger.info(f"Total products {spool.manifest['total_products']}, {len(missing_pages)} pages to fetch.")
+
+        def save_page(page, data):
+            spool.save_page(page, data['results'])
+            logger.info(f"Finished fetching page {page} out of {spool.manifest['total_pages']}")
+
+        fetcher.fetch(missing_pages, save_page)
+        return ProductData(spool.load_products())
+
+    def plan_filters(self, conditions, openapi=False):
+        """
+        Splits conditions on the products into the filters sent to get_products and the
+        conditions applied locally, translating labels (product type, company, continent...)
+        to their ids with get_filter_index. Use explain() on the result to see the split.
+
+        :param conditions: dict mapping columns to conditions, see ProductData.query.
+        :param openapi: Whether the query is made to the free Open API.
+        :return: A FilterPlan.
+        """
+        # The planner needs numpy and pandas, which a User only making requests does not load
+        from .planner import FilterPlan
+
+        filter_index = self.get_filter_index() if conditions else FilterIndex({})
+        return FilterPlan(conditions, filter_index, openapi)
+
+    def get_filtered_products(self, conditions, openapi=False):
+        """
+        Fetches the products matching the conditions, filtering on the server whatever the API
+        supports so that fewer pages are downloaded, and the rest locally.
+
+        :param conditions: dict mapping columns to conditions, see ProductData.query.
+        :param openapi: Whether to use the free Open API.
+        :return: ProductData with the matching products.
+        """
+        from .productdata import ProductData
+
+        plan = self.plan_filters(conditions, openapi)
+        products = self.get_products(openapi=openapi, **plan.api_filters)
+        product_data = ProductData(products)
+        if plan.local_conditions and products:
+            product_data = ProductData(product_data.query(plan.local_conditions))
+        return product_data
 
     # def get_products_open_api(self, page=1, **filters):
     #
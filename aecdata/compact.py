@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+from .utils import scalable_columns
+
+# Text columns with at most this share of distinct values are stored as Categorical
+max_categorical_ratio = 0.5
+
+
+def intern_lists(series):
+    """
+    Replaces the lists of a column by one shared list per distinct list, so repeated values
+    like ['Wall', 'Roof'] are stored once.
+    """
+    pool = {}
+    return series.map(lambda x: pool.setdefault(tuple(x), x) if isinstance(x, list) else x)
+
+
+def compact_dataframe(df, float32=False):
+    """
+    Returns a copy of the DataFrame using less memory:
+        - text columns with repeated values (company, product_type, country,
+          material_facts.declared_unit...) are stored as pandas Categorical,
+        - numerical columns are stored as float arrays instead of Python objects,
+        - columns that contain lists share one list per distinct list,
+        - optionally, the LCA and numerical material facts values are stored as float32.
+
+    Missing values are NaN instead of None, expand_dataframe restores the original layout.
+
+    :param df: The DataFrame to compact.
+    :param float32: Whether to store the LCA values as float32.
+    :return: The compacted DataFrame.
+    """
+    scalable_set = set(scalable_columns)
+    columns = {}
+    for column in df.columns:
+        series = df[column]
+        # Text columns are object columns, or str columns with pandas 3
+        if pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            kind = pd.api.types.infer_dtype(series, skipna=True)
+            if kind == 'string':
+                if series.nunique() <= max_categorical_ratio * series.count():
+                    series = series.astype('category')
+            elif kind in ('floating', 'integer', 'mixed-integer-float'):
+                series = series.astype(float)
+            elif kind == 'mixed' and series.map(lambda x: isinstance(x, list)).any():
+                series = intern_lists(series)
+        if float32 and column in scalable_set and series.dtype == np.float64:
+            series = series.astype(np.float32)
+        columns[column] = series
+    return pd.DataFrame(columns, index=df.index)
+
+
+def expand_dataframe(df):
+    """
+    Converts a compacted DataFrame back to object columns with None for missing values.
+    """
+    categorical_columns = [column for column, dtype in df.dtypes.items() if isinstance(dtype, pd.CategoricalDtype)]
+    if categorical_columns:
+        df = df.astype({column: object for column in categorical_columns})
+    return df.replace({np.nan: None})
@@ -0,0 +1,202 @@
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Statuses of the responses retried by PageFetcher
+retried_statuses = {429, 500, 502, 503, 504}
+
+
+class AIMDController:
+    """
+    Adapts the number of requests in flight AIMD-style (additive increase, multiplicative
+    decrease), as TCP does with its congestion window: the limit grows by one for every window
+    of successful requests while their latency stays flat, and is cut when the API throttles
+    (429), fails (5xx) or the latency rises above the lowest latency seen.
+    """
+
+    def __init__(self, initial=1, minimum=1, maximum=8, latency_tolerance=1.5, backoff=0.5, smoothing=0.3):
+        """
+        :param initial: The number of requests in flight at the start.
+        :param minimum: The lowest number of requests in flight.
+        :param maximum: The highest number of requests in flight.
+        :param latency_tolerance: Ratio of the smoothed latency to the lowest latency seen above
+                                  which the latency is considered rising.
+        :param backoff: Factor applied to the number of requests in flight when backing off.
+        :param smoothing: Weight of the last latency in its exponential moving average.
+        """
+        if not 1 <= minimum <= initial <= maximum:
+            raise ValueError('The concurrency must satisfy 1 <= minimum <= initial <= maximum.')
+        if not 0 < backoff < 1:
+            raise ValueError('backoff must be between 0 and 1.')
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+        self.smoothing = smoothing
+        self.lock = threading.Lock()
+        self.window = float(initial)
+        self.latency = None
+        self.baseline_latency = None
+        self.completed = 0
+        self.last_backoff = -1
+        self.history = [(time.perf_counter(), initial)]
+
+    @property
+    def limit(self):
+        """The number of requests allowed in flight."""
+        return int(self.window)
+
+    def record(self):
+        if self.history[-1][1] != self.limit:
+            self.history.append((time.perf_counter(), self.limit))
+
+    def decrease(self):
+        # The requests already in flight when backing off report the same congestion, so the
+        # window is cut at most once per window of completed requests
+        if self.completed - self.last_backoff < self.limit:
+            return
+        self.window = max(self.minimum, self.window * self.backoff)
+        self.last_backoff = self.completed
+        self.record()
+
+    def on_success(self, latency):
+        """Reports a successful request and its latency in seconds."""
+        with self.lock:
+            self.completed += 1
+            self.latency = latency if self.latency is None else (1 - self.smoothing) * self.latency + self.smoothing * latency
+            if self.baseline_latency is None or self.latency < self.baseline_latency:
+                self.baseline_latency = self.latency
+            if self.latency > self.baseline_latency * self.latency_tolerance:
+                self.decrease()
+            else:
+                self.window = min(self.maximum, self.window + 1 / self.limit)
+                self.record()
+
+    def on_throttle(self):
+        """Reports a throttled request (429)."""
+        with self.lock:
+            self.completed += 1
+            self.decrease()
+
+    def on_error(self):
+        """Reports a failed request (5xx or no response)."""
+        with self.lock:
+            self.completed += 1
+            self.decrease()
+
+
+class PageFetcher:
+    """
+    Fetches pages of products with several requests in flight, as many as its AIMDController
+    allows. Throttled requests and server errors are retried after a delay (the Retry-After of
+    429s) and expired API tokens are refreshed.
+    """
+
+    def __init__(self, user, openapi=False, filters=None, controller=None, max_retries=5, retry_delay=1.0, decode=None):
+        """
+        :param user: The User making the requests.
+        :param openapi: Whether to use the free Open API.
+        :param filters: The filters of the requests, including page_size if any.
+        :param controller: The AIMDController. If None, a default one.
+        :param max_retries: The number of retries of a page before its error is raised.
+        :param retry_delay: The delay in seconds before the first retry of a server error,
+                            doubled for every other retry.
+        :param decode: Optional function decoding the pages from the chunks of bytes of the
+                       streamed responses, see streaming.decode_page.
+        """
+        self.user = user
+        self.openapi = openapi
+        self.filters = filters or {}
+        self.controller = controller if controller is not None else AIMDController()
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.decode = decode
+        self.token_lock = threading.Lock()
+
+    def refresh_api_token(self, expired_token):
+        # Only the first request seeing the expired token refreshes it
+        with self.token_lock:
+            if self.user.api_token == expired_token:
+                self.user.refresh_api_token()
+
+    def fetch_page(self, page):
+        """Returns the decoded body of a page, retrying throttled and failed requests."""
+        retries, token_refreshes, unauthorized = 0, 0, 0
+        while True:
+            api_token = self.user.api_token
+            start = time.perf_counter()
+            try:
+                response, data = self.user.request_products_page(page, self.openapi, retries, token_refreshes, self.decode,
+                                                                **self.filters)
+            except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError):
+                # Streamed pages may also fail while their body is read
+                self.controller.on_error()
+                if retries >= self.max_retries:
+                    raise
+                time.sleep(self.retry_delay * 2 ** retries)
+                retries += 1
+                continue
+            latency = time.perf_counter() - start
+
+            if response.ok:
+                self.controller.on_success(latency)
+                return data
+            if response.status_code == 401:
+                # A token refreshed for this request and rejected right away means no access,
+                # while a token expiring during the delay of a retry is refreshed again
+                if unauthorized:
+                    raise Exception("Unauthorized. Try `openapi=True` for the free tier.")
+                self.refresh_api_token(api_token)
+                token_refreshes += 1
+                unauthorized += 1
+                continue
+            unauthorized = 0
+            if response.status_code not in retried_statuses or retries >= self.max_retries:
+                response.raise_for_status()
+
+            if response.status_code == 429:
+                self.controller.on_throttle()
+                delay = self.get_retry_after(response, retries)
+            else:
+                self.controller.on_error()
+                delay = self.retry_delay * 2 ** retries
+            logger.info(f'Page {page} failed with status {response.status_code}, retrying in {delay:.1f} s.')
+            time.sleep(delay)
+            retries += 1
+
+    def get_retry_after(self, response, retries):
+        try:
+            return float(response.headers['Retry-After'])
+        except (KeyError, ValueError):
+            return self.retry_delay * 2 ** retries
+
+    def fetch(self, pages, callback):
+        """
+        Fetches pages, calling callback(page, data) in the calling thread as each one completes,
+        in no particular order. If a page fails, the pages not started are cancelled and its
+        error is raised.
+        """
+        pages = list(pages)
+        if not pages:
+            return
+        with ThreadPoolExecutor(max_workers=self.controller.maximum) as executor:
+            in_flight = {}
+            next_page = 0
+            try:
+                while next_page < len(pages) or in_flight:
+                    while next_page < len(pages) and len(in_flight) < self.controller.limit:
+                        page = pages[next_page]
+                        in_flight[executor.submit(self.fetch_page, page)] = page
+                        next_page += 1
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        page = in_flight.pop(future)
+                        callback(page, future.result())
+            finally:
+                for future in in_flight:
+                    future.cancel()
@@ -0,0 +1,119 @@
+import os
+import pickle
+from bisect import bisect_left
+
+
+def fold(label):
+    return label.casefold().strip()
+
+
+class FilterIndex:
+    """
+    Index of the options of the product filters, mapping labels to ids and ids to labels.
+
+    Labels are matched exactly first and then ignoring case, and the labels of every filter
+    are kept sorted for prefix lookups.
+    """
+
+    def __init__(self, filters):
+        """
+        :param filters: The filters returned by User.get_filters.
+        """
+        self.mapping = {}
+        self.labels = {}
+        self.folded = {}
+        self.sorted_labels = {}
+
+        for filter_key, filter_def in filters.items():
+            opts = filter_def.get('filter_options') or []
+            label_to_id, id_to_label, folded = {}, {}, {}
+            for item in opts:
+                if not isinstance(item, dict):
+                    continue
+                label = item.get('value')
+                if label is None or label == '':
+                    continue
+                # Use 'id' if available, otherwise fall back to 'value'
+                identifier = item.get('id', label)
+                label_to_id[label] = identifier
+                id_to_label.setdefault(identifier, label)
+                if isinstance(label, str):
+                    folded.setdefault(fold(label), label)
+
+            if label_to_id:
+                self.mapping[filter_key] = label_to_id
+                self.labels[filter_key] = id_to_label
+                self.folded[filter_key] = folded
+                keys = sorted(folded)
+                self.sorted_labels[filter_key] = (keys, [folded[key] for key in keys])
+
+    def get_label(self, filter_key, label):
+        """Returns the label of the filter matching label, ignoring case, or None."""
+        if label in self.mapping.get(filter_key, {}):
+            return label
+        if isinstance(label, str):
+            return self.folded.get(filter_key, {}).get(fold(label))
+        return None
+
+    def get_id(self, filter_key, label, default=None):
+        """Returns the id of a label of the filter (ignoring case), or default."""
+        label = self.get_label(filter_key, label)
+        return self.mapping[filter_key][label] if label is not None else default
+
+    def get_ids(self, filter_key, labels):
+        """
+        Returns the ids of labels of the filter.
+
+        :raises ValueError: If a label is not an option of the filter.
+        """
+        ids = []
+        for label in labels:
+            identifier = self.get_id(filter_key, label)
+            if identifier is None:
+                raise ValueError(f'"{label}" is not an option of the filter "{filter_key}".')
+            ids.append(identifier)
+        return ids
+
+    def get_label_of_id(self, filter_key, identifier, default=None):
+        """Returns the label of an id of the filter, or default."""
+        return self.labels.get(filter_key, {}).get(identifier, default)
+
+    def find(self, filter_key, prefix):
+        """
+        Returns the options of the filter whose label starts with prefix, ignoring case.
+
+        :return: dict mapping the labels to their ids, in alphabetical order.
+        """
+        if filter_key not in self.sorted_labels:
+            return {}
+        keys, labels = self.sorted_labels[filter_key]
+        prefix = fold(prefix)
+        matches = {}
+        for position in range(bisect_left(keys, prefix), len(keys)):
+            if not keys[position].startswith(prefix):
+                break
+            matches[labels[position]] = self.mapping[filter_key][labels[position]]
+        return matches
+
+    def save(self, path, filters=None):
+        """
+        Saves the index, and the filters it was built from, to a file.
+
+        :param path: The path of the file.
+        :param filters: The filters, saved with the index so they can be loaded without the API.
+        """
+        temporary_path = f'{path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'wb') as f:
+            pickle.dump({'filters': filters, 'index': self}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, path)
+
+    @staticmethod
+    def load(path):
+        """
+        Loads a file saved with save.
+
+        :return: tuple (filters, index).
+        """
+        with open(path, 'rb') as f:
+            saved = pickle.load(f)
+        return saved['filters'], saved['index']
@@ -0,0 +1,211 @@
+import numpy as np
+import pandas as pd
+from .outliers import get_outlier_masks, get_outlier_ids
+from .parallel import get_n_jobs, SharedArrays, load_shared_arrays, split_range, run_in_pool
+from .profiling import stage, profiled
+
+
+@profiled('groupstats.get_group_codes', rows=lambda df, *args, **kwargs: len(df))
+def get_group_codes(df, group_by=None, min_count=1):
+    """
+    Assigns every row of the DataFrame to the group_by combinations it belongs to.
+
+    Rows of columns that contain lists are repeated once per list item, so a row can
+    belong to several combinations.
+
+    :param df: The DataFrame to group.
+    :param group_by: The list of columns to group by. If None, group by 'product_type'.
+    :param min_count: Minimum number of products for a combination to be included.
+    :return: tuple (positions, codes, groups_df). positions holds the row positions in df,
+             codes the combination of each of these rows and groups_df one row per combination
+             with the group_by values and the 'count' of products.
+    """
+    if group_by is None:
+        group_by = ['product_type']
+    group_by = list(group_by)
+
+    keys = df[group_by].reset_index(drop=True)
+    for group in group_by:
+        if keys[group].apply(lambda x: isinstance(x, list)).any():
+            keys = keys.explode(group)
+    keys = keys.dropna()
+    # A list column can repeat the same item, keep one membership per row and combination
+    keys = keys[~keys.reset_index().duplicated().to_numpy()]
+
+    grouped = keys.groupby(group_by, sort=True, observed=True)
+    codes = grouped.ngroup().to_numpy()
+    sizes = grouped.size()
+    counts = sizes.to_numpy()
+
+    valid = counts[codes] >= min_count
+    positions = keys.index.to_numpy()[valid]
+    valid_codes, codes = np.unique(codes[valid], return_inverse=True)
+
+    groups_df = sizes.index.to_frame(index=False).iloc[valid_codes]
+    # Categorical columns of compacted DataFrames
+    groups_df = groups_df.astype({group: object for group in group_by if isinstance(groups_df[group].dtype, pd.CategoricalDtype)})
+    groups_df['count'] = counts[valid_codes]
+    return positions, codes, groups_df.reset_index(drop=True)
+
+
+@profiled('groupstats.get_statistics_df')
+def get_statistics_df(groups_df, has_statistics, field_statistics, fields, statistical_metrics):
+    """
+    Lays out per group statistics as the get_statistics DataFrame: one row per group with
+    at least one field having statistics, the group_by values, 'total_count' and one
+    column per field and metric.
+
+    :param groups_df: One row per group with the group_by values and the 'count' of products.
+    :param has_statistics: Boolean array (groups x fields), as returned by get_group_statistics.
+    :param field_statistics: dict mapping each metric to an array (groups x fields).
+    """
+    rows_with_statistics = has_statistics.any(axis=1)
+    statistics = {group: groups_df[group].to_numpy()[rows_with_statistics] for group in groups_df.columns if group != 'count'}
+    statistics['total_count'] = groups_df['count'].to_numpy()[rows_with_statistics]
+
+    for j, field in enumerate(fields):
+        for metric in statistical_metrics:
+            statistics[f'{field}.{metric}'] = field_statistics[metric][rows_with_statistics, j]
+
+    statistics_df = pd.DataFrame(statistics) if rows_with_statistics.any() else pd.DataFrame()
+    statistics_df = statistics_df.dropna(axis=1, how='all')
+
+    calculated_fields =  [f"{field}.{metric}" for field in fields for metric in statistical_metrics]
+    calculated_field_set = set(calculated_fields)
+    name_fields = [field for field in statistics_df.columns if field not in calculated_field_set]
+    statistics_df = statistics_df.sort_values(name_fields)
+    desired_column_order = list(name_fields) + calculated_fields
+    statistics_df = statistics_df.reindex(columns=desired_column_order)
+    statistics_df.columns = [col.replace('breakdown__', '') for col in statistics_df.columns]
+    statistics_df.dropna(axis=1, how='all', inplace=True)
+    count_keys = [key for key in statistics_df.columns if key == 'total_count' or '.count' in key]
+    if count_keys:
+        # Converted as one block and put back in place, assigning them sets one column at a time
+        counts = statistics_df[count_keys].fillna(0).astype('int64')
+        columns = statistics_df.columns
+        statistics_df = pd.concat([statistics_df.drop(columns=count_keys), counts], axis=1)[columns]
+
+    return statistics_df.reset_index(drop=True)
+
+
+@profiled('groupstats.get_group_statistics', rows=lambda values, *args, **kwargs: len(values))
+def get_group_statistics(values, codes, n_groups, statistical_metrics, remove_outliers=True, method='IQR', sqrt_tranf=True, min_count=4, row_ids=None):
+    """
+    Computes the statistical metrics of every group and field at once.
+
+    :param values: 2-D float array (rows x fields) with NaN for missing values.
+    :param codes: 1-D array with the group code (0 to n_groups - 1) of each row.
+    :param n_groups: The number of groups.
+    :param statistical_metrics: The metrics to compute e.g. ['count', 'mean', 'median'].
+    :param row_ids: The id of each row reported in 'outlier_ids'. Defaults to the row position.
+    :return: tuple (has_statistics, statistics). has_statistics is a boolean array (groups x fields)
+             marking the fields with at least min_count values in a group and statistics maps each
+             metric to an array (groups x fields) with NaN where the metric is not available.
+    """
+    values = np.asarray(values, dtype=float)
+    codes = np.asarray(codes)
+    if row_ids is None:
+        row_ids = np.arange(len(values))
+
+    valid_counts = pd.DataFrame(~np.isnan(values)).groupby(codes).sum().reindex(range(n_groups), fill_value=0).to_numpy()
+    has_statistics = valid_counts >= min_count
+
+    if remove_outliers:
+        with stage('groupstats.remove_outliers', len(values)):
+            keep, rounds = get_outlier_masks(values, codes, method, sqrt_tranf)
+            outlier_ids = get_outlier_ids(rounds, codes, row_ids)
+            values = np.where(keep, values, np.nan)
+    else:
+        outlier_ids = {}
+
+    grouped = pd.DataFrame(values).groupby(codes)
+
+    def aggregate(func, *args, **kwargs):
+        return getattr(grouped, func)(*args, **kwargs).reindex(range(n_groups)).to_numpy(dtype=float)
+
+    count = aggregate('count')
+    # Fields with enough values before but not after removing outliers get empty statistics
+    is_valid = has_statistics & (count >= min_count)
+
+    metrics = {'count': count}
+    if {'mean', 'coefficient_of_variation'} & set(statistical_metrics):
+        metrics['mean'] = aggregate('mean')
+    if {'median', 'quartiles'} & set(statistical_metrics):
+        metrics['median'] = aggregate('median')
+    if {'standard_deviation', 'coefficient_of_variation'} & set(statistical_metrics):
+        metrics['standard_deviation'] = aggregate('std')
+    if {'minimum', 'range'} & set(statistical_metrics):
+        metrics['minimum'] = aggregate('min')
+    if {'maximum', 'range', 'quartiles'} & set(statistical_metrics):
+        metrics['maximum'] = aggregate('max')
+    if 'range' in statistical_metrics:
+        metrics['range'] = metrics['maximum'] - metrics['minimum']
+    if 'coefficient_of_variation' in statistical_metrics:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            metrics['coefficient_of_variation'] = np.where(metrics['mean'] != 0, metrics['standard_deviation'] / metrics['mean'], np.nan)
+
+    statistics = {}
+    for metric in statistical_metrics:
+        if metric == 'outlier_ids':
+            column = np.full((n_groups, values.shape[1]), np.nan, dtype=object)
+            for i, j in zip(*np.nonzero(has_statistics)):
+                column[i, j] = outlier_ids.get((i, j), []) if is_valid[i, j] else []
+        elif metric == 'quartiles':
+            Q1 = aggregate('quantile', 0.25)
+            Q3 = aggregate('quantile', 0.75)
+            column = np.full((n_groups, values.shape[1]), np.nan, dtype=object)
+            for i, j in zip(*np.nonzero(is_valid & ~np.isnan(Q1))):
+                column[i, j] = np.array([Q1[i, j], metrics['median'][i, j], Q3[i, j], metrics['maximum'][i, j]])
+        else:
+            column = np.where(is_valid, metrics[metric], np.nan)
+        statistics[metric] = column
+
+    return has_statistics, statistics
+
+
+def _group_statistics_worker(paths, start, stop, n_groups, kwargs):
+    arrays = load_shared_arrays(paths)
+    return get_group_statistics(arrays['values'][:, start:stop], arrays['codes'], n_groups, **kwargs)
+
+
+def get_group_statistics_parallel(values, codes, n_groups, statistical_metrics, n_jobs=None, row_ids=None, **kwargs):
+    """
+    Same as get_group_statistics but splits the fields across a pool of n_jobs processes.
+
+    The values are shared with the workers through memory-mapped files instead of being
+    pickled. Fields are independent, so the result is identical to a serial run.
+    """
+    n_jobs = get_n_jobs(n_jobs)
+    n_fields = values.shape[1]
+    kwargs['statistical_metrics'] = statistical_metrics
+    if n_jobs == 1 or n_fields < 2:
+        return get_group_statistics(values, codes, n_groups, row_ids=row_ids, **kwargs)
+
+    with SharedArrays(values=np.asfortranarray(values, dtype=float), codes=np.asarray(codes)) as shared:
+        tasks = [(shared.paths, start, stop, n_groups, kwargs) for start, stop in split_range(n_fields, n_jobs)]
+        results = run_in_pool(_group_statistics_worker, tasks, n_jobs)
+
+    has_statistics = np.concatenate([result[0] for result in results], axis=1)
+    statistics = {metric: np.concatenate([result[1][metric] for result in results], axis=1) for metric in statistical_metrics}
+
+    # Workers report outliers by row position, map them back to the row ids
+    if row_ids is not None and 'outlier_ids' in statistics:
+        row_ids = np.asarray(row_ids)
+        for ids in statistics['outlier_ids'].flat:
+            if isinstance(ids, list) and ids:
+                ids[:] = row_ids[ids].tolist()
+    return has_statistics, statistics
+
+
+def get_group_positions(codes, n_groups):
+    """
+    Returns the row positions of every group, from a single stable sort of the codes.
+
+    :param codes: 1-D array with the group code of each row (-1 for rows without a group).
+    :param n_groups: The number of groups.
+    :return: list with the (ascending) row positions of each group code.
+    """
+    codes = np.asarray(codes)
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(n_groups + 1))
+    return [order[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
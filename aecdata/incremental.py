@@ -0,0 +1,384 @@
+import math
+import numpy as np
+import pandas as pd
+from .groupstats import get_group_codes, get_group_statistics, get_statistics_df
+from .outliers import zscore_threshold, repeated_zscore_max, iqr_multiplier
+
+# Sums of squares are computed again instead of subtracting terms this many times larger
+precision_loss = 1e4
+
+
+def _quantile(get, length, q):
+    # Linear interpolation between the closest ranks, as pandas quantile. get(k) returns the
+    # k-th smallest value
+    position = q * (length - 1)
+    lower = int(np.floor(position))
+    lower_value, upper_value = get(lower), get(min(lower + 1, length - 1))
+    return lower_value + (position - lower) * (upper_value - lower_value)
+
+
+def _first(lo, hi, predicate, values):
+    # First position in [lo, hi) whose value satisfies a predicate that is monotone over [lo, hi)
+    while lo < hi:
+        middle = (lo + hi) // 2
+        if predicate(values[middle]):
+            hi = middle
+        else:
+            lo = middle + 1
+    return lo
+
+
+class SortedCell:
+    """
+    The values of one (group, field), kept sorted in a buffer with spare capacity together
+    with the uuid of each value, so a value is inserted or removed with one binary search.
+
+    The count, sum and sum of squares of the values (shifted by a constant for precision) and
+    of their square roots are kept for the negative and the positive values, so the moments
+    of any slice of the buffer are obtained by subtracting the values outside it.
+    """
+
+    def __init__(self, values, uuids):
+        capacity = len(values) + len(values) // 4 + 8
+        self.values = np.empty(capacity)
+        self.uuids = np.empty(capacity, dtype=object)
+        self.n = len(values)
+        self.values[:self.n] = values
+        self.uuids[:self.n] = uuids
+        self.shift = float(values[len(values) // 2]) if len(values) else 0.0
+        self.root_shift = np.sqrt(abs(self.shift))
+        # Rows: negative and positive values. Columns: count, sums of the shifted values and
+        # of their squares, sums of the shifted square roots and of their squares
+        self.sums = np.zeros((2, 5))
+        self.zero_moments = self._moments(np.zeros(1))
+        values = np.asarray(values, dtype=float)
+        self.sums[0] = self._moments(values[values < 0])
+        self.sums[1] = self._moments(values[values > 0])
+
+    def _moments(self, values):
+        terms = np.empty((5, len(values)))
+        terms[0] = 1
+        terms[1] = values - self.shift
+        terms[3] = np.sqrt(np.abs(values)) - self.root_shift
+        np.multiply(terms[1], terms[1], out=terms[2])
+        np.multiply(terms[3], terms[3], out=terms[4])
+        return terms.sum(axis=1)
+
+    def _grow(self, size):
+        capacity = max(size, 2 * len(self.values))
+        values, uuids = np.empty(capacity), np.empty(capacity, dtype=object)
+        values[:self.n], uuids[:self.n] = self.values[:self.n], self.uuids[:self.n]
+        self.values, self.uuids = values, uuids
+
+    def insert(self, values, uuids):
+        """Inserts values (with their uuids) at their sorted positions."""
+        if self.n + len(values) > len(self.values):
+            self._grow(self.n + len(values))
+        for value, uuid in zip(values, uuids):
+            position = self.values[:self.n].searchsorted(value, side='right')
+            self.values[position + 1:self.n + 1] = self.values[position:self.n]
+            self.uuids[position + 1:self.n + 1] = self.uuids[position:self.n]
+            self.values[position], self.uuids[position] = value, uuid
+            self.n += 1
+            if value != 0:
+                self.sums[int(value > 0)] += self._moments(np.array([value]))
+
+    def remove(self, value, uuid):
+        """Removes the value of a uuid."""
+        start = self.values[:self.n].searchsorted(value, side='left')
+        stop = self.values[:self.n].searchsorted(value, side='right')
+        position = start + np.flatnonzero(self.uuids[start:stop] == uuid)[0]
+        self.values[position:self.n - 1] = self.values[position + 1:self.n]
+        self.uuids[position:self.n - 1] = self.uuids[position + 1:self.n]
+        self.n -= 1
+        self.uuids[self.n] = None
+        if self.n == 0:
+            # Drop the rounding errors accumulated in the sums
+            self.sums[:] = 0
+        elif value != 0:
+            side = int(value > 0)
+            moments = self._moments(np.array([value]))
+            self.sums[side] -= moments
+            if moments[2] > precision_loss * self.sums[side, 2] or moments[4] > precision_loss * self.sums[side, 4]:
+                # Sum the values of the side again rather than keep the rounding error of a large value
+                side_values = self.values[:self.n]
+                self.sums[side] = self._moments(side_values[side_values > 0] if side else side_values[side_values < 0])
+
+    def _slice_moments(self, start, stop, lo, hi):
+        # Moments of the values in [start, stop), a slice of [lo, hi) where lo is 0 or the first
+        # non-negative value and hi is the end or the first positive value
+        values = self.values
+        if stop - start <= (start - lo) + (hi - stop):
+            return self._moments(values[start:stop])
+        n_zeros = values[:self.n].searchsorted(0, side='right') - values[:self.n].searchsorted(0, side='left')
+        moments = n_zeros * self.zero_moments
+        if lo == 0:
+            moments = moments + self.sums[0]
+        if hi == self.n:
+            moments = moments + self.sums[1]
+        excluded = self._moments(np.concatenate((values[lo:start], values[stop:hi])))
+        moments = moments - excluded
+        if excluded[2] > precision_loss * moments[2] or excluded[4] > precision_loss * moments[4]:
+            # Subtracting large outliers would lose too many digits of the sums of squares
+            return self._moments(values[start:stop])
+        return moments
+
+    def get_statistics(self, statistical_metrics, remove_outliers=True, method='IQR', sqrt_tranf=True, min_count=4):
+        """
+        Computes the statistics of the cell as get_group_statistics does for one group and field.
+
+        :return: tuple (has_statistics, statistics) with statistics mapping each metric to its
+                 value, or None if has_statistics is False. outlier_ids are uuids.
+        """
+        n, values = self.n, self.values
+        if n < min_count:
+            return False, None
+
+        # Values kept by the square root transformation, and the transformation as a function
+        # of the value. transform decreases with the value when the sign is flipped
+        lo, hi, sign = 0, n, 1.0
+        if remove_outliers and sqrt_tranf:
+            first_non_negative = values[:n].searchsorted(0, side='left')
+            first_positive = values[:n].searchsorted(0, side='right')
+            if first_non_negative > n / 2:
+                lo, hi, sign = 0, first_positive, -1.0
+            else:
+                lo, hi = first_non_negative, n
+            transform = lambda value: math.sqrt(sign * value)
+        else:
+            transform = lambda value: value
+
+        # The outliers are the values at both ends of [lo, hi), removed in rounds
+        start, stop = lo, hi
+        rounds = []
+        if remove_outliers and method in ('zscore', 'repeated_zscore', 'IQR'):
+            while start < stop:
+                if method == 'IQR':
+                    # k-th smallest transformed value
+                    get = (lambda k: transform(values[start + k])) if sign > 0 else (lambda k: transform(values[stop - 1 - k]))
+                    Q1, Q3 = _quantile(get, stop - start, 0.25), _quantile(get, stop - start, 0.75)
+                    IQR = Q3 - Q1
+                    low, high = Q1 - iqr_multiplier * IQR, Q3 + iqr_multiplier * IQR
+                    is_low = lambda value: transform(value) < low
+                    is_high = lambda value: transform(value) > high
+                    active = False
+                else:
+                    count, sum_, squares, root_sum, root_squares = self._slice_moments(start, stop, lo, hi)
+                    shift = self.shift
+                    if sqrt_tranf:
+                        # The transformed values are the square roots of the absolute values
+                        sum_, squares, shift = root_sum, root_squares, self.root_shift
+                    first, last = transform(values[start]), transform(values[stop - 1])
+                    if first == last or count < 2:
+                        # Equal values have no outliers, and one value has no standard deviation
+                        break
+                    mean = shift + sum_ / count
+                    std = np.sqrt(max(squares - sum_ * sum_ / count, 0) / (count - 1))
+                    zscore = lambda value: abs((transform(value) - mean) / std)
+                    is_low = lambda value: transform(value) < mean and zscore(value) > zscore_threshold
+                    is_high = lambda value: transform(value) > mean and zscore(value) > zscore_threshold
+                    active = method == 'repeated_zscore' and max(zscore(values[start]), zscore(values[stop - 1])) > repeated_zscore_max
+                if sign < 0:
+                    is_low, is_high = is_high, is_low
+                new_start = _first(start, stop, lambda value: not is_low(value), values)
+                new_stop = _first(new_start, stop, is_high, values)
+                rounds.append(np.concatenate((np.arange(start, new_start), np.arange(new_stop, stop))))
+                start, stop = new_start, new_stop
+                if not active:
+                    break
+
+        count = stop - start
+        is_valid = count >= min_count
+        statistics = {}
+        if is_valid:
+            kept = values[start:stop]
+            if kept[0] == kept[-1]:
+                mean, std = kept[0], 0.0 if count > 1 else np.nan
+            else:
+                _, sum_, squares, _, _ = self._slice_moments(start, stop, lo, hi)
+                mean = self.shift + sum_ / count
+                std = np.sqrt(max(squares - sum_ * sum_ / count, 0) / (count - 1))
+            get = kept.__getitem__
+            median = _quantile(get, count, 0.5)
+            metrics = {'count': count, 'mean': mean, 'median': median, 'standard_deviation': std,
+                       'minimum': kept[0], 'maximum': kept[-1], 'range': kept[-1] - kept[0],
+                       'coefficient_of_variation': std / mean if mean != 0 else np.nan}
+        for metric in statistical_metrics:
+            if metric == 'outlier_ids':
+                statistics[metric] = [uuid for positions in rounds for uuid in self.uuids[positions]] if is_valid else []
+            elif not is_valid:
+                statistics[metric] = np.nan
+            elif metric == 'quartiles':
+                statistics[metric] = np.array([_quantile(get, count, 0.25), median, _quantile(get, count, 0.75), kept[-1]])
+            else:
+                statistics[metric] = metrics[metric]
+        return True, statistics
+
+
+class IncrementalStatistics:
+    """
+    Keeps the result of ProductStatistics.get_statistics up to date under inserts, updates and
+    deletes of products, identified by 'unique_product_uuid_v2'.
+
+    For every group and field the values are kept in a SortedCell, so a change is applied
+    with a binary search per value and group counts are adjusted in place. The first
+    statistics are computed with the vectorized statistics kernel. After that only the cells
+    touched by a change are recomputed, from their sorted values and running sums: quantiles
+    and outlier fences are found by binary search and only the outliers are summed, so the
+    cost depends on the changes and not on the size of the groups.
+
+    outlier_ids are reported as 'unique_product_uuid_v2' values.
+    """
+
+    def __init__(self, df, group_by=None, fields=None, statistical_metrics=None, include_estimated_values=False,
+                 remove_outliers=True, method='IQR', sqrt_tranf=True, min_count=4):
+        if group_by is None:
+            group_by = ['product_type']
+        if statistical_metrics is None:
+            statistical_metrics = ['count', 'mean', 'median']
+        self.group_by = list(group_by)
+        self.fields = list(fields)
+        self.statistical_metrics = list(statistical_metrics)
+        self.include_estimated_values = include_estimated_values
+        self.options = {'remove_outliers': remove_outliers, 'method': method, 'sqrt_tranf': sqrt_tranf, 'min_count': min_count}
+
+        self.groups = []  # group_by values of each group
+        self.group_index = {}  # group_by values -> group
+        self.group_counts = np.zeros(0, dtype=np.int64)
+        self.memberships = {}  # uuid -> (groups, field positions, values)
+        self.cells = {}  # (group, field position) -> SortedCell
+        self.has_statistics = np.zeros((0, len(self.fields)), dtype=bool)
+        self.statistics = {metric: np.zeros((0, len(self.fields)), dtype=object if metric in ('quartiles', 'outlier_ids') else float)
+                           for metric in self.statistical_metrics}
+        self.dirty = set()  # Cells changed since the last get_statistics
+
+        self._insert(df)
+        self._compute_all()
+
+    def _get_groups(self, keys):
+        groups = []
+        for key in keys:
+            if key not in self.group_index:
+                self.group_index[key] = len(self.groups)
+                self.groups.append(key)
+            groups.append(self.group_index[key])
+
+        n_new = len(self.groups) - len(self.group_counts)
+        if n_new:
+            self.group_counts = np.concatenate((self.group_counts, np.zeros(n_new, dtype=np.int64)))
+            self.has_statistics = np.vstack((self.has_statistics, np.zeros((n_new, len(self.fields)), dtype=bool)))
+            for metric, array in self.statistics.items():
+                self.statistics[metric] = np.vstack((array, np.full((n_new, len(self.fields)), np.nan, dtype=array.dtype)))
+        return np.array(groups, dtype=np.int64)
+
+    def _insert(self, df):
+        if not self.include_estimated_values:
+            df = df[df['estimated'] == False]
+        if not len(df):
+            return
+
+        positions, codes, groups_df = get_group_codes(df, self.group_by)
+        groups = self._get_groups(groups_df[self.group_by].itertuples(index=False, name=None))[codes]
+        values = df.reindex(columns=self.fields).to_numpy(dtype=float)
+        uuids = df['unique_product_uuid_v2'].to_numpy()
+
+        np.add.at(self.group_counts, groups, 1)
+
+        # Memberships of each product, to find its values again when it changes
+        order = np.argsort(positions, kind='stable')
+        bounds = np.searchsorted(positions[order], np.arange(len(df) + 1))
+        for row, uuid in enumerate(uuids):
+            fields = np.flatnonzero(~np.isnan(values[row]))
+            self.memberships[uuid] = (groups[order[bounds[row]:bounds[row + 1]]], fields, values[row, fields])
+
+        # Add the (group, field, value) triples to the sorted cells, grouped by cell
+        exploded = values[positions]
+        rows, fields = np.nonzero(~np.isnan(exploded))
+        cell_groups, cell_values, cell_uuids = groups[rows], exploded[rows, fields], uuids[positions][rows]
+        order = np.lexsort((cell_values, fields, cell_groups))
+        cell_groups, fields, cell_values, cell_uuids = cell_groups[order], fields[order], cell_values[order], cell_uuids[order]
+        boundaries = np.flatnonzero((cell_groups[1:] != cell_groups[:-1]) | (fields[1:] != fields[:-1])) + 1
+        for start, stop in zip(np.concatenate(([0], boundaries)), np.concatenate((boundaries, [len(order)]))):
+            cell = (int(cell_groups[start]), int(fields[start]))
+            self.dirty.add(cell)
+            if cell in self.cells:
+                self.cells[cell].insert(cell_values[start:stop], cell_uuids[start:stop])
+            else:
+                self.cells[cell] = SortedCell(cell_values[start:stop], cell_uuids[start:stop])
+
+    def _delete(self, uuids):
+        for uuid in uuids:
+            membership = self.memberships.pop(uuid, None)
+            if membership is None:
+                continue
+            groups, fields, values = membership
+            self.group_counts[groups] -= 1
+            for group in groups.tolist():
+                for field, value in zip(fields.tolist(), values.tolist()):
+                    self.cells[(group, field)].remove(value, uuid)
+                    self.dirty.add((group, field))
+
+    def apply_changes(self, df=None, deleted_uuids=None):
+        """
+        Applies changes to the tracked products.
+
+        :param df: DataFrame of new or updated products, in the ProductStatistics format.
+        :param deleted_uuids: The 'unique_product_uuid_v2' of the deleted products.
+        """
+        changed_uuids = list(deleted_uuids or [])
+        if df is not None:
+            changed_uuids += df['unique_product_uuid_v2'].tolist()
+        self._delete(changed_uuids)
+        if df is not None:
+            self._insert(df)
+
+    def _compute_all(self):
+        self.dirty = set()
+        groups = np.arange(len(self.groups))
+        if not len(groups):
+            return
+
+        # Stack the sorted values of each group as a (values x fields) block, the statistics
+        # of a field do not depend on how its values line up with the other fields
+        n_fields = len(self.fields)
+        lengths = np.zeros((len(groups), n_fields), dtype=np.int64)
+        for (group, j), cell in self.cells.items():
+            lengths[group, j] = cell.n
+        heights = lengths.max(axis=1, initial=0)
+        offsets = np.concatenate(([0], np.cumsum(heights)))
+        values = np.full((offsets[-1], n_fields), np.nan)
+        uuids = np.full((offsets[-1], n_fields), None, dtype=object)
+        for (group, j), cell in self.cells.items():
+            values[offsets[group]:offsets[group] + cell.n, j] = cell.values[:cell.n]
+            uuids[offsets[group]:offsets[group] + cell.n, j] = cell.uuids[:cell.n]
+        codes = np.repeat(groups, heights)
+
+        has_statistics, statistics = get_group_statistics(values, codes, len(groups), self.statistical_metrics, **self.options)
+        if 'outlier_ids' in statistics:
+            for (i, j), ids in np.ndenumerate(statistics['outlier_ids']):
+                if isinstance(ids, list) and ids:
+                    statistics['outlier_ids'][i, j] = uuids[ids, j].tolist()
+
+        self.has_statistics[:] = has_statistics
+        for metric in self.statistical_metrics:
+            self.statistics[metric][:] = statistics[metric]
+
+    def _refresh(self):
+        for group, j in self.dirty:
+            has_statistics, statistics = self.cells[(group, j)].get_statistics(self.statistical_metrics, **self.options)
+            self.has_statistics[group, j] = has_statistics
+            for metric in self.statistical_metrics:
+                self.statistics[metric][group, j] = statistics[metric] if has_statistics else np.nan
+        self.dirty = set()
+
+    def get_statistics(self):
+        """
+        Recomputes the cells changed since the last call and returns the statistics in the
+        layout of ProductStatistics.get_statistics.
+        """
+        self._refresh()
+        valid = np.flatnonzero(self.group_counts >= self.options['min_count'])
+        groups_df = pd.DataFrame([self.groups[group] for group in valid], columns=self.group_by)
+        groups_df['count'] = self.group_counts[valid]
+        statistics = {metric: array[valid] for metric, array in self.statistics.items()}
+        return get_statistics_df(groups_df, self.has_statistics[valid], statistics, self.fields, self.statistical_metrics)
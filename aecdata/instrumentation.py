@@ -0,0 +1,231 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the buckets of the latency and decode time histograms
+histogram_buckets = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, float('inf')]
+
+# Size in bytes of the chunks read from streamed responses
+stream_chunk_size = 2 ** 16
+
+
+class Instrumentation:
+    """
+    Sends events about the requests to the API to hooks, shared by User and Authenticator.
+
+    Hooks are callables receiving an event dict with an 'event' key:
+
+    - 'request_start': endpoint, method, url, page and timestamp.
+    - 'request_end': the same, plus status (None if no response), bytes, latency and
+      decode_time in seconds, retries, token_refreshes and error.
+    - 'token_refresh': timestamp, success and error.
+    """
+
+    def __init__(self, hooks=None):
+        self.hooks = list(hooks or [])
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def emit(self, event):
+        for hook in self.hooks:
+            try:
+                hook(event)
+            except Exception:
+                # A failing hook must not break the requests
+                logger.exception('Instrumentation hook %r failed.', hook)
+
+    def request(self, method, url, endpoint, page=None, retries=0, token_refreshes=0, decode=None, **kwargs):
+        """
+        Sends a request with requests, emitting its events, and decodes its JSON body if the
+        status is successful.
+
+        :param endpoint: The name of the endpoint, e.g. 'get_products'.
+        :param page: The page requested, if any.
+        :param retries: The number of previous attempts of the request, reported in the events.
+        :param token_refreshes: The number of token refreshes for the request, reported in the events.
+        :param decode: Optional function decoding the body from an iterable of chunks of bytes
+                       instead of response.json(). The body is then streamed and never held
+                       whole, and the decode time includes reading it.
+        :return: tuple (response, data) with data None if the status is an error.
+        :raises requests.RequestException: If no response is received.
+        """
+        if decode is not None:
+            kwargs['stream'] = True
+        event = {'endpoint': endpoint, 'method': method, 'url': url, 'page': page}
+        if self.hooks:
+            self.emit({'event': 'request_start', 'timestamp': time.time(), **event})
+        start = time.perf_counter()
+        try:
+            response = requests.request(method, url, **kwargs)
+        except requests.RequestException as e:
+            if self.hooks:
+                self.emit({'event': 'request_end', 'timestamp': time.time(), **event, 'status': None, 'bytes': 0,
+                           'latency': time.perf_counter() - start, 'decode_time': 0.0, 'retries': retries,
+                           'token_refreshes': token_refreshes, 'error': str(e)})
+            raise
+        latency = time.perf_counter() - start
+
+        data, decode_time, error = None, 0.0, None
+        if response.ok:
+            start = time.perf_counter()
+            chunks = None
+            try:
+                if decode is None:
+                    data = response.json()
+                else:
+                    chunks = CountedChunks(response.iter_content(stream_chunk_size))
+                    data = decode(chunks)
+            except ValueError as e:
+                error = f'Invalid JSON: {e}'
+                raise
+            except Exception as e:
+                error = f'{type(e).__name__}: {e}'
+                raise
+            finally:
+                decode_time = time.perf_counter() - start
+                if chunks is not None:
+                    response.close()
+                if self.hooks:
+                    n_bytes = chunks.bytes if chunks is not None else len(response.content)
+                    self.emit_end(event, response, n_bytes, latency, decode_time, retries, token_refreshes, error)
+        else:
+            # Reading the body of a streamed response releases its connection, whatever the hooks
+            n_bytes = len(response.content)
+            if decode is not None:
+                response.close()
+            if self.hooks:
+                self.emit_end(event, response, n_bytes, latency, decode_time, retries, token_refreshes, response.reason)
+        return response, data
+
+    def emit_end(self, event, response, n_bytes, latency, decode_time, retries, token_refreshes, error):
+        self.emit({'event': 'request_end', 'timestamp': time.time(), **event, 'status': response.status_code,
+                   'bytes': n_bytes, 'latency': latency, 'decode_time': decode_time,
+                   'retries': retries, 'token_refreshes': token_refreshes, 'error': error})
+
+
+class CountedChunks:
+    """Iterates over chunks of bytes, counting them."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.bytes = 0
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            self.bytes += len(chunk)
+            yield chunk
+
+
+class MetricsCollector:
+    """
+    Hook collecting metrics of the requests: counts per endpoint and status, bytes, throughput,
+    latency and decode time histograms, retries and token refreshes.
+
+        collector = MetricsCollector()
+        user = User(developer_token, hooks=[collector])
+        user.get_products(product_type=2)
+        print(collector.summary())
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.errors = 0
+            self.bytes = 0
+            self.retries = 0
+            self.token_refreshes = 0
+            self.endpoints = {}
+            self.statuses = {}
+            self.latencies = []
+            self.decode_times = []
+            self.first_start = None
+            self.last_end = None
+
+    def __call__(self, event):
+        with self.lock:
+            if event['event'] == 'request_start':
+                if self.first_start is None:
+                    self.first_start = event['timestamp']
+            elif event['event'] == 'request_end':
+                self.requests += 1
+                self.last_end = event['timestamp']
+                self.bytes += event['bytes']
+                self.retries += event['retries'] > 0
+                self.endpoints[event['endpoint']] = self.endpoints.get(event['endpoint'], 0) + 1
+                self.statuses[event['status']] = self.statuses.get(event['status'], 0) + 1
+                if event['status'] is None or event['status'] >= 400:
+                    self.errors += 1
+                self.latencies.append(event['latency'])
+                self.decode_times.append(event['decode_time'])
+            elif event['event'] == 'token_refresh':
+                self.token_refreshes += 1
+
+    @staticmethod
+    def get_distribution(values):
+        """Returns the count, mean, percentiles and histogram of durations in seconds."""
+        if not values:
+            return {'count': 0}
+        values = sorted(values)
+
+        def percentile(q):
+            return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+        counts = [0] * len(histogram_buckets)
+        for value in values:
+            counts[bisect_left(histogram_buckets, value)] += 1
+        return {
+            'count': len(values),
+            'mean': sum(values) / len(values),
+            'p50': percentile(50),
+            'p90': percentile(90),
+            'p99': percentile(99),
+            'max': values[-1],
+            'histogram': dict(zip(histogram_buckets, counts)),
+        }
+
+    def report(self):
+        """Returns a dict with the metrics collected."""
+        with self.lock:
+            seconds = self.last_end - self.first_start if self.first_start is not None and self.last_end is not None else 0
+            return {
+                'requests': self.requests,
+                'errors': self.errors,
+                'retried_requests': self.retries,
+                'token_refreshes': self.token_refreshes,
+                'bytes': self.bytes,
+                'seconds': seconds,
+                'requests_per_second': self.requests / seconds if seconds else None,
+                'bytes_per_second': self.bytes / seconds if seconds else None,
+                'endpoints': dict(self.endpoints),
+                'statuses': dict(self.statuses),
+                'latency': self.get_distribution(self.latencies),
+                'decode_time': self.get_distribution(self.decode_times),
+            }
+
+    def summary(self):
+        """Returns the metrics as text."""
+        report = self.report()
+        lines = [f"{report['requests']} requests ({report['errors']} errors, {report['retried_requests']} retried, "
+                 f"{report['token_refreshes']} token refreshes), {report['bytes'] / 2 ** 20:.2f} MiB in {report['seconds']:.2f} s"]
+        if report['seconds']:
+            lines.append(f"{report['requests_per_second']:.2f} requests/s, {report['bytes_per_second'] / 2 ** 20:.2f} MiB/s")
+        for name in ('latency', 'decode_time'):
+            distribution = report[name]
+            if distribution['count']:
+                lines.append(f"{name}: mean {distribution['mean'] * 1000:.1f} ms, p50 {distribution['p50'] * 1000:.1f} ms, "
+                             f"p90 {distribution['p90'] * 1000:.1f} ms, p99 {distribution['p99'] * 1000:.1f} ms")
+                lines.extend(f'  <= {bound:g} s: {count}' for bound, count in distribution['histogram'].items() if count)
+        return '\n'.join(lines)
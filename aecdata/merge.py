@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+
+
+def get_missing_column(dtype, length, compact):
+    """Returns the values of a column absent from a DataFrame, with the dtype of the column elsewhere."""
+    if not compact:
+        return np.full(length, None, dtype=object)
+    if isinstance(dtype, pd.CategoricalDtype):
+        return pd.Categorical(np.full(length, np.nan), dtype=dtype)
+    if dtype.kind == 'f':
+        return np.full(length, np.nan, dtype=dtype)
+    return np.full(length, None, dtype=object)
+
+
+def align_frames(frames, compact=False):
+    """
+    Gives DataFrames the same columns, in the order in which they first appear, without
+    changing the dtypes of the columns they share. The missing columns are added with None,
+    or for compacted frames with NaN if the column is float or Categorical elsewhere, and
+    Categorical columns get the union of the categories so that they stay Categorical once
+    concatenated.
+
+    :param compact: Whether the frames are compacted (see compact_dataframe).
+    :return: list of the aligned DataFrames.
+    """
+    dtypes = {}
+    for df in frames:
+        for column, dtype in df.dtypes.items():
+            dtypes.setdefault(column, []).append(dtype)
+    columns = list(dtypes)
+
+    categories = {}
+    for column, column_dtypes in dtypes.items():
+        if any(isinstance(dtype, pd.CategoricalDtype) for dtype in column_dtypes):
+            values = {}
+            for df in frames:
+                if column in df.columns:
+                    series = df[column]
+                    uniques = series.cat.categories if isinstance(series.dtype, pd.CategoricalDtype) else series.dropna().unique()
+                    values.update(dict.fromkeys(uniques))
+            categories[column] = pd.CategoricalDtype(list(values))
+
+    aligned = []
+    for df in frames:
+        data = {}
+        for column in columns:
+            if column in df.columns:
+                series = df[column]
+                data[column] = series.astype(categories[column]) if column in categories else series
+            else:
+                dtype = categories.get(column, dtypes[column][0])
+                data[column] = get_missing_column(dtype, len(df), compact)
+        aligned.append(pd.DataFrame(data, index=df.index))
+    return aligned
+
+
+def get_latest_positions(df, key='unique_product_uuid_v2', updated='updated'):
+    """
+    Returns the sorted positions of the rows to keep when deduplicating on key: the row most
+    recently updated of every key, the last one on ties. Rows without key are all kept.
+    """
+    if key not in df.columns:
+        return np.arange(len(df))
+    keys = df[key].to_numpy(dtype=object)
+    if updated in df.columns:
+        dates = pd.to_datetime(pd.Series(df[updated].to_numpy(dtype=object)), errors='coerce', utc=True, format='ISO8601')
+        # Rows without date lose against any dated row
+        dates = dates.to_numpy(dtype='datetime64[ns]').view(np.int64)
+    else:
+        dates = np.zeros(len(df), dtype=np.int64)
+    codes, _ = pd.factorize(keys, use_na_sentinel=True)
+    # Sorted by key, then date, then position, the last row of every key is kept
+    order = np.lexsort((np.arange(len(df)), dates, codes))
+    sorted_codes = codes[order]
+    last = np.ones(len(order), dtype=bool)
+    last[:-1] = sorted_codes[:-1] != sorted_codes[1:]
+    last |= sorted_codes == -1
+    return np.sort(order[last])
+
+
+def merge_frames(frames, compact=False):
+    """
+    Concatenates DataFrames of products and keeps the latest row of every product.
+
+    :param frames: The DataFrames, later frames win ties on 'updated'.
+    :param compact: Whether the frames are all compacted (see compact_dataframe).
+    :return: tuple (DataFrame, positions of its rows in the concatenation of the frames).
+    """
+    combined = pd.concat(align_frames(frames, compact), ignore_index=True)
+    positions = get_latest_positions(combined)
+    if len(positions) < len(combined):
+        combined = combined.iloc[positions].reset_index(drop=True)
+    return combined, positions
+
+
+class RowChanges:
+    """
+    Records inserts, updates and deletes of the rows of a DataFrame, matched by
+    'unique_product_uuid_v2', as appended frames and tombstoned row positions. Recording a
+    change costs the size of the change, the DataFrame is rebuilt once for all the recorded
+    changes by apply.
+    """
+
+    def __init__(self, df, key='unique_product_uuid_v2'):
+        self.key = key
+        self.n_base = len(df)
+        self.n_rows = len(df)
+        # Hash index of the keys of df, built once, and positions of the keys of the appended rows
+        self.base_keys = pd.Index(df[key].to_numpy(dtype=object) if key in df.columns else np.full(len(df), None, dtype=object))
+        self.appended_positions = {}
+        self.next_label = df.index.max() + 1 if len(df) else 0
+        self.frames = []
+        self.tombstones = []
+
+    def record(self, df, removed_keys):
+        """
+        Tombstones the rows of removed_keys and appends the rows of df, with index labels after
+        the existing ones.
+        """
+        removed_keys = list(removed_keys)
+        if removed_keys:
+            positions, _ = self.base_keys.get_indexer_non_unique(removed_keys)
+            self.tombstones.extend(positions[positions >= 0].tolist())
+            for key in removed_keys:
+                self.tombstones.extend(self.appended_positions.pop(key, ()))
+        if not len(df):
+            return
+        df = df.set_axis(range(self.next_label, self.next_label + len(df)))
+        keys = df[self.key] if self.key in df.columns else [None] * len(df)
+        for position, key in enumerate(keys, self.n_rows):
+            if key is not None and key == key:
+                self.appended_positions.setdefault(key, []).append(position)
+        self.next_label += len(df)
+        self.n_rows += len(df)
+        self.frames.append(df)
+
+    def apply(self, df):
+        """
+        Rebuilds the DataFrame with the recorded changes.
+
+        :param df: The DataFrame the changes were recorded against.
+        :return: tuple (DataFrame, keep, appended). keep is the boolean mask of the rows of df
+                 followed by the appended rows that are kept, appended the concatenation of the
+                 appended rows.
+        """
+        appended = pd.concat(self.frames) if self.frames else df.iloc[:0]
+        keep = np.ones(self.n_rows, dtype=bool)
+        keep[self.tombstones] = False
+        combined = pd.concat([df, appended]) if len(appended) else df
+        if not keep.all():
+            combined = combined[keep]
+        return combined, keep, appended
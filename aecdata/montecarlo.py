@@ -0,0 +1,79 @@
+import numpy as np
+
+# Maximum number of values drawn at once, the samples are drawn in blocks of this size
+max_block_size = 2 ** 23
+# The impacts are drawn in single precision, which halves the memory traffic of the blocks
+sample_dtype = np.float32
+
+
+def get_lognormal_parameters(mean, standard_deviation):
+    """
+    Parameters (mu, sigma) of the lognormal distributions with the given mean and standard
+    deviation. They are NaN where the mean is not positive.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sigma = np.sqrt(np.log1p((standard_deviation / mean) ** 2))
+        mu = np.log(mean) - sigma ** 2 / 2
+    return mu, sigma
+
+
+def sample_totals(quantities, n_samples, distribution='quartiles', mean=None, standard_deviation=None,
+                  quantiles=None, fixed_total=0, seed=None):
+    """
+    Draws samples of the total impact of lines whose impact per unit is uncertain.
+
+    The impact per unit of every line is drawn independently from its distribution and the
+    total of a sample is fixed_total + sum(quantities * impacts). All the lines of a block of
+    samples are drawn as one array.
+
+    :param quantities: 1-D array with the quantity of each line.
+    :param n_samples: The number of samples.
+    :param distribution: 'normal', 'lognormal' (normal for the lines with a non-positive mean)
+                         or 'quartiles' (piecewise linear between the quantiles).
+    :param mean: 1-D array with the mean of each line, for 'normal' and 'lognormal'.
+    :param standard_deviation: 1-D array with the standard deviation of each line, for 'normal' and 'lognormal'.
+    :param quantiles: 2-D array (lines x 5) with the minimum, Q1, median, Q3 and maximum of each line, for 'quartiles'.
+    :param fixed_total: The total of the lines without uncertainty.
+    :param seed: Seed of the random generator, for reproducible samples.
+    :return: 1-D array with the total of every sample.
+    """
+    quantities = np.asarray(quantities, dtype=sample_dtype)
+    n_lines = len(quantities)
+    rng = np.random.default_rng(seed)
+    totals = np.full(n_samples, fixed_total, dtype=float)
+    if not n_lines:
+        return totals
+
+    if distribution in ('normal', 'lognormal'):
+        mean = np.asarray(mean, dtype=float)
+        standard_deviation = np.nan_to_num(np.asarray(standard_deviation, dtype=float))
+        if distribution == 'lognormal':
+            mu, sigma = get_lognormal_parameters(mean, standard_deviation)
+            is_lognormal = ~np.isnan(mu)
+            mu, sigma = np.where(is_lognormal, mu, 0).astype(sample_dtype), np.where(is_lognormal, sigma, 0).astype(sample_dtype)
+        mean, standard_deviation = mean.astype(sample_dtype), standard_deviation.astype(sample_dtype)
+    elif distribution == 'quartiles':
+        # Start and slope of the 4 segments of every line, flattened for a single lookup
+        quantiles = np.asarray(quantiles, dtype=float)
+        starts = quantiles[:, :4].astype(sample_dtype).ravel()
+        steps = np.diff(quantiles, axis=1).astype(sample_dtype).ravel()
+    else:
+        raise ValueError(f'Unknown distribution "{distribution}". Use "normal", "lognormal" or "quartiles".')
+
+    line_offsets = np.arange(n_lines, dtype=np.int32) * 4
+    block_size = max(1, max_block_size // n_lines)
+    for start in range(0, n_samples, block_size):
+        size = min(block_size, n_samples - start)
+        if distribution == 'quartiles':
+            # Inverse of the piecewise linear distribution function through the quantiles
+            u = rng.random((size, n_lines), dtype=sample_dtype) * 4
+            segments = np.minimum(u.astype(np.int32), 3)
+            lookup = segments + line_offsets
+            impacts = starts[lookup] + (u - segments) * steps[lookup]
+        else:
+            z = rng.standard_normal((size, n_lines), dtype=sample_dtype)
+            impacts = mean + standard_deviation * z
+            if distribution == 'lognormal':
+                impacts = np.where(is_lognormal, np.exp(mu + sigma * z), impacts)
+        totals[start:start + size] += impacts @ quantities
+    return totals
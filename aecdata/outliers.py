@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+
+# z-score above which a value is considered an outlier (95% confidence)
+zscore_threshold = 1.96
+# repeated_zscore keeps removing outliers until the largest z-score is below this value
+repeated_zscore_max = 6
+iqr_multiplier = 1.5
+
+
+def _group_transform(values, groups, func, *args, **kwargs):
+    # Broadcast a per group and per field aggregate back to the shape of values
+    return pd.DataFrame(values).groupby(groups).transform(func, *args, **kwargs).to_numpy(dtype=float)
+
+
+def _zscores(values, groups):
+    mean = _group_transform(values, groups, 'mean')
+    std = _group_transform(values, groups, 'std')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.abs((values - mean) / std)
+
+
+def sqrt_transform(values, groups):
+    """
+    Applies the square root transformation to every group and field at once.
+
+    When the majority of the values of a field within a group is negative, the sign is
+    flipped so the transformation can be applied. Values that are still negative are
+    discarded (set to NaN).
+
+    :param values: 2-D float array (rows x fields) with NaN for missing values.
+    :param groups: 1-D array with the group code of each row.
+    :return: 2-D float array with the transformed values.
+    """
+    negatives = _group_transform(values < 0, groups, 'sum')
+    counts = _group_transform(~np.isnan(values), groups, 'sum')
+    signs = np.where(negatives > counts / 2, -1.0, 1.0)
+    flipped = values * signs
+    with np.errstate(invalid='ignore'):
+        return np.sqrt(np.where(flipped >= 0, flipped, np.nan))
+
+
+def get_outlier_masks(values, groups, method='IQR', sqrt_tranf=True):
+    """
+    Detects outliers for every group and field at once.
+
+    :param values: 2-D float array (rows x fields) with NaN for missing values.
+    :param groups: 1-D array with the group code of each row. A row can be repeated
+                   with different group codes when it belongs to several groups.
+    :param method: 'IQR', 'zscore' or 'repeated_zscore'.
+    :param sqrt_tranf: Whether to apply the square root transformation before detecting outliers.
+    :return: tuple (keep, rounds). keep is a boolean mask of the values to retain and rounds
+             holds, for every outlier, the iteration in which it was removed (0 otherwise).
+    """
+    values = np.asarray(values, dtype=float)
+    groups = np.asarray(groups)
+    if values.ndim == 1:
+        values = values.reshape(-1, 1)
+
+    if sqrt_tranf:
+        values = sqrt_transform(values, groups)
+
+    keep = ~np.isnan(values)
+    rounds = np.zeros(values.shape, dtype=np.int32)
+
+    if method == 'zscore':
+        outlier_mask = _zscores(values, groups) > zscore_threshold
+        rounds[outlier_mask] = 1
+        keep &= ~outlier_mask
+
+    elif method == 'repeated_zscore':
+        # Fields of groups whose largest z-score is still above repeated_zscore_max
+        active = np.ones(values.shape, dtype=bool)
+        iteration = 0
+        while active.any():
+            iteration += 1
+            z_scores = _zscores(np.where(keep, values, np.nan), groups)
+            outlier_mask = active & (z_scores > zscore_threshold)
+            rounds[outlier_mask] = iteration
+            keep &= ~outlier_mask
+            with np.errstate(invalid='ignore'):
+                active &= _group_transform(z_scores, groups, 'max') > repeated_zscore_max
+
+    elif method == 'IQR':
+        Q1 = _group_transform(values, groups, 'quantile', q=0.25)
+        Q3 = _group_transform(values, groups, 'quantile', q=0.75)
+        IQR = Q3 - Q1
+        with np.errstate(invalid='ignore'):
+            outlier_mask = keep & ~((values >= Q1 - iqr_multiplier * IQR) & (values <= Q3 + iqr_multiplier * IQR))
+        rounds[outlier_mask] = 1
+        keep &= ~outlier_mask
+
+    return keep, rounds
+
+
+def get_outlier_ids(rounds, groups, index):
+    """
+    Collects the ids of the outliers of every group and field.
+
+    :param rounds: The removal rounds returned by get_outlier_masks.
+    :param groups: 1-D array with the group code of each row.
+    :param index: The id (e.g. DataFrame index label) of each row.
+    :return: dict mapping (group, field position) to the list of outlier ids in order of removal.
+    """
+    groups = np.asarray(groups)
+    index = np.asarray(index)
+    rows, cols = np.nonzero(rounds)
+    if not len(rows):
+        return {}
+
+    order = np.lexsort((rows, rounds[rows, cols], cols, groups[rows]))
+    rows, cols = rows[order], cols[order]
+    row_groups = groups[rows]
+    boundaries = np.flatnonzero((row_groups[1:] != row_groups[:-1]) | (cols[1:] != cols[:-1])) + 1
+    starts = np.concatenate(([0], boundaries))
+    ids = np.split(index[rows], boundaries)
+    return {(row_groups[s], int(cols[s])): i.tolist() for s, i in zip(starts, ids)}
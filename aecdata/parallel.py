@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+
+def get_n_jobs(n_jobs):
+    """
+    Resolves the number of processes to use.
+
+    :param n_jobs: None or 1 to run serially, a positive number of processes, or a negative
+                   number to count back from the number of CPUs (-1 uses all of them).
+    :return: The number of processes (at least 1).
+    """
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        n_jobs = (os.cpu_count() or 1) + 1 + n_jobs
+    return max(1, n_jobs)
+
+
+def split_range(n, n_jobs):
+    """
+    Splits range(n) into contiguous (start, stop) chunks, a few per process so that
+    uneven chunks are balanced across the pool.
+    """
+    n_chunks = max(1, min(n, 4 * n_jobs))
+    bounds = np.linspace(0, n, n_chunks + 1).astype(int)
+    return [(int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+
+def run_in_pool(func, tasks, n_jobs):
+    """
+    Runs func(*task) for every task across a pool of n_jobs processes.
+
+    :return: The results in the order of the tasks.
+    """
+    with ProcessPoolExecutor(max_workers=min(n_jobs, len(tasks))) as executor:
+        futures = [executor.submit(func, *task) for task in tasks]
+        return [future.result() for future in futures]
+
+
+class SharedArrays:
+    """
+    Writes numerical arrays to memory-mapped .npy files in a temporary directory, so worker
+    processes can read them through the page cache instead of receiving pickled copies.
+    The files are removed when the context exits.
+
+    Usage:
+        with SharedArrays(values=values) as shared:
+            run_in_pool(worker, [(shared.paths, ...)], n_jobs)
+    """
+
+    def __init__(self, **arrays):
+        self.directory = tempfile.mkdtemp(prefix='aecdata_')
+        self.paths = {}
+        try:
+            for name, array in arrays.items():
+                path = os.path.join(self.directory, f'{name}.npy')
+                buffer = np.lib.format.open_memmap(path, mode='w+', dtype=array.dtype, shape=array.shape,
+                                                   fortran_order=array.flags.f_contiguous and not array.flags.c_contiguous)
+                buffer[...] = array
+                buffer.flush()
+                del buffer
+                self.paths[name] = path
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def load_shared_arrays(paths):
+    """
+    Attaches read-only to the arrays written by SharedArrays.
+
+    :param paths: The paths attribute of a SharedArrays instance.
+    :return: dict mapping each name to a read-only memory-mapped array.
+    """
+    return {name: np.load(path, mmap_mode='r') for name, path in paths.items()}
@@ -0,0 +1,122 @@
+from datetime import date, datetime, timedelta
+from .query import parse_condition
+
+# Columns of the products filtered by the API with the ids of their labels, and the name of
+# the API filter
+label_filters = {
+    'product_type': 'product_type',
+    'product_type_family': 'product_type_family',
+    'material_type': 'material_types',
+    'material_type_family': 'material_types_family',
+    'company': 'company',
+    'building_applications': 'building_applications',
+    'building_types': 'building_types',
+    'country': 'manufacturing_country',
+    'manufacturing_continent': 'continent',
+}
+
+# Columns filtered by the API with the values themselves
+value_filters = {
+    'unique_product_uuid_v2': 'unique_product_uuid_v2',
+    'product_url': 'product_url',
+}
+
+# API filters available with openapi=True
+open_api_filters = {'product_type', 'material_types', 'company', 'manufacturing_country', 'continent'}
+
+
+def to_date(value):
+    """Returns the date of a date, datetime or ISO formatted text, or None."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.fromisoformat(str(value)[:10]).date()
+    except ValueError:
+        return None
+
+
+class FilterPlan:
+    """
+    Splits the conditions on the products (as for ProductData.query) into the filters of the
+    get_products query and the conditions applied locally to the downloaded products.
+
+    Conditions on labelled columns (product_type, company, manufacturing_continent...) are
+    translated to the ids of the API filters (ignoring case) and are not applied again. Conditions on
+    'updated' are sent as updated_after/updated_before/updated_between one day wider, as
+    the API compares dates, and are also applied locally.
+    """
+
+    def __init__(self, conditions, filter_index, openapi=False):
+        """
+        :param conditions: dict mapping columns to conditions, see ProductData.query.
+        :param filter_index: The FilterIndex of the filters, see User.get_filter_index.
+        :param openapi: Whether the query is made to the Open API, which supports fewer filters.
+        """
+        self.conditions = dict(conditions)
+        self.api_filters = {}
+        self.local_conditions = {}
+        # Column -> (API filters, whether the condition is also applied locally)
+        self.pushed = {}
+
+        for column, condition in self.conditions.items():
+            filters = self.get_api_filters(column, condition, filter_index)
+            if filters is not None and openapi:
+                filters = filters if all(key in open_api_filters for key in filters) else None
+            if filters is None or any(key in self.api_filters for key in filters):
+                self.local_conditions[column] = condition
+                continue
+            self.api_filters.update(filters)
+            exact = column in label_filters or column in value_filters
+            self.pushed[column] = (filters, not exact)
+            if not exact:
+                self.local_conditions[column] = condition
+
+    @staticmethod
+    def get_api_filters(column, condition, filter_index):
+        """Returns the API filters for a condition, or None if the API can not apply it."""
+        operator, arguments = parse_condition(condition)
+
+        if column in label_filters or column in value_filters:
+            if operator not in ('==', 'in'):
+                return None
+            values = arguments[0] if operator == 'in' else [arguments[0]]
+            if not values:
+                return None
+            if column in value_filters:
+                key, ids = value_filters[column], list(values)
+            else:
+                key = label_filters[column]
+                ids = [filter_index.get_id(key, value) for value in values]
+                if any(identifier is None for identifier in ids):
+                    return None
+            return {key: ids if len(ids) > 1 else ids[0]}
+
+        if column == 'updated':
+            dates = [to_date(argument) for argument in arguments]
+            if not dates or any(d is None for d in dates):
+                return None
+            day = timedelta(days=1)
+            if operator in ('>', '>='):
+                return {'updated_after': (dates[0] - day).isoformat()}
+            if operator in ('<', '<='):
+                return {'updated_before': (dates[0] + day).isoformat()}
+            if operator in ('==', 'between'):
+                return {'updated_between': f'{(dates[0] - day).isoformat()},{(dates[-1] + day).isoformat()}'}
+        return None
+
+    def explain(self):
+        """Returns a text describing where each condition is applied."""
+        lines = []
+        for column, condition in self.conditions.items():
+            if column in self.pushed:
+                filters, local = self.pushed[column]
+                api = ', '.join(f'{key}={value}' for key, value in filters.items())
+                lines.append(f'{column}: {condition!r} -> API ({api})' + (' and local' if local else ''))
+            else:
+                lines.append(f'{column}: {condition!r} -> local')
+        return '\n'.join(lines)
+
+    def __repr__(self):
+        return f'FilterPlan(api_filters={self.api_filters}, local_conditions={self.local_conditions})'
@@ -2,17 +2,50 @@ import pandas as pd
 import numpy as np
 import json
 import warnings
-from itertools import product
+import weakref
+from itertools import product, compress
 from datetime import datetime
 from .utils import *
+from .outliers import get_outlier_masks
+from .groupstats import get_group_codes, get_group_statistics, get_group_statistics_parallel, get_group_positions, get_statistics_df
+from .sketches import StatisticsSketch
+from .incremental import IncrementalStatistics
+from .cache import ResultCache, memoized, get_dataframe_fingerprint
+from .compact import compact_dataframe, expand_dataframe
+from .merge import merge_frames, get_latest_positions, RowChanges
+from .snapshot import write_snapshot, read_snapshot
+from .tensor import LCATensor
+from .montecarlo import sample_totals
+from .search import AlternativesIndex
+from .textsearch import TextIndex
+from .query import ColumnIndex, query_positions
+from .profiling import stage, profiled
 
 # Ensure all instances of this specific warning are always shown
 warnings.simplefilter('always', UserWarning)
 
+def add_scaling_factor(product):
+    # Ensure 'material_facts' exists and proceed if it does
+    if 'material_facts' in product:
+        # Initialize 'material_facts' if not already present
+        if 'scaling_factors' not in product['material_facts']:
+            declared_unit = product['material_facts'].get('declared_unit', None)
+            if declared_unit:
+                product['material_facts']['scaling_factors'] = {
+                    declared_unit: {'value': 1, 'estimated': False}
+                }
+    return product
+
+
 class ProductData:
+    # Unit in which the LCA values of the DataFrame are expressed
+    unit = 'declared_unit'
+
+    @profiled('ProductData.__init__', rows=lambda self, data: len(data))
     def __init__(self, data):
         self._data = None
         self._dataframe = None
+        self.compact_options = None
 
         if isinstance(data, list):
             self.data = data  # This will trigger the setter to update both _data and _dataframe
@@ -23,27 +56,21 @@ class ProductData:
 
     @property
     def data(self):
+        # The nested dicts are only built when they are first needed
+        if self._data is None and self._dataframe is not None:
+            self._data = self.df_to_list(self._dataframe)
         return self._data
 
     @data.setter
     def data(self, value):
-        def add_scaling_factor(product):
-            # Ensure 'material_facts' exists and proceed if it does
-            if 'material_facts' in product:
-                # Initialize 'material_facts' if not already present
-                if 'scaling_factors' not in product['material_facts']:
-                    declared_unit = product['material_facts'].get('declared_unit', None)
-                    if declared_unit:
-                        product['material_facts']['scaling_factors'] = {
-                            declared_unit: {'value': 1, 'estimated': False}
-                        }
-            return product
-
         # Process each product to potentially add missing scaling factors
-        products = [add_scaling_factor(product) for product in value]
+        with stage('ProductData.add_scaling_factors', len(value)):
+            products = [add_scaling_factor(product) for product in value]
 
         self._data = products
-        self._dataframe = self.to_dataframe(products).replace({np.nan: None})
+        df = self.to_dataframe(products)
+        with stage('ProductData.replace_nan', len(df)):
+            self._dataframe = df.replace({np.nan: None})
 
     @property
     def dataframe(self):
@@ -51,12 +78,279 @@ class ProductData:
 
     @dataframe.setter
     def dataframe(self, value):
-        self._dataframe = value.replace({np.nan: None})
-        self._data = self.df_to_list(value)
+        with stage('ProductData.replace_nan', len(value)):
+            self._dataframe = value.replace({np.nan: None})
+        self._data = None
+        self.compact_options = None
+
+    def compact(self, float32=False):
+        """
+        Reduces the memory used by the DataFrame: repeated text values (company, product_type,
+        country...) are stored as Categorical, numerical values as floats and identical lists
+        are shared. Missing values become NaN instead of None. Grouping on Categorical columns
+        is also faster.
+
+        :param float32: Whether to store the LCA values as float32, halving their memory at
+                        the cost of precision.
+        :return: The instance, to allow chaining e.g. ProductData(products).compact().
+        """
+        with stage('ProductData.compact', len(self.dataframe)):
+            self._dataframe = compact_dataframe(self.dataframe, float32)
+        # The nested dicts are rebuilt from the DataFrame when needed
+        self._data = None
+        self.compact_options = {'float32': float32}
+        return self
+
+    def publish(self, directory, float32=False):
+        """
+        Publishes the DataFrame to a snapshot directory (see aecdata.snapshot), so that other
+        processes attach to it with ProductData.attach instead of each holding its own copy.
+        The DataFrame is stored compacted, its numerical and Categorical columns are then
+        memory-mapped and shared by all the processes attached.
+
+        :param directory: The snapshot directory, its previous snapshot is replaced atomically.
+        :param float32: Whether to store the LCA values as float32, if the DataFrame is not
+                        compacted already.
+        """
+        compact_options = self.compact_options if self.compact_options is not None else {'float32': float32}
+        with stage('ProductData.publish', len(self.dataframe)):
+            df = self.dataframe if self.compact_options is not None else compact_dataframe(self.dataframe, float32)
+            metadata = {'class': type(self).__name__, 'unit': self.unit, 'compact_options': compact_options}
+            write_snapshot(directory, df, metadata)
+
+    @staticmethod
+    def attach(directory, columns=None):
+        """
+        Attaches read-only to a snapshot published with publish. Filters, unit conversions and
+        statistics read the memory-mapped columns without copying them.
+
+        :param directory: The snapshot directory.
+        :param columns: Optional list of the columns to attach, by default all of them.
+        :return: A compacted ProductData, or ProductStatistics if one was published.
+        """
+        df, metadata = read_snapshot(directory, columns)
+        cls = ProductStatistics if metadata['class'] == 'ProductStatistics' else ProductData
+        # The attached DataFrame is used as is, neither rebuilt nor converted again
+        product_data = cls.__new__(cls)
+        product_data._dataframe = df
+        product_data._data = None
+        product_data.compact_options = metadata['compact_options']
+        if cls is ProductStatistics:
+            product_data.unit = metadata['unit']
+            product_data.incremental_statistics = None
+            product_data.cache = None
+            product_data._row_changes = None
+        return product_data
+
+    @staticmethod
+    def merge(items):
+        """
+        Concatenates the DataFrames of ProductData, keeping one row per 'unique_product_uuid_v2'.
+
+        :return: tuple (DataFrame, data or None, compact_options).
+        """
+        for item in items:
+            if item.unit != ProductData.unit:
+                raise ValueError(f"Only products in the declared unit can be merged, not in '{item.unit}'.")
+        options = [item.compact_options for item in items]
+        # The frames stay compacted if they all are, with the same options
+        compact_options = options[0] if options and options[0] is not None and all(option == options[0] for option in options) else None
+        frames = [item.dataframe if compact_options is not None or option is None else expand_dataframe(item.dataframe)
+                  for item, option in zip(items, options)]
+        with stage('ProductData.merge', sum(len(df) for df in frames)):
+            dataframe, positions = merge_frames(frames, compact_options is not None)
+        data = None
+        if all(item._data is not None for item in items):
+            all_data = [product for item in items for product in item._data]
+            data = [all_data[position] for position in positions]
+        return ProductData.order_columns(dataframe), data, compact_options
+
+    @staticmethod
+    def concat(items):
+        """
+        Concatenates products, e.g. of several filtered pulls, keeping the most recently
+        'updated' record of every 'unique_product_uuid_v2' (the last one on ties). The columns
+        are aligned without rebuilding the DataFrames from the products, and compacted
+        DataFrames stay compacted if they all are.
+
+        :param items: ProductData or lists of products.
+        :return: A new ProductData.
+        """
+        items = [item if isinstance(item, ProductData) else ProductData(item) for item in items]
+        product_data = ProductData([])
+        product_data._dataframe, product_data._data, product_data.compact_options = ProductData.merge(items)
+        return product_data
+
+    def upsert(self, other):
+        """
+        Inserts the new products of other and replaces the products it holds a more (or as)
+        recently 'updated' record of, matching them by 'unique_product_uuid_v2'.
+
+        :param other: ProductData or list of products.
+        :return: The instance, to allow chaining.
+        """
+        other = other if isinstance(other, ProductData) else ProductData(other)
+        self._dataframe, self._data, self.compact_options = ProductData.merge([self, other])
+        return self
+
+    def get_fingerprint(self):
+        """
+        Returns a fingerprint of the content of the DataFrame. It is computed once for every
+        DataFrame assigned to the instance.
+        """
+        fingerprint = getattr(self, '_fingerprint', None)
+        if fingerprint is None or fingerprint[0]() is not self.dataframe:
+            fingerprint = (weakref.ref(self.dataframe), get_dataframe_fingerprint(self.dataframe))
+            self._fingerprint = fingerprint
+        return fingerprint[1]
+
+    def lca_tensor(self, masked=False):
+        """
+        Returns the LCA values as an LCATensor: a 3-D array (products x fields x modules) with
+        labelled axes, built once for every DataFrame assigned to the instance. Scaling,
+        summing over modules and selecting indicators are then array operations, e.g.
+        tensor.values.sum(axis=2) or tensor.scale(1 / factors).
+
+        :param masked: Whether to return the values as a masked array with the modules that
+                       are not declared masked, instead of NaN.
+        :return: An LCATensor. Its values are read-only as they are shared between calls.
+        """
+        cached = getattr(self, '_lca_tensor', None)
+        if cached is None or cached[0]() is not self.dataframe:
+            float32 = self.compact_options is not None and self.compact_options['float32']
+            tensor = LCATensor.from_dataframe(self.dataframe, np.float32 if float32 else float)
+            tensor.values.flags.writeable = False
+            cached = (weakref.ref(self.dataframe), tensor)
+            self._lca_tensor = cached
+        return cached[1].masked() if masked else cached[1]
+
+    def get_alternatives_index(self, features=None, partition_by=None):
+        """
+        Returns the AlternativesIndex of the products used by find_alternatives. It is built
+        once for every DataFrame assigned to the instance and set of arguments.
+
+        :param features: The properties compared to find similar products. If None, use
+                         search.alternative_features (density, thickness, thermal_conductivity...).
+        :param partition_by: The columns partitioning the products. If None, use
+                             ['product_type', 'material_facts.declared_unit'].
+        """
+        key = (tuple(features) if features is not None else None, tuple(partition_by) if partition_by is not None else None)
+        cached = getattr(self, '_alternatives_index', None)
+        if cached is None or cached[0]() is not self.dataframe or cached[1] != key:
+            cached = (weakref.ref(self.dataframe), key, AlternativesIndex(self.dataframe, features, partition_by, self.unit))
+            self._alternatives_index = cached
+        return cached[2]
+
+    def find_alternatives(self, uuid, k=5, unit='kg', field='material_facts.total_co2e_kg_mf', features=None, partition_by=None):
+        """
+        Finds the k products most similar to a product (same product type and declared unit,
+        closest physical properties) with a lower value of the field per unit.
+
+        :param uuid: The 'unique_product_uuid_v2' of the product.
+        :param k: The number of alternatives.
+        :param unit: The unit in which the field is compared.
+        :param field: The field to compare.
+        :return: DataFrame with the rows of the alternatives, ordered from the most similar,
+                 with the 'distance' to the product and the 'value' of the field in the unit.
+        """
+        index = self.get_alternatives_index(features, partition_by)
+        positions, distances, values = index.query(uuid, k, unit, field)
+        alternatives = self.dataframe.iloc[positions].copy()
+        alternatives['distance'] = distances
+        alternatives['value'] = values
+        return alternatives
+
+    def get_text_index(self, columns=None):
+        """
+        Returns the TextIndex of the products used by search. It is built once for every
+        DataFrame assigned to the instance and set of columns.
+
+        :param columns: dict mapping the columns to index to the weight of their terms. If None,
+                        index name, description, company and material_type (textsearch.text_search_columns).
+        """
+        key = tuple(columns.items()) if columns is not None else None
+        cached = getattr(self, '_text_index', None)
+        if cached is None or cached[0]() is not self.dataframe or cached[1] != key:
+            cached = (weakref.ref(self.dataframe), key, TextIndex(self.dataframe, columns))
+            self._text_index = cached
+        return cached[2]
+
+    def search(self, queries, k=10, columns=None):
+        """
+        Full-text search of the products by name, description, company and material type,
+        ranked with BM25 over words and character trigrams (tolerant to typos), offline.
+
+        :param queries: A text, or a list of texts for a batch of queries.
+        :param k: The maximum number of results per query.
+        :param columns: dict mapping the columns to search to their weight, see get_text_index.
+        :return: DataFrame with the rows of the matching products, from the best match, and
+                 their 'score'. For a list of queries, the 'query' column holds the position of
+                 the query in the list.
+        """
+        index = self.get_text_index(columns)
+        if isinstance(queries, str):
+            positions, scores = index.search(queries, k)
+            results = self.dataframe.iloc[positions].copy()
+            results['score'] = scores
+            return results
+
+        results = index.search_batch(queries, k)
+        positions = np.concatenate([result[0] for result in results]) if results else np.zeros(0, dtype=np.int64)
+        matches = self.dataframe.iloc[positions].copy()
+        matches.insert(0, 'query', np.repeat(np.arange(len(results)), [len(result[0]) for result in results]))
+        matches['score'] = np.concatenate([result[1] for result in results]) if results else np.zeros(0)
+        return matches
+
+    def create_index(self, columns):
+        """
+        Builds indexes of columns used by query: numerical columns are sorted for range
+        conditions and other columns (including list columns) map their values to the rows.
+        The indexes are kept until another DataFrame is assigned to the instance.
 
+        :param columns: A column or a list of columns.
+        """
+        if isinstance(columns, str):
+            columns = [columns]
+        indexes = self.get_column_indexes()
+        for column in columns:
+            if column not in self.dataframe.columns:
+                raise ValueError(f'Column "{column}" not available.')
+            if column not in indexes:
+                indexes[column] = ColumnIndex(self.dataframe[column])
+
+    def get_column_indexes(self):
+        """Returns the dict mapping columns to the indexes built by create_index for the current DataFrame."""
+        cached = getattr(self, '_column_indexes', None)
+        if cached is None or cached[0]() is not self.dataframe:
+            cached = (weakref.ref(self.dataframe), {})
+            self._column_indexes = cached
+        return cached[1]
+
+    def query(self, conditions):
+        """
+        Filters the products on conditions on their columns, e.g.
+        {'material_facts.manufacturing': ('<', 5), 'density': ('between', 20, 40)}.
+
+        A condition is a tuple (operator, arguments...) with the operator in '==', '!=', '<',
+        '<=', '>', '>=', 'between' (inclusive bounds), 'in', 'not in', 'isna' and 'notna', or a
+        plain value or list matched as in filter_df_by_dict. On list columns '==' and 'in' match
+        the rows whose list contains the value(s), '!=' and 'not in' the others, and the range
+        operators raise ValueError.
+
+        The conditions are evaluated as NumPy masks: first those answered by the indexes of
+        create_index, then the others from the cheapest, each only on the rows left by the
+        previous ones.
+
+        :param conditions: dict mapping columns to conditions.
+        :return: DataFrame with the matching rows.
+        """
+        positions = query_positions(self.dataframe, conditions, self.get_column_indexes())
+        return self.dataframe.iloc[positions]
+
+    @profiled('ProductData.df_to_list', rows=lambda self, df: len(df))
     def df_to_list(self, df):
 
-        df = df.replace({np.nan: None})
+        df = expand_dataframe(df)
 
         def remove_nulls(d):
             """Recursively remove dictionary keys with None values and empty dictionaries."""
@@ -87,7 +381,8 @@ class ProductData:
                 remove_estimated_false_when_field_null(result)
             return result
 
-        nested_data = [row_to_nested_dict(row) for index, row in df.iterrows()]
+        with stage('ProductData.row_to_nested_dict', len(df)):
+            nested_data = [row_to_nested_dict(row) for index, row in df.iterrows()]
         return nested_data
 
     def to_dataframe(self, data):
@@ -98,8 +393,16 @@ class ProductData:
         :return: pandas DataFrame containing the data with ordered columns.
         """
         # Normalize the data to create an initial dataframe
-        df = pd.json_normalize(data)
+        with stage('ProductData.json_normalize', len(data)):
+            df = pd.json_normalize(data)
+        return self.order_columns(df)
 
+    @staticmethod
+    def order_columns(df):
+        """
+        Returns the DataFrame with 'unique_product_uuid_v2' first and the columns starting with
+        'material_facts' at the end, sorted.
+        """
         # Separate columns starting with 'material_facts'
         material_facts_cols = [col for col in df.columns if col.startswith('material_facts')]
         other_cols = [col for col in df.columns if not col.startswith('material_facts')]
@@ -155,7 +458,14 @@ class ProductData:
         available_units = {col.split('.')[-2] for col in scaling_factor_columns if '.value' in col}
         return available_units
 
+    @profiled('ProductData.convert_df_to_unit', rows=lambda self, df, *args, **kwargs: len(df))
     def convert_df_to_unit(self, df, unit='declared_unit', amount=1):
+        """
+        Scales the LCA and numerical material facts fields to the unit and amount.
+
+        :param amount: The amount, or an array with the amount of each row.
+        :return: The scaled DataFrame or None if the unit is not available.
+        """
         # Extract available units
         available_units = self.get_available_units()
 
@@ -164,74 +474,71 @@ class ProductData:
             print(f'Unit not available. Available units {available_units}')
             return None
 
-        scalable_columns = []
-        # Add lca fields
-        for field in lca_fields:
-            for module in lca_modules:
-                scalable_columns.append(f'material_facts.{field}.{module}')
-
-        # Add lca num fields
-        for field in mf_num_fields:
-            scalable_columns.append(f'material_facts.{field}')
-
         # Filter the list of all breakdown fields to those that exist in the dataframe
         columns_to_scale = [col for col in scalable_columns if col in df.columns]
 
-        # Create new df that we will adjust
-        scaled_df = df.copy()
+        # Scale all the columns at once as a float array
+        amount = np.asarray(amount, dtype=float)
+        if amount.ndim:
+            amount = amount[:, np.newaxis]
+        values = amount * df[columns_to_scale].to_numpy(dtype=float)
 
         if unit != 'declared_unit':
             scaling_column = f'material_facts.scaling_factors.{unit}.value'
 
             # Ensure the scaling column exists
             if scaling_column in df.columns:
-                scaled_df.loc[:, columns_to_scale] = amount*scaled_df.loc[:, columns_to_scale].div(df.loc[:, scaling_column], axis=0)
-                return scaled_df
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    values /= df[scaling_column].to_numpy(dtype=float)[:, np.newaxis]
             else:
                 print(f'Unit scaling column "{scaling_column}" not found in DataFrame. No scaling applied.')
                 return None
-        else:
-            scaled_df.loc[:, columns_to_scale] = amount * scaled_df.loc[:, columns_to_scale]
-            return scaled_df
 
+        # The scaled columns replace the ones of df as a single block, the other columns are
+        # shared with df. Setting them on a copy of df would add one block per column
+        scaled_df = pd.DataFrame(values, index=df.index, columns=columns_to_scale)
+        return pd.concat([df.drop(columns=columns_to_scale), scaled_df], axis=1)[df.columns]
+
+    @profiled('ProductData.scale_products_by_unit_and_amount', rows=lambda self, products_info: len(products_info))
     def scale_products_by_unit_and_amount(self, products_info):
-        # Create an empty DataFrame to hold the results
-        scaled_products_df = pd.DataFrame()
+        df = self.dataframe
+        # Row positions of every product in the DataFrame
+        product_positions = df.groupby('unique_product_uuid_v2', sort=False, observed=True).indices
 
-        # Iterate over the items in the products_info dictionary
-        for uuid, info in products_info.items():
+        # Collect the rows, amounts and order of the lines for every unit
+        unit_lines = {}
+        for line, (uuid, info) in enumerate(products_info.items()):
             # Extract the unit and amount for the product
             unit = info.get('unit', 'declared_unit')
             amount = info.get('amount', 1)
 
-            # Find the row in the DataFrame for the current product UUID
-            product_row = self.dataframe[self.dataframe['unique_product_uuid_v2'] == uuid]
-
-            # If the product is found in the DataFrame
-            if not product_row.empty:
-                # Scale the DataFrame to the specified unit
-                scaled_row = self.convert_df_to_unit(product_row, unit, amount)
-
-                # scaled_row_squeezed = scaled_row.squeeze()
-                # scaling_factor_name = f'material_facts.scaling_factors.{unit}.value'
-                #
-                # # Now scaled_row_squeezed is a Series, and you can check and access values directly
-                # if scaling_factor_name not in scaled_row_squeezed or not scaled_row_squeezed[scaling_factor_name]:
-                #     print(f"Unit {unit} for product {scaled_row_squeezed['unique_product_uuid_v2']} not available")
-
-                # If the DataFrame was successfully scaled
-                if scaled_row is not None:
-                    # # Scale the row by the specified amount
-                    # scaled_row = scaled_row.multiply(amount, axis=0)
-
-                    # Append the scaled row to the results DataFrame
-                    scaled_products_df = pd.concat([scaled_products_df, scaled_row], ignore_index=True)
-                else:
-                    print(f"Scaling to unit '{unit}' failed for product {uuid}.")
-            else:
+            positions = product_positions.get(uuid)
+            if positions is None:
                 print(f"Product UUID '{uuid}' not found in DataFrame.")
+                continue
+            lines = unit_lines.setdefault(unit, {'uuids': [], 'positions': [], 'amounts': [], 'lines': []})
+            lines['uuids'].append(uuid)
+            lines['positions'].append(positions)
+            lines['amounts'].append(np.full(len(positions), amount, dtype=float))
+            lines['lines'].append(np.full(len(positions), line))
+
+        # Scale the rows of all the lines with the same unit at once
+        scaled_dfs, line_order = [], []
+        for unit, lines in unit_lines.items():
+            scaled_df = self.convert_df_to_unit(df.iloc[np.concatenate(lines['positions'])], unit, np.concatenate(lines['amounts']))
+            if scaled_df is None:
+                for uuid in lines['uuids']:
+                    print(f"Scaling to unit '{unit}' failed for product {uuid}.")
+                continue
+            scaled_dfs.append(scaled_df)
+            line_order.append(np.concatenate(lines['lines']))
 
-        return scaled_products_df.reset_index(drop=True)
+        if not scaled_dfs:
+            return pd.DataFrame()
+
+        # Back to the order of products_info
+        order = np.argsort(np.concatenate(line_order), kind='stable')
+        return pd.concat(scaled_dfs, ignore_index=True).iloc[order].reset_index(drop=True)
 
 
     def get_product_contributions(self, products_info, field_name):
@@ -260,6 +567,7 @@ class ProductData:
         return contributions
 
 
+    @profiled('ProductData.to_epdx', rows=lambda self: len(self.dataframe))
     def to_epdx(self):
         def create_epdx_dict_from_row(row, modules_to_epdx, lca_field_to_epdx):
             # Initialize the dictionary to hold the EPDx structured data
@@ -372,7 +680,8 @@ class ProductData:
         published_date_timestamp = int(datetime.now().timestamp())
 
         # Iterate through each row of the dataframe
-        for index, row in self.dataframe.iterrows():
+        df = self.dataframe if self.compact_options is None else expand_dataframe(self.dataframe)
+        for index, row in df.iterrows():
             epdx_product = initial_epdx.copy()
 
             # 2050 materials uuid
@@ -456,12 +765,17 @@ class ProductData:
 
 
 class ProductStatistics(ProductData):
+    @profiled('ProductStatistics.__init__', rows=lambda self, data, unit='declared_unit': len(data.dataframe if isinstance(data, ProductData) else data))
     def __init__(self, data, unit='declared_unit'):
+        # Changes recorded by apply_changes and not yet applied to the DataFrame
+        self._row_changes = None
         # Check if the input is a ProductData instance
         if isinstance(data, ProductData):
-            # Directly use the DataFrame from the ProductData instance
-            self.dataframe = data.dataframe.copy()  # Make a copy to ensure independence
-            self.data = data.data  # Assuming you want to also copy the original data structure
+            # Share the DataFrame of the ProductData instance, the conversion to the unit
+            # below replaces the scaled columns instead of modifying them in place
+            self._dataframe = data.dataframe
+            self._data = None
+            self.compact_options = data.compact_options
         else:
             # Initialize the ProductData part of this instance
             super().__init__(data)
@@ -483,20 +797,130 @@ class ProductStatistics(ProductData):
             raise ValueError(f'Unit "{unit}" not available. Available units: {available_units}')
 
         # Since the unit is valid, proceed to convert the DataFrame to the specified unit
-        df = self.convert_df_to_unit(self.dataframe, unit)
-        if unit in available_units:
-            df['estimated'] = df[f'material_facts.scaling_factors.{unit}.estimated']
-        elif unit == 'declared_unit':
+        # The nested dicts (data) are built from it on first access
+        self._dataframe = self.convert_df_to_statistics_unit(self.dataframe, unit)
+        self._data = None
+        if self.compact_options is not None:
+            with stage('ProductData.compact', len(self._dataframe)):
+                self._dataframe = compact_dataframe(self._dataframe, **self.compact_options)
+
+        # Store the unit for potential future reference
+        self.unit = unit
+        self.incremental_statistics = None
+        self.cache = None
+
+    @property
+    def dataframe(self):
+        self.apply_recorded_changes()
+        return self._dataframe
+
+    @dataframe.setter
+    def dataframe(self, value):
+        ProductData.dataframe.fset(self, value)
+        self._row_changes = None
+
+    @property
+    def data(self):
+        self.apply_recorded_changes()
+        return ProductData.data.fget(self)
+
+    @data.setter
+    def data(self, value):
+        ProductData.data.fset(self, value)
+        self._row_changes = None
+
+    def apply_recorded_changes(self):
+        """
+        Rebuilds the DataFrame (and the nested dicts if they were built) with the changes
+        recorded by apply_changes since it was last read.
+        """
+        row_changes, self._row_changes = self._row_changes, None
+        if row_changes is None:
+            return
+        with stage('ProductStatistics.apply_recorded_changes', row_changes.n_rows):
+            dataframe, keep, appended = row_changes.apply(self._dataframe)
+            new_columns = appended.columns.difference(self._dataframe.columns)
+            if len(new_columns):
+                dataframe[new_columns] = dataframe[new_columns].replace({np.nan: None})
+            if self._data is not None:
+                appended_data = self.df_to_list(appended) if len(appended) else []
+                self._data = list(compress(self._data + appended_data, keep))
+            self._dataframe = dataframe if self.compact_options is None else compact_dataframe(dataframe, **self.compact_options)
+
+    def enable_cache(self, max_entries=128, max_bytes=256 * 2 ** 20, cache_dir=None):
+        """
+        Caches the results of get_statistics, get_field_distribution and get_field_distribution_boxplot.
+        Results are keyed by the arguments and a fingerprint of the DataFrame, so they are recomputed
+        when a new DataFrame is assigned. Call clear_cache() after modifying the DataFrame in place.
+
+        :param max_entries: Maximum number of results kept in memory (least recently used are evicted).
+        :param max_bytes: Maximum memory used by the results kept in memory.
+        :param cache_dir: Optional directory where results are also persisted.
+        """
+        self.cache = ResultCache(max_entries, max_bytes, cache_dir)
+
+    def clear_cache(self):
+        if self.cache is not None:
+            self.cache.clear()
+
+    @profiled('ProductStatistics.convert_df_to_statistics_unit', rows=lambda self, df, unit: len(df))
+    def convert_df_to_statistics_unit(self, df, unit):
+        """
+        Converts the DataFrame to the unit and adds the 'estimated' column, dropping the
+        products for which the unit is not available.
+        """
+        if unit != 'declared_unit':
+            # Products without a scaling factor for the unit are dropped below
+            missing_columns = [column for column in [f'material_facts.scaling_factors.{unit}.value', f'material_facts.scaling_factors.{unit}.estimated']
+                               if column not in df.columns]
+            if missing_columns:
+                df = df.copy(deep=False)
+                df[missing_columns] = None
+
+        df = self.convert_df_to_unit(df, unit)
+        if unit == 'declared_unit':
             df['estimated'] = False
+        else:
+            df['estimated'] = df[f'material_facts.scaling_factors.{unit}.estimated']
 
-        # Drop rows where the 'estimated' column has None values
-        df.dropna(subset=['estimated'], inplace=True)
+        with stage('ProductStatistics.drop_unavailable', len(df)):
+            # Drop rows where the 'estimated' column has None values
+            df.dropna(subset=['estimated'], inplace=True)
+            # Same layout as a DataFrame built from the products left: empty columns dropped, the
+            # other columns in the order in which the products first have them, 'material_facts'
+            # columns sorted at the end, bool columns without missing values as bool and a new index
+            present = df.notna().to_numpy()
+            order = np.lexsort((np.arange(len(df.columns)), present.argmax(axis=0)))
+            order = order[present.any(axis=0)[order]]
+            df = self.order_columns(df.iloc[:, order]).reset_index(drop=True)
+            bool_columns = [column for column in df.columns if column.endswith('estimated') and df[column].dtype == object
+                            and pd.api.types.infer_dtype(df[column], skipna=False) == 'boolean']
+            if bool_columns:
+                df = df.astype(dict.fromkeys(bool_columns, bool))
+
+        if self.compact_options is not None:
+            return df
 
-        self.dataframe = df
-        self.data = self.df_to_list(df)
+        # Use None for the missing scaled values, as in ProductData.dataframe
+        with stage('ProductStatistics.replace_nan', len(df)):
+            float_df = df.select_dtypes('float')
+            missing = float_df.isna()
+            nan_columns = float_df.columns[missing.any().to_numpy()]
+            if len(nan_columns):
+                df[nan_columns] = float_df[nan_columns].astype(object).mask(missing[nan_columns], None)
+        return df
 
-        # Store the unit for potential future reference
-        self.unit = unit
+    def get_scaling_factors(self, df, unit):
+        """
+        Returns the scaling factors of the unit of every row as a float array, NaN where the
+        unit is not available. They are 1 for the 'declared_unit'.
+        """
+        if unit == 'declared_unit':
+            return np.ones(len(df))
+        column = f'material_facts.scaling_factors.{unit}.value'
+        if column not in df.columns:
+            return np.full(len(df), np.nan)
+        return df[column].to_numpy(dtype=float)
 
     def get_lca_fields(self, fields='all', modules='all'):
         """
@@ -508,16 +932,14 @@ class ProductStatistics(ProductData):
         :param modules: The list of modules to include. If 'all', use all modules.
         :return: a DataFrame with the LCA fields columns scaled by the unit if available.
         """
-        if fields == 'all':
-            fields = lca_fields  # lca_fields should be defined in your utils.py or within this class
-
-        if modules == 'all':
-            modules = lca_modules  # lca_modules should be defined in your utils.py or within this class
-
-        all_lca_fields = []
-        for field in fields:
-            for module in modules:
-                all_lca_fields.append(f'material_facts.{field}.{module}')
+        if fields == 'all' and modules == 'all':
+            all_lca_fields = lca_columns
+        else:
+            if fields == 'all':
+                fields = lca_fields
+            if modules == 'all':
+                modules = lca_modules
+            all_lca_fields = [f'material_facts.{field}.{module}' for field in fields for module in modules]
 
         scaled_df = self.dataframe
 
@@ -529,26 +951,12 @@ class ProductStatistics(ProductData):
             return scaled_df
 
     def get_available_groupings(self):
-        df = self.dataframe
-        group_by_dict = {
-            'material_type': set(df['material_type']),
-            'material_type_family': set(df['material_type_family']),
-            'product_type': set(df['product_type']),
-            'product_type_family': set(df['product_type_family']),
-            'manufacturing_continent': set(df['manufacturing_continent']),
-            'material_facts.data_source': set(df['material_facts.data_source']),
-            'company': set(df['company']),
-        }
-        return group_by_dict
+        return self.get_group_by_dict(self.dataframe, ['material_type', 'material_type_family', 'product_type', 'product_type_family',
+                                                       'manufacturing_continent', 'material_facts.data_source', 'company'])
 
     def get_available_fields_dict(self):
         df = self.dataframe
         fields = {}
-        all_lca_fields = []
-        for field in lca_fields:
-            for module in lca_modules:
-                all_lca_fields.append(f'material_facts.{field}.{module}')
-
         all_mf_num_fields = [f'material_facts.{field}' for field in mf_num_fields]
         all_mf_perc_fields = [f'material_facts.{field}' for field in mf_perc_fields]
         all_physical_properties_fields = physical_properties_fields
@@ -556,7 +964,7 @@ class ProductStatistics(ProductData):
         fields['material_fact_numerical_fields'] = [field for field in all_mf_num_fields if field in df.columns]
         fields['material_fact_percentage_fields'] = [field for field in all_mf_perc_fields if field in df.columns]
         fields['physical_properties_fields'] = [field for field in all_physical_properties_fields if field in df.columns]
-        fields['lca_field_modules'] = [field for field in all_lca_fields if field in df.columns]
+        fields['lca_field_modules'] = [field for field in lca_columns if field in df.columns]
         return fields
 
     def get_available_fields(self):
@@ -599,134 +1007,45 @@ class ProductStatistics(ProductData):
 
     def get_group_by_dict(self, df, group_by):
         if group_by is None:
-            # Create a set from all unique strings in lists for 'product_type'
-            group_by_dict = {
-                'product_type': set(df['product_type'])}
-        else:
-            group_by_dict = {}
-            for group in group_by:
-                # Use set.union to combine all unique elements if the column contains lists
-                if df[group].apply(lambda x: isinstance(x, list)).any():
-                    group_by_dict[group] = set().union(*df[group].apply(lambda x: x if isinstance(x, list) else [x]))
-                else:
-                    group_by_dict[group] = set(df[group])
+            group_by = ['product_type']
+
+        group_by_dict = {}
+        for group in group_by:
+            if isinstance(df[group].dtype, pd.CategoricalDtype):
+                # Compact columns, the missing values are NaN instead of None
+                group_by_dict[group] = set(df[group].cat.remove_unused_categories().cat.categories)
+                if df[group].isna().any():
+                    group_by_dict[group].add(None)
+            # Use set.union to combine all unique elements if the column contains lists
+            elif df[group].apply(lambda x: isinstance(x, list)).any():
+                group_by_dict[group] = set().union(*df[group].apply(lambda x: x if isinstance(x, list) else [x]))
+            else:
+                group_by_dict[group] = set(df[group])
         return group_by_dict
 
-    def get_statistics(self, group_by=None, fields=None, statistical_metrics=None, include_estimated_values=False, remove_outliers=True, method='IQR', sqrt_tranf=True, min_count=4):
-        def get_field_statistics(statistical_metrics, field, filtered_df, remove_outliers, method, sqrt_tranf, min_count):
-            outlier_ids = []
-            statistical_metrics = [f'{field}.{s}' for s in statistical_metrics]
-            empty_field_statistics = {
-                f'{field}.count': None,
-                f'{field}.mean': None,
-                f'{field}.median': None,
-                f'{field}.standard_deviation': None,
-                f'{field}.minimum': None,
-                f'{field}.maximum': None,
-                f'{field}.quartiles': None,
-                f'{field}.coefficient_of_variation': None,
-                f'{field}.range': None,
-                f'{field}.outlier_ids': outlier_ids
-            }
-            empty_filtered_dict = {k: empty_field_statistics[k] for k in statistical_metrics}
-            if len(filtered_df) < min_count:
-                return empty_filtered_dict
-
-            if remove_outliers:
-                '''Sqrt transformation'''
-                if sqrt_tranf:
-                    # Check whether the majority is negative and flip the sign so we can apply sqrt transf
-                    is_majority_negative = (filtered_df[field] < 0).sum() > (len(filtered_df) / 2)
-                    if is_majority_negative:
-                        filtered_df.loc[:, field] = -filtered_df[field]
-
-                    filtered_df = filtered_df[filtered_df[field] >= 0]
-                    try:
-                        filtered_df[field] = np.sqrt(filtered_df[field])
-                    except:
-                        sqrt_tranf = False
-
-                '''Drop products with z-scores greater than 1.96, which corresponds to 95% confidence'''
-                if method == 'zscore':
-                    # Calculate z-scores of the values in the filtered_df[field]
-                    mean = filtered_df[field].mean()
-                    std_dev = filtered_df[field].std()
-                    z_scores = np.abs((filtered_df[field] - mean) / std_dev)
-                    # Filter out outliers
-                    outlier_mask = z_scores > 1.96
-                    outlier_ids = filtered_df.index[outlier_mask].tolist()
-                    filtered_df = filtered_df[~outlier_mask]
-
-                '''Repeat zscore method until the max outlier has z_value less than 5'''
-                if method == 'repeated_zscore':
-                    z_max = 20
-                    while z_max > 6:
-                        # Calculate z-scores of the values in the filtered_df[field]
-                        mean = filtered_df[field].mean()
-                        std_dev = filtered_df[field].std()
-                        z_scores = np.abs((filtered_df[field] - mean) / std_dev)
-                        # Filter out outliers (values with z-scores greater than 1.96, which corresponds to 95% confidence)
-                        outlier_mask = z_scores > 1.96
-                        outlier_ids.extend(filtered_df.index[outlier_mask].tolist())
-                        filtered_df = filtered_df[~outlier_mask]
-                        z_max = z_scores.max()
-
-                if method == 'IQR':
-                    # Calculate the first quartile (Q1), the third quartile (Q3), and the interquartile range (IQR)
-                    Q1 = filtered_df[field].quantile(0.25)
-                    Q3 = filtered_df[field].quantile(0.75)
-                    IQR = Q3 - Q1
-
-                    # Filter out outliers (values below Q1 - 1.5 * IQR or above Q3 + 1.5 * IQR)
-                    outlier_mask = ~filtered_df[field].between(Q1 - 1.5 * IQR, Q3 + 1.5 * IQR)
-                    outlier_ids = filtered_df.index[outlier_mask].tolist()
-                    filtered_df.index[outlier_mask].tolist()
-                    filtered_df = filtered_df[~outlier_mask]
-
-                if sqrt_tranf:
-                    filtered_df[field] = filtered_df[field] ** 2
-                    # Fix the sign
-                    if is_majority_negative:
-                        filtered_df[field] = - filtered_df[field]
-
-            if len(filtered_df) < min_count:
-                return empty_filtered_dict
-
-            # Calculate statistics
-            count = len(filtered_df[field])
-            mean = filtered_df[field].mean()
-            median = filtered_df[field].median()
-            std = filtered_df[field].std()
-            minimum = filtered_df[field].min()
-            maximum = filtered_df[field].max()
-            Q1_val = filtered_df[field].quantile(0.25)
-            Q2 = median
-            Q3_val = filtered_df[field].quantile(0.75)
-            Q4 = maximum
-            # Check if Q1 is NaN
-            if pd.isna(Q1_val):
-                quartiles = None
-            else:
-                quartiles = np.array([float(Q1_val), float(Q2), float(Q3_val), float(Q4)])
-            coefficient_of_variation = float(std / mean) if mean else None
-            field_statistics = {
-                f'{field}.count': int(count),
-                f'{field}.mean': float(mean),
-                f'{field}.median': float(median),
-                f'{field}.standard_deviation': float(std),
-                f'{field}.minimum': float(minimum),
-                f'{field}.maximum': float(maximum),
-                f'{field}.quartiles': quartiles,
-                f'{field}.coefficient_of_variation': coefficient_of_variation,
-                f'{field}.range': float(maximum - minimum),
-                f'{field}.outlier_ids': outlier_ids
-            }
-            filtered_dict = {k: field_statistics[k] for k in statistical_metrics}
-            return filtered_dict
+    def get_group_by_codes(self, df, group_by=None, min_count=1):
+        """
+        Assigns every row of the DataFrame to the group_by combinations it belongs to.
 
-        df = self.dataframe
+        Rows of columns that contain lists are repeated once per list item, so a row can
+        belong to several combinations.
 
-        statistics_df = pd.DataFrame()
+        :param df: The DataFrame to group.
+        :param group_by: The list of columns to group by. If None, group by 'product_type'.
+        :param min_count: Minimum number of products for a combination to be included.
+        :return: tuple (positions, codes, groups_df). positions holds the row positions in df,
+                 codes the combination of each of these rows and groups_df one row per combination
+                 with the group_by values and the 'count' of products.
+        """
+        return get_group_codes(df, group_by, min_count)
+
+    @profiled('ProductStatistics.get_statistics', rows=lambda self, *args, **kwargs: len(self.dataframe))
+    @memoized('n_jobs')
+    def get_statistics(self, group_by=None, fields=None, statistical_metrics=None, include_estimated_values=False, remove_outliers=True, method='IQR', sqrt_tranf=True, min_count=4, n_jobs=None, units=None):
+        if units is not None:
+            return self.get_unit_statistics(units, group_by, fields, statistical_metrics, include_estimated_values, remove_outliers, method, sqrt_tranf, min_count, n_jobs)
+
+        df = self.dataframe
 
         if not include_estimated_values:
             df = df[df['estimated']==False]
@@ -737,100 +1056,284 @@ class ProductStatistics(ProductData):
         if statistical_metrics is None:
             statistical_metrics = ['count', 'mean', 'median']
 
-        group_by_dict = self.get_group_by_dict(df, group_by)
+        positions, codes, groups_df = self.get_group_by_codes(df, group_by, min_count)
+        n_groups = len(groups_df)
 
-        filter_conditions = self.get_group_by_combinations(df, group_by_dict, min_count)
+        # One row per (product, group) membership and one column per field
+        with stage('ProductStatistics.gather_values', len(positions)):
+            values = df[fields].to_numpy(dtype=float)[positions]
+        has_statistics, field_statistics = get_group_statistics_parallel(
+            values, codes, n_groups, statistical_metrics, n_jobs=n_jobs, row_ids=df.index.to_numpy()[positions],
+            remove_outliers=remove_outliers, method=method, sqrt_tranf=sqrt_tranf, min_count=min_count)
 
-        for filter_condition in filter_conditions:
+        return get_statistics_df(groups_df, has_statistics, field_statistics, fields, statistical_metrics)
 
-            count = filter_condition.pop('count', None)
-            filtered_materialfacts = self.filter_df_by_dict(df, filter_condition)
-            stats_dict = {}
-            name_dict = filter_condition.copy()
-            name_dict['total_count'] = count
-            for field_name in fields:
-                filtered_df = filtered_materialfacts[[field_name]].dropna()
-                if len(filtered_df) >= min_count:
-                    field_dict = get_field_statistics(statistical_metrics, field_name, filtered_df, remove_outliers, method, sqrt_tranf, min_count)
-                    stats_dict.update(field_dict)
+    @profiled('ProductStatistics.get_unit_statistics', rows=lambda self, *args, **kwargs: len(self.dataframe))
+    def get_unit_statistics(self, units, group_by=None, fields=None, statistical_metrics=None, include_estimated_values=False, remove_outliers=True, method='IQR', sqrt_tranf=True, min_count=4, n_jobs=None):
+        """
+        Computes the statistics of get_statistics in several units at once, e.g. units=['kg', 'm2', 'm3'].
 
-            if stats_dict:
-                full_dict = {**name_dict, **stats_dict}
-                new_row = pd.DataFrame([full_dict])
-                new_row = new_row.dropna(axis=1, how='all')  # Drop columns where all values are NA
-                statistics_df = pd.concat([statistics_df, new_row], ignore_index=True)
+        The products are grouped once. The values in each unit are obtained by rescaling the
+        scalable fields with the scaling factors of the unit, and all (unit, group) pairs go
+        through the outlier removal and statistics in a single pass.
 
-        calculated_fields =  [f"{field}.{metric}" for field in fields for metric in statistical_metrics]
-        name_fields = [field for field in statistics_df.columns if field not in calculated_fields]
-        statistics_df = statistics_df.sort_values(name_fields)
-        desired_column_order = list(name_fields) + calculated_fields
-        statistics_df = statistics_df.reindex(columns=desired_column_order)
-        statistics_df.columns = [col.replace('breakdown__', '') for col in statistics_df.columns]
-        statistics_df.dropna(axis=1, how='all', inplace=True)
-        count_keys = ['total_count'] + [i for i in statistics_df.keys() if ('.count' in i)]
-        for key in count_keys:
-            if key in statistics_df.keys():
-                statistics_df[key] = statistics_df[key].fillna(0).astype('int64')
+        Only the products available in the unit of this instance are included, create it with
+        unit='declared_unit' to include every product that has a scaling factor for each unit.
 
+        :param units: The list of units.
+        :return: A DataFrame with a 'unit' column followed by the columns of get_statistics.
+        """
+        df = self.dataframe
+        units = list(units)
+        available_units = self.get_available_units() | {'declared_unit'}
+        for unit in units:
+            if unit not in available_units:
+                raise ValueError(f'Unit "{unit}" not available. Available units: {available_units}')
 
-        return statistics_df.reset_index(drop=True)
+        if fields is None or fields == 'all':
+            fields = self.get_available_fields()
 
-    def remove_outliers_from_df(self, filtered_df, field, method, sqrt_tranf):
+        if statistical_metrics is None:
+            statistical_metrics = ['count', 'mean', 'median']
 
-        '''Sqrt transformation'''
-        if sqrt_tranf:
-            # Check whether the majority is negative and flip the sign so we can apply sqrt transf
-            is_majority_negative = (filtered_df[field] < 0).sum() > (len(filtered_df) / 2)
-            if is_majority_negative:
-                filtered_df.loc[:, field] = -filtered_df[field]
-
-            filtered_df = filtered_df[filtered_df[field] >= 0]
-            try:
-                filtered_df[field] = np.sqrt(filtered_df[field])
-            except:
-                sqrt_tranf = False
-
-        '''Drop products with z-scores greater than 1.96, which corresponds to 95% confidence'''
-        if method == 'zscore':
-            # Calculate z-scores of the values in the filtered_df[field]
-            mean = filtered_df[field].mean()
-            std_dev = filtered_df[field].std()
-            z_scores = np.abs((filtered_df[field] - mean) / std_dev)
-            # Filter out outliers
-            outlier_mask = z_scores > 1.96
-            filtered_df = filtered_df[~outlier_mask]
-
-        '''Repeat zscore method until the max outlier has z_value less than 5'''
-        if method == 'repeated_zscore':
-            z_max = 20
-            while z_max > 6:
-                # Calculate z-scores of the values in the filtered_df[field]
-                mean = filtered_df[field].mean()
-                std_dev = filtered_df[field].std()
-                z_scores = np.abs((filtered_df[field] - mean) / std_dev)
-                # Filter out outliers (values with z-scores greater than 1.96, which corresponds to 95% confidence)
-                outlier_mask = z_scores > 1.96
-                filtered_df = filtered_df[~outlier_mask]
-                z_max = z_scores.max()
-
-        if method == 'IQR':
-            # Calculate the first quartile (Q1), the third quartile (Q3), and the interquartile range (IQR)
-            Q1 = filtered_df[field].quantile(0.25)
-            Q3 = filtered_df[field].quantile(0.75)
-            IQR = Q3 - Q1
-
-            # Filter out outliers (values below Q1 - 1.5 * IQR or above Q3 + 1.5 * IQR)
-            outlier_mask = ~filtered_df[field].between(Q1 - 1.5 * IQR, Q3 + 1.5 * IQR)
-            filtered_df.index[outlier_mask].tolist()
-            filtered_df = filtered_df[~outlier_mask]
-
-        if sqrt_tranf:
-            filtered_df[field] = filtered_df[field] ** 2
-            # Fix the sign
-            if is_majority_negative:
-                filtered_df[field] = - filtered_df[field]
+        positions, codes, groups_df = self.get_group_by_codes(df, group_by)
+        n_groups = len(groups_df)
 
-        return filtered_df
+        # Only the LCA and numerical material facts fields depend on the unit
+        scalable_fields = set(scalable_columns)
+        is_scalable = np.array([field in scalable_fields for field in fields], dtype=bool)
+
+        values = df[fields].to_numpy(dtype=float)
+        if self.unit != 'declared_unit':
+            # Back to the declared unit, values of the unit of the instance are kept as they are
+            declared_values = values.copy()
+            declared_values[:, is_scalable] *= self.get_scaling_factors(df, self.unit)[:, np.newaxis]
+        else:
+            declared_values = values
+
+        unit_values, unit_codes, unit_positions, unit_groups = [], [], [], []
+        for i, unit in enumerate(units):
+            if unit == self.unit:
+                scaled_values = values
+                estimated = df['estimated'].to_numpy()
+            else:
+                scaled_values = declared_values.copy()
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    scaled_values[:, is_scalable] /= self.get_scaling_factors(df, unit)[:, np.newaxis]
+                estimated = np.zeros(len(df), dtype=object) if unit == 'declared_unit' else df[f'material_facts.scaling_factors.{unit}.estimated'].to_numpy()
+            # Same products as in ProductStatistics(data, unit=unit)
+            is_valid = pd.notna(estimated) & ~np.isnan(self.get_scaling_factors(df, unit))
+            if not include_estimated_values:
+                is_valid &= estimated == False
+
+            valid = is_valid[positions]
+            unit_values.append(scaled_values[positions[valid]])
+            unit_codes.append(codes[valid] + i * n_groups)
+            unit_positions.append(positions[valid])
+            unit_groups.append(groups_df.assign(count=np.bincount(codes[valid], minlength=n_groups)))
+
+        unit_positions = np.concatenate(unit_positions)
+        has_statistics, field_statistics = get_group_statistics_parallel(
+            np.concatenate(unit_values), np.concatenate(unit_codes), len(units) * n_groups, statistical_metrics,
+            n_jobs=n_jobs, row_ids=df.index.to_numpy()[unit_positions],
+            remove_outliers=remove_outliers, method=method, sqrt_tranf=sqrt_tranf, min_count=min_count)
+
+        # One row per (unit, group), keeping the groups with at least min_count products in the unit
+        groups_df = pd.concat(unit_groups, ignore_index=True)
+        groups_df.insert(0, 'unit', np.repeat(units, n_groups))
+        valid_groups = (groups_df['count'] >= min_count).to_numpy()
+        field_statistics = {metric: array[valid_groups] for metric, array in field_statistics.items()}
+        return get_statistics_df(groups_df[valid_groups], has_statistics[valid_groups], field_statistics, fields, statistical_metrics)
+
+    def track_statistics(self, group_by=None, fields=None, statistical_metrics=None, include_estimated_values=False, remove_outliers=True, method='IQR', sqrt_tranf=True, min_count=4):
+        """
+        Computes the same statistics as get_statistics and keeps per group state so that
+        apply_changes only recomputes the groups of the changed products.
+
+        :return: The statistics DataFrame. outlier_ids are reported as 'unique_product_uuid_v2' values.
+        """
+        if fields is None or fields == 'all':
+            fields = self.get_available_fields()
+        self.incremental_statistics = IncrementalStatistics(self.dataframe, group_by, fields, statistical_metrics, include_estimated_values, remove_outliers, method, sqrt_tranf, min_count)
+        return self.incremental_statistics.get_statistics()
+
+    def apply_changes(self, products=None, deleted_uuids=None):
+        """
+        Applies inserts, updates and deletes, matching products by 'unique_product_uuid_v2',
+        e.g. the products returned by a sync with updated_after.
+
+        The cost depends on the number of changes: the tracked statistics are updated in place
+        and the DataFrame is only rebuilt when it is next read.
+
+        :param products: New or updated products, as a list of products or a ProductData.
+        :param deleted_uuids: The 'unique_product_uuid_v2' of the deleted products.
+        :return: The refreshed statistics if track_statistics was called, otherwise None.
+        """
+        if products is None:
+            products = []
+        changes = products if isinstance(products, ProductData) else ProductData(products)
+        changed_df = changes.dataframe
+        if len(changed_df):
+            changed_df = self.convert_df_to_statistics_unit(changed_df, self.unit)
+
+        # The changed products are appended and the rows they replace tombstoned, the DataFrame
+        # is rebuilt once for all the recorded changes when it is next read
+        removed_uuids = set(deleted_uuids or []) | set(changes.dataframe.get('unique_product_uuid_v2', []))
+        if self._row_changes is None:
+            self._row_changes = RowChanges(self._dataframe)
+        self._row_changes.record(changed_df.replace({np.nan: None}), removed_uuids)
+
+        if self.incremental_statistics is None:
+            return None
+        self.incremental_statistics.apply_changes(changed_df, removed_uuids)
+        return self.incremental_statistics.get_statistics()
+
+    def upsert(self, other):
+        """
+        Inserts the new products of other and replaces the products it holds a more (or as)
+        recently 'updated' record of, through apply_changes so that the products are converted
+        to the statistics unit and the tracked statistics are refreshed.
+
+        :param other: ProductData or list of products, in the declared unit.
+        :return: The instance, to allow chaining.
+        """
+        other = other if isinstance(other, ProductData) else ProductData(other)
+        columns = ['unique_product_uuid_v2', 'updated']
+        keys = pd.concat([self.dataframe.reindex(columns=columns), expand_dataframe(other.dataframe.reindex(columns=columns))],
+                         ignore_index=True)
+        positions = get_latest_positions(keys)
+        newer = positions[positions >= len(self.dataframe)] - len(self.dataframe)
+        if len(newer):
+            changed_df = other.dataframe.iloc[newer]
+            self.apply_changes(ProductData(expand_dataframe(changed_df) if other.compact_options is not None else changed_df))
+        return self
+
+    def get_statistics_sketch(self, group_by=None, fields=None, include_estimated_values=False, k=200, seed=0):
+        """
+        Builds a mergeable StatisticsSketch of the data. Sketches of different chunks or snapshots
+        can be merged and give approximate statistics in bounded memory (see aecdata.sketches).
+
+        :param k: Accuracy parameter of the quantile sketches, see sketches.normalized_rank_error.
+        :return: A StatisticsSketch.
+        """
+        if fields is None or fields == 'all':
+            fields = self.get_available_fields()
+        return StatisticsSketch(group_by, fields, include_estimated_values, k, seed).update(self.dataframe)
+
+    def simulate_totals(self, products_info, field, group_by=None, n_samples=10000, percentiles=(5, 50, 95), distribution='quartiles',
+                        uncertain='estimated', include_estimated_values=False, remove_outliers=True, method='IQR', sqrt_tranf=True,
+                        min_count=4, seed=None, return_samples=False):
+        """
+        Propagates the uncertainty of the products of a bill of quantities to its total with
+        Monte Carlo sampling.
+
+        The value per unit of the field of the uncertain lines is drawn from the distribution of
+        the field in the group of the product (e.g. its product_type), fitted from the same
+        statistics as get_statistics. The other lines keep the value of their product.
+
+        :param products_info: dict with product ids as keys and values a dictionary with unit and
+                              amount, as in get_product_contributions.
+        :param field: The field to total e.g. 'material_facts.manufacturing'.
+        :param group_by: The list of columns defining the groups. If None, group by 'product_type'.
+        :param n_samples: The number of samples of the total.
+        :param percentiles: The percentiles of the total to return.
+        :param distribution: 'quartiles' (piecewise linear between the minimum, quartiles and maximum),
+                             'normal' or 'lognormal' (from the mean and standard deviation).
+        :param uncertain: 'estimated' to sample the lines with an estimated scaling factor, generic data
+                          (certificate_subtype) or no value, 'all' to sample every line.
+        :param seed: Seed of the random generator, for reproducible results.
+        :param return_samples: Whether to also return the array of sampled totals.
+        :return: Series with the 'point_total' (sum of the values of the products), the 'mean' and
+                 'standard_deviation' of the samples and their percentiles e.g. 'p5'.
+                 With return_samples, a tuple (Series, samples).
+        """
+        df = self.dataframe
+        if field not in df.columns:
+            raise ValueError(f'Field "{field}" not available.')
+        if uncertain not in ('estimated', 'all'):
+            raise ValueError('uncertain must be "estimated" or "all".')
+        if group_by is None:
+            group_by = ['product_type']
+
+        # Line quantities in the unit of this instance, lines of unknown products or units are skipped
+        first_positions = pd.Series(np.arange(len(df)), index=df['unique_product_uuid_v2'].to_numpy())
+        first_positions = first_positions[~first_positions.index.duplicated()]
+        uuids = np.array(list(products_info), dtype=object)
+        units = np.array([info.get('unit', 'declared_unit') for info in products_info.values()], dtype=object)
+        amounts = np.array([info.get('amount', 1) for info in products_info.values()], dtype=float)
+        positions = first_positions.reindex(uuids).to_numpy(dtype=float)
+        for uuid in uuids[np.isnan(positions)]:
+            print(f"Product UUID '{uuid}' not found in DataFrame.")
+        found = ~np.isnan(positions)
+        uuids, units, amounts, positions = uuids[found], units[found], amounts[found], positions[found].astype(np.int64)
+
+        unit_factors = np.full(len(positions), np.nan)
+        is_estimated = np.zeros(len(positions), dtype=bool)
+        for unit in set(units):
+            lines = units == unit
+            unit_factors[lines] = self.get_scaling_factors(df, unit)[positions[lines]]
+            estimated_column = f'material_facts.scaling_factors.{unit}.estimated'
+            if unit != 'declared_unit' and estimated_column in df.columns:
+                is_estimated[lines] = df[estimated_column].to_numpy()[positions[lines]] == True
+        with np.errstate(divide='ignore', invalid='ignore'):
+            quantities = amounts * self.get_scaling_factors(df, self.unit)[positions] / unit_factors
+        for uuid, unit in zip(uuids[np.isnan(quantities)], units[np.isnan(quantities)]):
+            print(f"Scaling to unit '{unit}' failed for product {uuid}.")
+        scaled = ~np.isnan(quantities)
+        positions, quantities, is_estimated = positions[scaled], quantities[scaled], is_estimated[scaled]
+        line_values = df[field].to_numpy(dtype=float)[positions] * quantities
+
+        if uncertain == 'all':
+            is_uncertain = np.ones(len(positions), dtype=bool)
+        else:
+            subtypes = df['material_facts.certificate_subtype'].to_numpy()[positions] if 'material_facts.certificate_subtype' in df.columns else [None] * len(positions)
+            is_generic = np.array([subtype_to_epdx.get(subtype) == 'Generic' for subtype in subtypes], dtype=bool)
+            is_uncertain = is_estimated | is_generic | np.isnan(line_values)
+
+        # Distribution of the field in every group
+        statistics_df = df if include_estimated_values else df[df['estimated'] == False]
+        group_positions, group_codes, groups_df = get_group_codes(statistics_df, group_by, min_count)
+        _, statistics = get_group_statistics(
+            statistics_df[[field]].to_numpy(dtype=float)[group_positions], group_codes, len(groups_df),
+            ['mean', 'standard_deviation', 'minimum', 'quartiles'], remove_outliers, method, sqrt_tranf, min_count)
+        quantiles = np.full((len(groups_df), 5), np.nan)
+        quantiles[:, 0] = statistics['minimum'][:, 0]
+        for group, group_quartiles in enumerate(statistics['quartiles'][:, 0]):
+            if isinstance(group_quartiles, np.ndarray):
+                quantiles[group, 1:] = group_quartiles
+        mean, standard_deviation = statistics['mean'][:, 0], statistics['standard_deviation'][:, 0]
+        has_distribution = ~np.isnan(quantiles).any(axis=1) if distribution == 'quartiles' else ~np.isnan(mean)
+
+        # Group of every product, the first of its groups with a distribution
+        row_positions, row_codes, row_groups_df = get_group_codes(df, group_by)
+        group_index = groups_df[group_by].assign(group=np.arange(len(groups_df)))
+        row_groups = row_groups_df[group_by].merge(group_index, how='left', on=group_by)['group'].fillna(-1).to_numpy(dtype=np.int64)[row_codes]
+        valid = row_groups >= 0
+        valid[valid] = has_distribution[row_groups[valid]]
+        product_groups = np.full(len(df), -1, dtype=np.int64)
+        product_groups[row_positions[valid][::-1]] = row_groups[valid][::-1]
+        line_groups = product_groups[positions]
+
+        is_sampled = is_uncertain & (line_groups >= 0)
+        if (is_uncertain & ~is_sampled).any():
+            warnings.warn(f'{(is_uncertain & ~is_sampled).sum()} uncertain lines have no distribution in their group '
+                          f'and keep the value of their product.', UserWarning)
+
+        sampled_groups = line_groups[is_sampled]
+        samples = sample_totals(quantities[is_sampled], n_samples, distribution, mean=mean[sampled_groups],
+                                standard_deviation=standard_deviation[sampled_groups], quantiles=quantiles[sampled_groups],
+                                fixed_total=np.nansum(line_values[~is_sampled]), seed=seed)
+
+        summary = {'point_total': np.nansum(line_values), 'mean': samples.mean(), 'standard_deviation': samples.std(ddof=1) if n_samples > 1 else np.nan}
+        for percentile, value in zip(percentiles, np.percentile(samples, percentiles)):
+            summary[f'p{percentile:g}'] = value
+        summary = pd.Series(summary, name=field)
+        return (summary, samples) if return_samples else summary
+
+    def remove_outliers_from_df(self, filtered_df, field, method, sqrt_tranf):
+        values = filtered_df[field].to_numpy(dtype=float)
+        keep, _ = get_outlier_masks(values, np.zeros(len(values), dtype=int), method, sqrt_tranf)
+        return filtered_df[keep[:, 0]]
 
     def filter_dataframe_based_on_field(self, field, filters=None, include_estimated_values=False, remove_outliers=True, method='IQR', sqrt_tranf=True):
 
@@ -852,6 +1355,7 @@ class ProductStatistics(ProductData):
 
         return df.reset_index(drop=True)
 
+    @memoized()
     def get_field_distribution(self, field, filters=None, include_estimated_values=False, remove_outliers=True, method='IQR', sqrt_tranf=True):
         df = self.filter_dataframe_based_on_field(field, filters, include_estimated_values, remove_outliers, method, sqrt_tranf)
         return df
@@ -864,14 +1368,21 @@ class ProductStatistics(ProductData):
 
         # Get unique values for the group_by_field column
         group_by_dict = self.get_group_by_dict(df, [group_by_field])
+        group_values = list(group_by_dict[group_by_field])
+
+        # Code each row with the position of its value, rows only match non-list values by equality
+        value_codes = {value: code for code, value in enumerate(group_values) if not pd.isna(value)}
+        codes = np.fromiter((-1 if isinstance(x, list) else value_codes.get(x, -1) for x in df[group_by_field]),
+                            dtype=np.int64, count=len(df))
 
         # Create a boxplot for each unique value in the group_by_field column
-        # grouped_data = [df[df[group_by_field] == value][field] for value in group_by_dict[group_by_field]]
-        grouped_data_dict = {value: df[df[group_by_field] == value][field] for value in group_by_dict[group_by_field]}
+        group_positions = get_group_positions(codes, len(group_values))
+        grouped_data_dict = {value: df[field].iloc[positions] for value, positions in zip(group_values, group_positions)}
 
         return grouped_data_dict
 
 
+    @memoized()
     def get_field_distribution_boxplot(self, field, group_by_field, filters=None, include_estimated_values=False, remove_outliers=True, method='IQR', sqrt_tranf=True):
         df = self.filter_dataframe_based_on_field(field, filters, include_estimated_values, remove_outliers, method, sqrt_tranf)
         # After preparing and filtering the DataFrame, plot it
@@ -0,0 +1,199 @@
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+# Profilers recording the stages, stages cost nothing when the list is empty
+_active_profilers = []
+_null_stage = contextlib.nullcontext()
+
+
+class Profiler:
+    """
+    Records the wall time, rows and peak memory of the internal stages of ProductData and
+    ProductStatistics (json_normalize, unit conversion, grouping, statistics...).
+
+        with profile(memory=True) as profiler:
+            statistics = ProductStatistics(products, unit='kg').get_statistics()
+        print(profiler.table())
+        profiler.to_chrome_trace('trace.json')
+    """
+
+    def __init__(self, memory=False):
+        """
+        :param memory: Whether to record the peak memory allocated during every stage, with
+                       tracemalloc. It slows down the profiled code.
+        """
+        self.memory = memory
+        self.records = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started_tracemalloc = False
+        self.origin = None
+
+    def start(self):
+        if self in _active_profilers:
+            return self
+        self.origin = time.perf_counter()
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracemalloc = True
+        _active_profilers.append(self)
+        return self
+
+    def stop(self):
+        if self in _active_profilers:
+            _active_profilers.remove(self)
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+            self.started_tracemalloc = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def enter(self, name, rows=None):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        frame = {'name': name, 'rows': rows, 'depth': len(stack), 'memory': 0, 'peak': 0}
+        if self.memory:
+            # The peak so far belongs to the enclosing stages, it is reset for this one
+            current, peak = tracemalloc.get_traced_memory()
+            for parent in stack:
+                parent['peak'] = max(parent['peak'], peak)
+            tracemalloc.reset_peak()
+            frame['memory'] = frame['peak'] = current
+        stack.append(frame)
+        frame['start'] = time.perf_counter()
+        return frame
+
+    def exit(self, frame):
+        end = time.perf_counter()
+        stack = self.local.stack
+        stack.remove(frame)
+        peak_memory = None
+        if self.memory:
+            frame['peak'] = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+            for parent in stack:
+                parent['peak'] = max(parent['peak'], frame['peak'])
+            peak_memory = frame['peak'] - frame['memory']
+        with self.lock:
+            self.records.append({
+                'stage': frame['name'],
+                'start': frame['start'] - self.origin,
+                'duration': end - frame['start'],
+                'rows': frame['rows'],
+                'peak_memory': peak_memory,
+                'depth': frame['depth'],
+                'thread': threading.get_ident(),
+            })
+
+    def table(self):
+        """
+        Returns a DataFrame with one row per stage: the number of calls, the total, mean and
+        maximum wall time in seconds, the rows processed and the maximum peak memory in bytes
+        allocated above the memory at the start of the stage, sorted by total time.
+        """
+        columns = ['stage', 'calls', 'total_seconds', 'mean_seconds', 'max_seconds', 'rows', 'peak_memory']
+        if not self.records:
+            return pd.DataFrame(columns=columns)
+        records = pd.DataFrame(self.records)
+        records['rows'] = pd.to_numeric(records['rows'])
+        records['peak_memory'] = pd.to_numeric(records['peak_memory'])
+        table = records.groupby('stage', sort=False).agg(
+            calls=('duration', 'size'),
+            total_seconds=('duration', 'sum'),
+            mean_seconds=('duration', 'mean'),
+            max_seconds=('duration', 'max'),
+            rows=('rows', lambda rows: rows.sum(min_count=1)),
+            peak_memory=('peak_memory', 'max'),
+        ).reset_index()
+        if not self.memory:
+            table['peak_memory'] = None
+        return table[columns].sort_values('total_seconds', ascending=False, ignore_index=True)
+
+    def to_chrome_trace(self, path=None):
+        """
+        Returns the stages in the Trace Event Format, which chrome://tracing and Perfetto open.
+
+        :param path: If given, the trace is also saved to this JSON file.
+        :return: dict with the 'traceEvents'.
+        """
+        pid = os.getpid()
+        events = []
+        for record in sorted(self.records, key=lambda record: record['start']):
+            args = {'rows': record['rows']}
+            if record['peak_memory'] is not None:
+                args['peak_memory'] = record['peak_memory']
+            events.append({
+                'name': record['stage'],
+                'cat': record['stage'].split('.')[0],
+                'ph': 'X',
+                'ts': record['start'] * 1e6,
+                'dur': record['duration'] * 1e6,
+                'pid': pid,
+                'tid': record['thread'],
+                'args': args,
+            })
+        trace = {'traceEvents': events, 'displayTimeUnit': 'ms'}
+        if path is not None:
+            with open(path, 'w') as f:
+                json.dump(trace, f)
+        return trace
+
+
+class Stage:
+    def __init__(self, name, rows):
+        self.name = name
+        self.rows = rows
+        self.frames = None
+
+    def __enter__(self):
+        self.frames = [(profiler, profiler.enter(self.name, self.rows)) for profiler in _active_profilers]
+        return self
+
+    def __exit__(self, *exc_info):
+        for profiler, frame in self.frames:
+            profiler.exit(frame)
+
+
+def profile(memory=False):
+    """
+    Starts recording the stages, use as a context manager or call stop() on the result.
+
+    :param memory: Whether to record the peak memory of every stage.
+    :return: The Profiler.
+    """
+    return Profiler(memory).start()
+
+
+def stage(name, rows=None):
+    """Context manager recording a stage in the active profilers."""
+    if not _active_profilers:
+        return _null_stage
+    return Stage(name, rows)
+
+
+def profiled(name, rows=None):
+    """
+    Decorator recording every call of a function as a stage.
+
+    :param rows: Optional function of the arguments of the call returning the rows processed.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _active_profilers:
+                return function(*args, **kwargs)
+            with Stage(name, rows(*args, **kwargs) if rows is not None else None):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
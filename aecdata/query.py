@@ -0,0 +1,183 @@
+import numpy as np
+import pandas as pd
+
+comparison_operators = {
+    '==': np.equal,
+    '!=': np.not_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+    '>': np.greater,
+    '>=': np.greater_equal,
+}
+operators = set(comparison_operators) | {'between', 'in', 'not in', 'isna', 'notna'}
+# Operators of list columns: '==' and 'in' match the lists containing the value(s)
+list_operators = {'==', '!=', 'in', 'not in', 'isna', 'notna'}
+
+
+def is_list_column(series):
+    return series.dtype == object and any(isinstance(x, list) for x in series.to_numpy())
+
+
+def parse_condition(condition):
+    """
+    Splits a condition into (operator, arguments). Plain values are matched as in
+    filter_df_by_dict: a list means membership and any other value equality.
+    """
+    if isinstance(condition, tuple) and condition and condition[0] in operators:
+        return condition[0], condition[1:]
+    if isinstance(condition, list):
+        return 'in', (condition,)
+    return '==', (condition,)
+
+
+class ColumnIndex:
+    """
+    Index of a column for query. Numerical columns are kept sorted, so range conditions are
+    two binary searches, and other columns map every value (or list item) to its rows.
+    """
+
+    def __init__(self, series):
+        values = series.to_numpy()
+        self.is_list = is_list_column(series)
+        self.sorted_values = None
+        self.value_positions = None
+        if not self.is_list:
+            try:
+                numbers = np.asarray(values, dtype=float)
+            except (TypeError, ValueError):
+                numbers = None
+            if numbers is not None:
+                valid = np.flatnonzero(~np.isnan(numbers))
+                order = np.argsort(numbers[valid], kind='stable')
+                self.sorted_values, self.sorted_positions = numbers[valid][order], valid[order]
+                return
+            items, rows = values, np.arange(len(values))
+        else:
+            lengths = np.fromiter((len(x) if isinstance(x, list) else 1 for x in values), dtype=np.int64, count=len(values))
+            items = [item for x in values for item in (x if isinstance(x, list) else [x])]
+            rows = np.repeat(np.arange(len(values)), lengths)
+        items = pd.Series(items, dtype=object)
+        positions = items.groupby(items, sort=False, dropna=True).indices
+        self.value_positions = {value: np.unique(rows[items_]) for value, items_ in positions.items()}
+
+    def lookup(self, operator, arguments):
+        """
+        :return: The sorted row positions matching the condition, or None if the index can not
+                 answer it.
+        """
+        if self.sorted_values is not None:
+            if not all(isinstance(argument, (int, float, np.number)) for argument in arguments):
+                return None
+            values = self.sorted_values
+            if operator == 'between':
+                start, stop = np.searchsorted(values, arguments[0], 'left'), np.searchsorted(values, arguments[1], 'right')
+            elif operator == '==':
+                start, stop = np.searchsorted(values, arguments[0], 'left'), np.searchsorted(values, arguments[0], 'right')
+            elif operator in ('<', '<='):
+                start, stop = 0, np.searchsorted(values, arguments[0], 'left' if operator == '<' else 'right')
+            elif operator in ('>', '>='):
+                start, stop = np.searchsorted(values, arguments[0], 'right' if operator == '>' else 'left'), len(values)
+            else:
+                return None
+            return np.sort(self.sorted_positions[start:stop])
+
+        if operator in ('==', 'in'):
+            values = arguments[0] if operator == 'in' else [arguments[0]]
+            matches = [self.value_positions[value] for value in values if value in self.value_positions]
+            return np.unique(np.concatenate(matches)) if matches else np.zeros(0, dtype=np.int64)
+        return None
+
+
+class Predicate:
+    """A condition on a column, evaluated on the rows that passed the previous conditions."""
+
+    def __init__(self, df, column, condition):
+        if column not in df.columns:
+            raise ValueError(f'Column "{column}" not available.')
+        self.column = column
+        self.operator, self.arguments = parse_condition(condition)
+        if self.operator == 'between' and len(self.arguments) != 2:
+            raise ValueError(f'"between" needs a lower and an upper bound, got {self.arguments}.')
+        self.values = df[column].to_numpy()
+        self.is_list = is_list_column(df[column])
+        # Items of lists are only matched by membership
+        if self.is_list and self.operator not in list_operators:
+            raise ValueError(f'"{self.operator}" is not supported on the list column "{column}", use one of {sorted(list_operators)}.')
+        self.is_numerical = self.operator in comparison_operators and self.operator not in ('==', '!=') or self.operator == 'between'
+        self.is_numerical = self.is_numerical and all(isinstance(argument, (int, float, np.number)) for argument in self.arguments)
+
+        # Relative cost per row, the cheapest conditions are evaluated first
+        if self.is_list:
+            self.cost = 10
+        elif df[column].dtype.kind in 'fiub' or isinstance(df[column].dtype, pd.CategoricalDtype):
+            self.cost = 1
+        elif self.operator in ('isna', 'notna') or self.is_numerical:
+            self.cost = 2
+        else:
+            self.cost = 3
+
+    def evaluate(self, positions):
+        """:return: Boolean mask of the rows at positions matching the condition."""
+        values = self.values[positions]
+        operator, arguments = self.operator, self.arguments
+
+        if operator in ('isna', 'notna'):
+            missing = pd.isna(values)
+            return missing if operator == 'isna' else ~missing
+        if self.is_list:
+            items = set(arguments[0]) if operator in ('in', 'not in') else {arguments[0]}
+            mask = np.fromiter((any(item in items for item in x) if isinstance(x, list) else x in items for x in values),
+                               dtype=bool, count=len(values))
+            return ~mask if operator in ('!=', 'not in') else mask
+        if operator in ('in', 'not in'):
+            mask = pd.Series(values).isin(arguments[0]).to_numpy()
+            return ~mask if operator == 'not in' else mask
+
+        if self.is_numerical:
+            values = np.asarray(values, dtype=float)
+            with np.errstate(invalid='ignore'):
+                if operator == 'between':
+                    return (values >= arguments[0]) & (values <= arguments[1])
+                return comparison_operators[operator](values, arguments[0])
+
+        # Comparisons of other values (e.g. dates as text), missing values never match
+        series = pd.Series(values)
+        present = series.notna().to_numpy()
+        mask = np.zeros(len(values), dtype=bool)
+        if operator == 'between':
+            mask[present] = ((series[present] >= arguments[0]) & (series[present] <= arguments[1])).to_numpy()
+        else:
+            mask[present] = comparison_operators[operator](series[present], arguments[0]).to_numpy()
+        if operator == '!=':
+            mask[~present] = True
+        return mask
+
+
+def query_positions(df, conditions, indexes=None):
+    """
+    Finds the rows of the DataFrame matching all the conditions.
+
+    Conditions answered by a column index are applied first, then the others from the
+    cheapest, each on the rows left by the previous ones, stopping when no row is left.
+
+    :param conditions: dict mapping columns to conditions, see ProductData.query.
+    :param indexes: dict mapping columns to their ColumnIndex.
+    :return: The sorted row positions.
+    """
+    if indexes is None:
+        indexes = {}
+    positions = np.arange(len(df))
+    predicates = []
+    for column, condition in conditions.items():
+        operator, arguments = parse_condition(condition)
+        matches = indexes[column].lookup(operator, arguments) if column in indexes else None
+        if matches is None:
+            predicates.append(Predicate(df, column, condition))
+        else:
+            positions = np.intersect1d(positions, matches, assume_unique=True)
+
+    for predicate in sorted(predicates, key=lambda predicate: predicate.cost):
+        if not len(positions):
+            break
+        positions = positions[predicate.evaluate(positions)]
+    return positions
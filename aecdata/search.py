@@ -0,0 +1,130 @@
+import warnings
+import numpy as np
+import pandas as pd
+from .utils import physical_properties_fields
+from .groupstats import get_group_codes
+
+# Properties used to measure how similar two products are
+alternative_features = physical_properties_fields + ['mass_per_declared_unit', 'thermal_conductivity', 'compression_strength']
+
+
+class AlternativesIndex:
+    """
+    Nearest-neighbour index to find similar products with a lower impact.
+
+    Products are partitioned by product type and declared unit (partition_by), and within
+    each partition they are compared on their normalised properties (features): the logarithm
+    of each property, standardised over all the products. The distance between two products
+    is the mean squared difference over the properties both products have.
+
+    The features of every partition are stored as one array, so a query is a vectorized
+    scan of the partition of the product.
+    """
+
+    def __init__(self, df, features=None, partition_by=None, source_unit='declared_unit'):
+        """
+        :param df: The DataFrame of the products.
+        :param features: The properties to compare. If None, use alternative_features.
+        :param partition_by: The columns partitioning the products. If None, use
+                             ['product_type', 'material_facts.declared_unit'].
+        :param source_unit: The unit in which the values of df are expressed.
+        """
+        if features is None:
+            features = alternative_features
+        if partition_by is None:
+            partition_by = ['product_type', 'material_facts.declared_unit']
+        self.df = df
+        self.features = [feature for feature in features if feature in df.columns]
+        self.partition_by = list(partition_by)
+        self.source_unit = source_unit
+
+        # Normalised features, non-positive and non-numeric values are treated as missing
+        values = np.column_stack([pd.to_numeric(df[feature], errors='coerce').to_numpy(dtype=float) for feature in self.features]) \
+            if self.features else np.zeros((len(df), 0))
+        with np.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+            # Features without any value give empty slice warnings
+            warnings.simplefilter('ignore', RuntimeWarning)
+            values = np.log(np.where(values > 0, values, np.nan))
+            values = (values - np.nanmean(values, axis=0)) / np.nanstd(values, axis=0)
+        values[~np.isfinite(values)] = np.nan
+
+        positions, codes, self.partitions = get_group_codes(df, self.partition_by)
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(self.partitions) + 1))
+        self.partition_positions = [positions[order[start:stop]] for start, stop in zip(bounds[:-1], bounds[1:])]
+        self.partition_features = [np.nan_to_num(values[p]) for p in self.partition_positions]
+        self.partition_present = [~np.isnan(values[p]) for p in self.partition_positions]
+
+        # Partitions of every product, sorted by row position
+        order = np.argsort(positions, kind='stable')
+        self.membership_positions, self.membership_partitions = positions[order], codes[order]
+        uuids = df['unique_product_uuid_v2'].to_numpy()
+        self.product_positions = dict(zip(uuids[::-1], np.arange(len(df))[::-1]))
+        self.unit_values = {}
+
+    def get_unit_values(self, unit, field):
+        """Returns the values of the field in the unit for all the products, NaN where not available."""
+        key = (unit, field)
+        if key not in self.unit_values:
+            def get_scaling_factors(unit):
+                if unit == 'declared_unit':
+                    return np.ones(len(self.df))
+                column = f'material_facts.scaling_factors.{unit}.value'
+                if column not in self.df.columns:
+                    raise ValueError(f'Unit "{unit}" not available.')
+                return self.df[column].to_numpy(dtype=float)
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                values = self.df[field].to_numpy(dtype=float) * get_scaling_factors(self.source_unit) / get_scaling_factors(unit)
+            values[~np.isfinite(values)] = np.nan
+            self.unit_values[key] = values
+        return self.unit_values[key]
+
+    def query(self, uuid, k=5, unit='kg', field='material_facts.total_co2e_kg_mf'):
+        """
+        Finds the k products most similar to a product with a lower value of the field in the unit.
+
+        :return: tuple (positions, distances, values) with the row positions of the alternatives,
+                 their distance to the product and their value of the field in the unit,
+                 ordered by distance and then value.
+        """
+        if uuid not in self.product_positions:
+            raise ValueError(f"Product UUID '{uuid}' not found in DataFrame.")
+        if field not in self.df.columns:
+            raise ValueError(f'Field "{field}" not available.')
+        position = self.product_positions[uuid]
+        unit_values = self.get_unit_values(unit, field)
+        if np.isnan(unit_values[position]):
+            raise ValueError(f"Product '{uuid}' has no {field} value in {unit}.")
+
+        results = []
+        start, stop = np.searchsorted(self.membership_positions, [position, position + 1])
+        for partition in self.membership_partitions[start:stop]:
+            positions = self.partition_positions[partition]
+            features, present = self.partition_features[partition], self.partition_present[partition]
+            row = np.searchsorted(positions, position)
+            query_features, query_present = features[row], present[row]
+
+            values = unit_values[positions]
+            with np.errstate(invalid='ignore'):
+                candidates = np.flatnonzero(values < unit_values[position])
+            common = present[candidates] & query_present
+            n_common = common.sum(axis=1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                distances = np.where(common, features[candidates] - query_features, 0) ** 2
+                distances = np.where(n_common > 0, distances.sum(axis=1) / n_common, np.inf)
+            results.append((positions[candidates], distances, values[candidates]))
+
+        if not results:
+            return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)
+        positions, distances, values = (np.concatenate(arrays) for arrays in zip(*results))
+        # A product in several partitions of the query is kept once
+        positions, first = np.unique(positions, return_index=True)
+        distances, values = distances[first], values[first]
+        if len(positions) > k:
+            nearest = np.argpartition(distances, k - 1)[:k]
+            # Keep the ties at the k-th distance that have the lowest values
+            nearest = np.flatnonzero(distances <= distances[nearest].max())
+            positions, distances, values = positions[nearest], distances[nearest], values[nearest]
+        order = np.lexsort((values, distances))[:k]
+        return positions[order], distances[order], values[order]
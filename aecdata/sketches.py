@@ -0,0 +1,387 @@
+import copy
+import numpy as np
+import pandas as pd
+from .groupstats import get_group_codes, get_statistics_df
+from .outliers import zscore_threshold, repeated_zscore_max, iqr_multiplier
+
+
+def normalized_rank_error(k):
+    """
+    Returns the normalized rank error of a KLLSketch with parameter k, i.e. the error of
+    quantile(q) expressed as a fraction of the number of values: the true rank of the
+    returned value is within q +/- error with 99% confidence. This is the empirical bound
+    published for KLL sketches by Apache DataSketches, e.g. ~1.3% for k=200 and ~0.3% for k=1000.
+    """
+    return 2.296 / k ** 0.9723
+
+
+class KLLSketch:
+    """
+    Mergeable quantile sketch (Karnin, Lang & Liberty, 2016).
+
+    Values are kept in compactors of increasing weight. When a compactor exceeds its
+    capacity it is sorted and every other value is promoted to the next compactor with
+    twice the weight, so memory stays in O(k) regardless of how many values are added.
+    As long as fewer than ~k values have been added no compaction happens and quantiles
+    are exact. The accuracy is given by normalized_rank_error(k).
+    """
+
+    min_capacity = 8
+    capacity_ratio = 2 / 3
+
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.rng = np.random.default_rng(seed)
+        self.compactors = [np.empty(0)]
+        self.n = 0
+
+    def _capacity(self, level):
+        depth = len(self.compactors) - level - 1
+        return max(self.min_capacity, int(np.ceil(self.k * self.capacity_ratio ** depth)))
+
+    def _compress(self):
+        level = 0
+        while level < len(self.compactors):
+            items = self.compactors[level]
+            if len(items) <= self._capacity(level):
+                level += 1
+                continue
+            if level + 1 == len(self.compactors):
+                self.compactors.append(np.empty(0))
+            items = np.sort(items)
+            # With an odd number of items the largest one stays at this level
+            n_compacted = len(items) - len(items) % 2
+            promoted = items[self.rng.integers(2):n_compacted:2]
+            self.compactors[level] = items[n_compacted:]
+            self.compactors[level + 1] = np.concatenate((self.compactors[level + 1], promoted))
+            # Adding a level lowers the capacity of the ones below it
+            level = 0
+
+    def update(self, values):
+        """
+        Adds values to the sketch, NaN values are ignored.
+
+        :param values: A scalar or array-like of values.
+        :return: The sketch.
+        """
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.n += len(values)
+            self.compactors[0] = np.concatenate((self.compactors[0], values))
+            self._compress()
+        return self
+
+    def merge(self, other):
+        """
+        Merges another sketch into this one, as if its values had been added to this sketch.
+
+        :param other: A KLLSketch.
+        :return: The sketch.
+        """
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append(np.empty(0))
+        for level, items in enumerate(other.compactors):
+            self.compactors[level] = np.concatenate((self.compactors[level], items))
+        self.n += other.n
+        self._compress()
+        return self
+
+    def get_weighted_values(self):
+        """
+        :return: tuple (values, weights) sorted by value. The weights add up to the number of values added.
+        """
+        values = np.concatenate(self.compactors)
+        weights = np.concatenate([np.full(len(items), 2.0 ** level) for level, items in enumerate(self.compactors)])
+        order = np.argsort(values, kind='stable')
+        return values[order], weights[order]
+
+    def quantile(self, q):
+        """
+        Estimates quantiles with linear interpolation (exact while no compaction happened).
+
+        :param q: A quantile or array of quantiles between 0 and 1.
+        :return: The estimated value(s), NaN if the sketch is empty.
+        """
+        values, weights = self.get_weighted_values()
+        return weighted_quantile(values, weights, q)
+
+    def __len__(self):
+        return self.n
+
+
+def weighted_quantile(values, weights, q):
+    """
+    Quantiles of sorted values where each value stands for `weight` identical values. With
+    unit weights this is the same as numpy/pandas linear interpolation.
+    """
+    if not len(values):
+        return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+    # Each value covers the ranks [start, start + weight - 1], place it at the middle
+    ends = np.cumsum(weights)
+    centers = ends - (weights + 1) / 2
+    return np.interp(np.asarray(q, dtype=float) * (ends[-1] - 1), centers, values)
+
+
+class RunningMoments:
+    """
+    Exact count, mean, variance, minimum and maximum of a stream of values, mergeable
+    across chunks and workers (Chan et al. parallel variance).
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.n_negative = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = np.nan
+        self.maximum = np.nan
+
+    def _combine(self, n, n_negative, mean, m2, minimum, maximum):
+        total = self.n + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta ** 2 * self.n * n / total
+        self.n = total
+        self.n_negative += n_negative
+        self.minimum = np.fmin(self.minimum, minimum)
+        self.maximum = np.fmax(self.maximum, maximum)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if len(values):
+            mean = values.mean()
+            self._combine(len(values), int((values < 0).sum()), mean, float(((values - mean) ** 2).sum()),
+                          values.min(), values.max())
+        return self
+
+    def merge(self, other):
+        if other.n:
+            self._combine(other.n, other.n_negative, other.mean, other.m2, other.minimum, other.maximum)
+        return self
+
+    @property
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else np.nan
+
+
+class FieldSketch:
+    """
+    Running moments and a quantile sketch of the values of one field within one group.
+    """
+
+    def __init__(self, k=200, seed=None):
+        self.moments = RunningMoments()
+        self.sketch = KLLSketch(k, seed)
+
+    def update(self, values):
+        self.moments.update(values)
+        self.sketch.update(values)
+        return self
+
+    def merge(self, other):
+        self.moments.merge(other.moments)
+        self.sketch.merge(other.sketch)
+        return self
+
+    def get_kept_values(self, method='IQR', sqrt_tranf=True):
+        """
+        Applies the outlier removal of get_statistics to the values retained by the sketch.
+
+        :return: tuple (values, weights) of the values that are not outliers.
+        """
+        values, weights = self.sketch.get_weighted_values()
+        transformed = values
+        if sqrt_tranf:
+            # The majority sign is known exactly from the moments
+            sign = -1.0 if self.moments.n_negative > self.moments.n / 2 else 1.0
+            transformed = sign * values
+            keep = transformed >= 0
+            values, weights, transformed = values[keep], weights[keep], np.sqrt(transformed[keep])
+            if sign < 0:
+                # Keep the transformed values sorted
+                values, weights, transformed = values[::-1], weights[::-1], transformed[::-1]
+
+        def zscores(keep):
+            w = weights[keep]
+            mean = np.average(transformed[keep], weights=w)
+            std = np.sqrt(np.sum(w * (transformed[keep] - mean) ** 2) / (w.sum() - 1)) if w.sum() > 1 else np.nan
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return np.abs((transformed - mean) / std)
+
+        keep = np.ones(len(values), dtype=bool)
+        if not len(values):
+            pass
+        elif method == 'zscore':
+            keep &= ~(zscores(keep) > zscore_threshold)
+        elif method == 'repeated_zscore':
+            z_max = np.inf
+            while z_max > repeated_zscore_max and keep.any():
+                z_scores = np.where(keep, zscores(keep), np.nan)
+                keep &= ~(z_scores > zscore_threshold)
+                z_max = np.nanmax(z_scores) if not np.isnan(z_scores).all() else np.nan
+        elif method == 'IQR':
+            Q1, Q3 = weighted_quantile(transformed, weights, [0.25, 0.75])
+            IQR = Q3 - Q1
+            keep &= (transformed >= Q1 - iqr_multiplier * IQR) & (transformed <= Q3 + iqr_multiplier * IQR)
+
+        values, weights = values[keep], weights[keep]
+        order = np.argsort(values, kind='stable')
+        return values[order], weights[order]
+
+    def get_statistics(self, statistical_metrics, remove_outliers=True, method='IQR', sqrt_tranf=True, min_count=4):
+        """
+        Approximates the statistics computed by get_statistics. Without outlier removal
+        count, mean, standard deviation, minimum and maximum are exact and only the
+        quantiles are estimated. With outlier removal all metrics are computed from the
+        values retained by the sketch.
+
+        :return: dict mapping each metric to its value or None if fewer than min_count values remain.
+        """
+        if remove_outliers:
+            values, weights = self.get_kept_values(method, sqrt_tranf)
+            count = weights.sum()
+            if count < min_count:
+                return {metric: None for metric in statistical_metrics}
+            mean = np.average(values, weights=weights)
+            std = np.sqrt(np.sum(weights * (values - mean) ** 2) / (count - 1)) if count > 1 else np.nan
+            minimum, maximum = values[0], values[-1]
+        else:
+            values, weights = self.sketch.get_weighted_values()
+            moments = self.moments
+            count, mean, std, minimum, maximum = moments.n, moments.mean, np.sqrt(moments.variance), moments.minimum, moments.maximum
+            if count < min_count:
+                return {metric: None for metric in statistical_metrics}
+
+        Q1, median, Q3 = weighted_quantile(values, weights, [0.25, 0.5, 0.75])
+        field_statistics = {
+            'count': int(round(count)),
+            'mean': float(mean),
+            'median': float(median),
+            'standard_deviation': float(std),
+            'minimum': float(minimum),
+            'maximum': float(maximum),
+            'quartiles': np.array([float(Q1), float(median), float(Q3), float(maximum)]),
+            'coefficient_of_variation': float(std / mean) if mean else None,
+            'range': float(maximum - minimum),
+        }
+        return {metric: field_statistics[metric] for metric in statistical_metrics}
+
+
+class StatisticsSketch:
+    """
+    Bounded-memory, approximate version of ProductStatistics.get_statistics.
+
+    Keeps, for every group_by combination and field, exact running moments and a KLL quantile
+    sketch. DataFrames (e.g. pages, chunks or snapshots in the ProductStatistics format, with an
+    'estimated' column) are folded in with update() and partial sketches built by different
+    workers are combined with merge(). Memory grows with the number of groups and fields, not
+    with the number of products.
+
+    The quantile error is configured with k, see normalized_rank_error(k). outlier_ids are not
+    tracked.
+
+    Usage:
+        sketch = StatisticsSketch(group_by=['product_type'], fields=fields, k=400)
+        for page in pages:
+            sketch.update(ProductStatistics(page, unit='kg').dataframe)
+        statistics_df = sketch.get_statistics(statistical_metrics=['count', 'median'])
+    """
+
+    def __init__(self, group_by=None, fields=None, include_estimated_values=False, k=200, seed=0):
+        if group_by is None:
+            group_by = ['product_type']
+        self.group_by = list(group_by)
+        self.fields = list(fields) if fields is not None else None
+        self.include_estimated_values = include_estimated_values
+        self.k = k
+        self.seed = seed
+        self.group_counts = {}
+        self.field_sketches = {}
+
+    def _new_field_sketch(self):
+        # Derive the seed from the number of sketches so that results are reproducible
+        return FieldSketch(self.k, None if self.seed is None else (self.seed, len(self.field_sketches)))
+
+    def update(self, df):
+        """
+        Folds the products of a DataFrame into the sketch.
+
+        :param df: DataFrame with the group_by columns, the fields and an 'estimated' column.
+        :return: The sketch.
+        """
+        if not self.include_estimated_values:
+            df = df[df['estimated'] == False]
+        if self.fields is None:
+            raise ValueError('Set the fields of the StatisticsSketch before adding data.')
+
+        fields = [field for field in self.fields if field in df.columns]
+        positions, codes, groups_df = get_group_codes(df, self.group_by)
+        values = df[fields].to_numpy(dtype=float)
+
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(groups_df) + 1))
+        for code, key in enumerate(groups_df[self.group_by].itertuples(index=False, name=None)):
+            self.group_counts[key] = self.group_counts.get(key, 0) + int(groups_df['count'].iloc[code])
+            group_values = values[positions[order[bounds[code]:bounds[code + 1]]]]
+            for j, field in enumerate(fields):
+                field_values = group_values[:, j]
+                field_values = field_values[~np.isnan(field_values)]
+                if len(field_values):
+                    if (key, field) not in self.field_sketches:
+                        self.field_sketches[(key, field)] = self._new_field_sketch()
+                    self.field_sketches[(key, field)].update(field_values)
+        return self
+
+    def merge(self, other):
+        """
+        Merges a StatisticsSketch built with the same group_by and fields into this one.
+
+        :return: The sketch.
+        """
+        if other.group_by != self.group_by:
+            raise ValueError('Cannot merge sketches with different group_by.')
+        if other.fields != self.fields:
+            raise ValueError('Cannot merge sketches with different fields.')
+        for key, count in other.group_counts.items():
+            self.group_counts[key] = self.group_counts.get(key, 0) + count
+        for key, field_sketch in other.field_sketches.items():
+            if key in self.field_sketches:
+                self.field_sketches[key].merge(field_sketch)
+            else:
+                # Copied so that later merges into this sketch do not modify other
+                self.field_sketches[key] = copy.deepcopy(field_sketch)
+        return self
+
+    def get_statistics(self, statistical_metrics=None, remove_outliers=True, method='IQR', sqrt_tranf=True, min_count=4):
+        """
+        Returns the statistics in the same layout as ProductStatistics.get_statistics.
+        """
+        if statistical_metrics is None:
+            statistical_metrics = ['count', 'mean', 'median']
+        if 'outlier_ids' in statistical_metrics:
+            raise ValueError("'outlier_ids' are not available for approximate statistics.")
+
+        fields = self.fields
+        keys = sorted(key for key, count in self.group_counts.items() if count >= min_count)
+        groups_df = pd.DataFrame(keys, columns=self.group_by)
+        groups_df['count'] = [self.group_counts[key] for key in keys]
+
+        has_statistics = np.zeros((len(keys), len(fields)), dtype=bool)
+        field_statistics = {metric: np.full((len(keys), len(fields)), np.nan, dtype=object) for metric in statistical_metrics}
+        for i, key in enumerate(keys):
+            for j, field in enumerate(fields):
+                field_sketch = self.field_sketches.get((key, field))
+                if field_sketch is None or field_sketch.moments.n < min_count:
+                    continue
+                has_statistics[i, j] = True
+                statistics = field_sketch.get_statistics(statistical_metrics, remove_outliers, method, sqrt_tranf, min_count)
+                for metric, value in statistics.items():
+                    if value is not None:
+                        field_statistics[metric][i, j] = value
+
+        for metric in statistical_metrics:
+            if metric != 'quartiles':
+                field_statistics[metric] = field_statistics[metric].astype(float)
+        return get_statistics_df(groups_df, has_statistics, field_statistics, fields, statistical_metrics)
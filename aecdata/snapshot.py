@@ -0,0 +1,162 @@
+import json
+import os
+import pickle
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+manifest_name = 'manifest.json'
+# File of the snapshot directory naming the version subdirectory currently published
+current_name = 'current'
+snapshot_version = 1
+
+
+def get_version_directory(directory):
+    """Returns the version subdirectory currently published in a snapshot directory."""
+    with open(os.path.join(directory, current_name)) as f:
+        return os.path.join(directory, f.read().strip())
+
+
+def write_snapshot(directory, df, metadata=None):
+    """
+    Writes a DataFrame to a snapshot directory that other processes attach to with
+    read_snapshot. Numerical columns are stored as .npy files and Categorical columns as
+    .npy files of their codes, which are memory-mapped when attached, so that the processes
+    share one copy of them through the page cache. Other columns (text, lists) are pickled, as
+    are the extension arrays (e.g. Int64, tz-aware datetimes), which keep their dtype.
+
+    Every snapshot is written to its own version subdirectory of directory, then published by
+    replacing the 'current' file naming it, which is atomic: read_snapshot sees either the
+    previous or the new snapshot. The versions before the previous one are removed, processes
+    still attached to them keep reading their memory-mapped files. A snapshot directory has one
+    writer at a time.
+
+    :param directory: The snapshot directory.
+    :param df: The DataFrame, compacted so that most of its columns are shared.
+    :param metadata: Optional JSON serializable dict saved with the snapshot.
+    """
+    directory = os.path.abspath(directory)
+    os.makedirs(directory, exist_ok=True)
+    version = f'{time.time_ns()}.{os.getpid()}'
+    # Versions being written end with .tmp, so that other writers do not remove them
+    temporary_directory = os.path.join(directory, f'{version}.tmp')
+    os.makedirs(temporary_directory)
+    try:
+        columns, categories = [], {}
+        for i, (column, series) in enumerate(df.items()):
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                kind, values = 'categorical', series.cat.codes.to_numpy()
+                categories[column] = series.cat.categories
+            elif isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biufcmM':
+                kind, values = 'array', series.to_numpy()
+            elif isinstance(series.dtype, np.dtype):
+                kind, values = 'object', series.to_numpy(dtype=object)
+            else:
+                # Extension arrays (nullable integers, tz-aware datetimes, str...) keep their dtype
+                kind, values = 'extension', series.array
+            file = f'{i}.npy' if kind in ('array', 'categorical') else f'{i}.pkl'
+            path = os.path.join(temporary_directory, file)
+            if kind in ('object', 'extension'):
+                with open(path, 'wb') as f:
+                    pickle.dump(values, f, protocol=pickle.HIGHEST_PROTOCOL)
+            else:
+                buffer = np.lib.format.open_memmap(path, mode='w+', dtype=values.dtype, shape=values.shape)
+                buffer[...] = values
+                buffer.flush()
+                del buffer
+            columns.append({'name': column, 'kind': kind, 'file': file, 'dtype': str(series.dtype)})
+
+        with open(os.path.join(temporary_directory, 'categories.pkl'), 'wb') as f:
+            pickle.dump(categories, f, protocol=pickle.HIGHEST_PROTOCOL)
+        range_index = isinstance(df.index, pd.RangeIndex) and df.index.start == 0 and df.index.step == 1
+        if not range_index:
+            np.save(os.path.join(temporary_directory, 'index.npy'), df.index.to_numpy())
+        manifest = {
+            'version': snapshot_version,
+            'rows': len(df),
+            'range_index': range_index,
+            'columns': columns,
+            'metadata': metadata or {},
+        }
+        with open(os.path.join(temporary_directory, manifest_name), 'w') as f:
+            json.dump(manifest, f)
+
+        os.replace(temporary_directory, os.path.join(directory, version))
+        current_path = os.path.join(directory, current_name)
+        previous = get_version_directory(directory) if os.path.exists(current_path) else None
+        temporary_path = f'{current_path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'w') as f:
+            f.write(version)
+        os.replace(temporary_path, current_path)
+    except Exception:
+        shutil.rmtree(temporary_directory, ignore_errors=True)
+        raise
+
+    # The previous version is kept for the processes that read 'current' just before it was
+    # replaced, read_snapshot retries with the new version if it is removed while attaching
+    keep = {version, os.path.basename(previous) if previous else None}
+    for entry in os.scandir(directory):
+        if entry.is_dir() and entry.name not in keep and not entry.name.endswith('.tmp'):
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def read_manifest(directory):
+    with open(os.path.join(directory, manifest_name)) as f:
+        manifest = json.load(f)
+    if manifest.get('version') != snapshot_version:
+        raise ValueError(f'Unsupported snapshot version {manifest.get("version")} in {directory}.')
+    return manifest
+
+
+def read_snapshot(directory, columns=None):
+    """
+    Attaches to a snapshot written by write_snapshot. The numerical and Categorical columns of
+    the DataFrame are read-only views of the memory-mapped files, not copies.
+
+    :param directory: The snapshot directory.
+    :param columns: Optional list of the columns to attach, by default all of them.
+    :return: tuple (DataFrame, metadata).
+    :raises ValueError: If a column is not in the snapshot.
+    """
+    while True:
+        version_directory = get_version_directory(directory)
+        try:
+            return read_version(version_directory, columns)
+        except FileNotFoundError:
+            # The version was removed by a later write_snapshot, attach to the new one
+            if get_version_directory(directory) == version_directory:
+                raise
+
+
+def read_version(directory, columns=None):
+    """Attaches to the version subdirectory of a snapshot, see read_snapshot."""
+    manifest = read_manifest(directory)
+    stored = {column['name']: column for column in manifest['columns']}
+    if columns is None:
+        columns = list(stored)
+    missing = [column for column in columns if column not in stored]
+    if missing:
+        raise ValueError(f'Columns not in the snapshot: {missing}')
+
+    with open(os.path.join(directory, 'categories.pkl'), 'rb') as f:
+        categories = pickle.load(f)
+    data = {}
+    for column in columns:
+        path = os.path.join(directory, stored[column]['file'])
+        kind = stored[column]['kind']
+        if kind in ('object', 'extension'):
+            with open(path, 'rb') as f:
+                data[column] = pickle.load(f)
+        else:
+            values = np.load(path, mmap_mode='r')
+            if kind == 'categorical':
+                values = pd.Categorical.from_codes(values, dtype=pd.CategoricalDtype(categories[column]))
+            data[column] = values
+    if manifest['range_index']:
+        index = pd.RangeIndex(manifest['rows'])
+    else:
+        index = pd.Index(np.load(os.path.join(directory, 'index.npy'), mmap_mode='r'))
+    # copy=False keeps one block per column, views of the memory-mapped files
+    return pd.DataFrame(data, index=index, copy=False), manifest['metadata']
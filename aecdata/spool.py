@@ -0,0 +1,127 @@
+import json
+import os
+import warnings
+
+manifest_name = 'manifest.json'
+
+
+def normalize_filters(filters):
+    """Returns the filters as they are saved in the manifest, with sets and tuples as sorted lists."""
+    normalized = {}
+    for key, value in sorted(filters.items()):
+        if isinstance(value, (set, frozenset)):
+            value = sorted(value)
+        elif isinstance(value, tuple):
+            value = list(value)
+        normalized[key] = value
+    return json.loads(json.dumps(normalized))
+
+
+def write_json(path, data):
+    # Written to a temporary file first so that an interrupted run never leaves a partial file
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(temporary_path, path)
+
+
+class Spool:
+    """
+    Directory where the pages of a download of products are saved as they are fetched, with a
+    manifest of the filters, TotalProducts and pages done, so that an interrupted download
+    is resumed by fetching only the missing pages.
+    """
+
+    def __init__(self, directory, filters=None, openapi=False):
+        """
+        :param directory: The spool directory, created if needed.
+        :param filters: The filters of the download.
+        :param openapi: Whether the download uses the Open API.
+        :raises ValueError: If the directory holds a download with other filters.
+        """
+        self.directory = directory
+        self.filters = normalize_filters(filters or {})
+        self.openapi = openapi
+        os.makedirs(directory, exist_ok=True)
+        self.manifest = self.read_manifest()
+        if self.manifest is not None and (self.manifest['filters'] != self.filters or self.manifest['openapi'] != openapi):
+            raise ValueError(f'The spool directory {directory} holds a download with other filters: '
+                             f'{self.manifest["filters"]} (openapi={self.manifest["openapi"]}).')
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.directory, manifest_name)
+
+    def page_path(self, page):
+        return os.path.join(self.directory, f'page_{page:06d}.json')
+
+    def read_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return None
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    @property
+    def started(self):
+        return self.manifest is not None
+
+    def start(self, total_products, items_per_page):
+        """Creates the manifest of a new download, discarding the pages of an older one."""
+        total_pages = (total_products + items_per_page - 1) // items_per_page
+        if self.manifest is not None and (self.manifest['total_products'], self.manifest['items_per_page']) != (total_products, items_per_page):
+            warnings.warn(
+                f"The number of products changed from {self.manifest['total_products']} to {total_products}, "
+                f"the pages downloaded are discarded.", UserWarning)
+            for page in self.manifest['pages_done']:
+                if os.path.exists(self.page_path(page)):
+                    os.remove(self.page_path(page))
+        self.manifest = {
+            'filters': self.filters,
+            'openapi': self.openapi,
+            'total_products': total_products,
+            'items_per_page': items_per_page,
+            'total_pages': total_pages,
+            'pages_done': [],
+        }
+        write_json(self.manifest_path, self.manifest)
+
+    @property
+    def missing_pages(self):
+        """The pages not downloaded yet, in order."""
+        done = set(self.manifest['pages_done'])
+        return [page for page in range(1, self.manifest['total_pages'] + 1) if page not in done]
+
+    @property
+    def complete(self):
+        return self.manifest is not None and not self.missing_pages
+
+    def save_page(self, page, products):
+        """Saves the products of a page, then marks it as done in the manifest."""
+        write_json(self.page_path(page), products)
+        self.manifest['pages_done'] = sorted(set(self.manifest['pages_done']) | {page})
+        write_json(self.manifest_path, self.manifest)
+
+    def load_products(self):
+        """
+        Returns the products of the pages done, in page order.
+
+        :raises ValueError: If the download is not complete.
+        """
+        if not self.complete:
+            missing = self.missing_pages if self.manifest is not None else 'all'
+            raise ValueError(f'The download in {self.directory} is not complete, missing pages: {missing}.')
+        products = []
+        for page in self.manifest['pages_done']:
+            with open(self.page_path(page)) as f:
+                products.extend(json.load(f))
+        return products
+
+    def clear(self):
+        """Removes the pages and the manifest."""
+        if self.manifest is not None:
+            for page in self.manifest['pages_done']:
+                if os.path.exists(self.page_path(page)):
+                    os.remove(self.page_path(page))
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
+        self.manifest = None
@@ -0,0 +1,209 @@
+import codecs
+import json
+
+_decoder = json.JSONDecoder()
+_whitespace = ' \t\n\r'
+
+
+def get_key_sharing_decoder():
+    """
+    Returns a JSONDecoder whose objects share their keys. json.loads shares the keys within a
+    document, products decoded one by one would otherwise each hold their own copies.
+    """
+    keys = {}
+
+    def object_pairs_hook(pairs):
+        return {keys.setdefault(key, key): value for key, value in pairs}
+
+    return json.JSONDecoder(object_pairs_hook=object_pairs_hook)
+
+
+def flatten(record, prefix='', flat=None):
+    """
+    Flattens a product into {'material_facts.declared_unit': ...} columns as pd.json_normalize
+    does: the values of a level come before its nested levels and empty dicts are dropped.
+    """
+    if flat is None:
+        flat = {}
+    nested = []
+    for key, value in record.items():
+        if isinstance(value, dict):
+            nested.append((key, value))
+        else:
+            flat[prefix + key] = value
+    for key, value in nested:
+        flatten(value, f'{prefix}{key}.', flat)
+    return flat
+
+
+class ColumnBuffers:
+    """
+    Columns of products being decoded, filled product by product so that the products are
+    never held as nested dicts all together. The DataFrame built from them is the same as
+    pd.json_normalize of the products.
+    """
+
+    def __init__(self):
+        self.columns = {}
+        self.rows = 0
+
+    def __len__(self):
+        return self.rows
+
+    def append(self, product):
+        columns = self.columns
+        for column, value in flatten(product).items():
+            values = columns.get(column)
+            if values is None:
+                values = columns[column] = []
+            if len(values) < self.rows:
+                values.extend([None] * (self.rows - len(values)))
+            values.append(value)
+        self.rows += 1
+
+    def extend(self, other):
+        """Appends the rows of other ColumnBuffers."""
+        for column, values in other.columns.items():
+            buffer = self.columns.get(column)
+            if buffer is None:
+                buffer = self.columns[column] = []
+            buffer.extend([None] * (self.rows - len(buffer)))
+            buffer.extend(values)
+        self.rows += other.rows
+
+    def to_dataframe(self):
+        # pandas is only needed here, decoding pages into lists of products does not load it
+        import pandas as pd
+
+        for values in self.columns.values():
+            values.extend([None] * (self.rows - len(values)))
+        return pd.DataFrame(self.columns, index=pd.RangeIndex(self.rows))
+
+
+class PageDecoder:
+    """
+    Decodes a page of products from the chunks of bytes of the response, calling a function
+    with every product of 'results' as soon as it is decoded. Only the text of the product
+    being decoded and of the chunk being read are kept, never the whole page.
+    """
+
+    def __init__(self, chunks, on_product, decoder=_decoder):
+        self.chunks = iter(chunks)
+        self.on_product = on_product
+        self.decoder = decoder
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.text = ''
+        self.position = 0
+        self.exhausted = False
+
+    def read(self):
+        """Reads one more chunk, returns False at the end of the response."""
+        if self.exhausted:
+            return False
+        # The text already decoded is dropped when it is most of the buffer
+        if self.position > len(self.text) // 2:
+            self.text = self.text[self.position:]
+            self.position = 0
+        for chunk in self.chunks:
+            if chunk:
+                self.text += self.text_decoder.decode(chunk)
+                return True
+        self.text += self.text_decoder.decode(b'', final=True)
+        self.exhausted = True
+        return False
+
+    def peek(self):
+        """Returns the next character which is not whitespace, without consuming it."""
+        while True:
+            while self.position < len(self.text) and self.text[self.position] in _whitespace:
+                self.position += 1
+            if self.position < len(self.text):
+                return self.text[self.position]
+            if not self.read():
+                raise ValueError('Unexpected end of the JSON page.')
+
+    def expect(self, characters):
+        character = self.peek()
+        if character not in characters:
+            raise ValueError(f'Invalid JSON page: expected {characters!r} at {character!r}.')
+        self.position += 1
+        return character
+
+    def value(self):
+        """Decodes the next JSON value, reading more chunks until it is complete."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.text, self.position)
+                # A number at the end of the text may continue in the next chunk
+                if end < len(self.text) or self.exhausted:
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.exhausted:
+                    raise
+            self.read()
+
+    def decode(self):
+        """
+        Decodes the page.
+
+        :return: dict with the fields of the page other than 'results'.
+        """
+        page = {}
+        self.expect('{')
+        if self.peek() == '}':
+            self.position += 1
+            return page
+        while True:
+            key = self.value()
+            self.expect(':')
+            if key == 'results' and self.peek() == '[':
+                self.decode_results()
+            else:
+                page[key] = self.value()
+            if self.expect(',}') == '}':
+                return page
+
+    def decode_results(self):
+        self.expect('[')
+        if self.peek() == ']':
+            self.position += 1
+            return
+        while True:
+            self.on_product(self.value())
+            if self.expect(',]') == ']':
+                return
+
+
+def decode_page(chunks, on_product=None):
+    """
+    Decodes a page of products from chunks of bytes, product by product.
+
+    :param chunks: Iterable of bytes, e.g. response.iter_content(2 ** 16).
+    :param on_product: Function called with every product. If None, the products are
+                       returned in 'results' as with response.json(), sharing their keys.
+    :return: dict with the fields of the page, and 'results' if on_product is None.
+    """
+    if on_product is not None:
+        return PageDecoder(chunks, on_product).decode()
+    results = []
+    page = PageDecoder(chunks, results.append, get_key_sharing_decoder()).decode()
+    page['results'] = results
+    return page
+
+
+def decode_page_to_buffers(chunks, prepare=None):
+    """
+    Decodes a page of products from chunks of bytes straight into ColumnBuffers.
+
+    :param prepare: Optional function applied to every product before it is flattened.
+    :return: dict with the fields of the page and the ColumnBuffers in 'results'.
+    """
+    buffers = ColumnBuffers()
+    if prepare is None:
+        page = decode_page(chunks, buffers.append)
+    else:
+        page = decode_page(chunks, lambda product: buffers.append(prepare(product)))
+    page['results'] = buffers
+    return page
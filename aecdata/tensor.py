@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+from .utils import lca_fields, lca_modules, lca_column_positions
+
+
+class LCATensor:
+    """
+    The LCA values of the products as a 3-D array (products x fields x modules) with NaN
+    where a module is not declared, instead of one DataFrame column per field and module.
+
+    :ivar values: The float array, or a numpy masked array with the missing values masked.
+    :ivar products: The 'unique_product_uuid_v2' of each product (first axis).
+    :ivar fields: The LCA fields (second axis).
+    :ivar modules: The LCA modules (third axis).
+    """
+
+    def __init__(self, values, products, fields, modules):
+        self.values = values
+        self.products = products
+        self.fields = list(fields)
+        self.modules = list(modules)
+
+    @classmethod
+    def from_dataframe(cls, df, dtype=float):
+        """
+        Builds the tensor from the 'material_facts.{field}.{module}' columns of a DataFrame.
+        Only the fields and modules with at least one column in the DataFrame are included.
+        """
+        columns = [column for column in df.columns if column in lca_column_positions]
+        positions = np.array([lca_column_positions[column] for column in columns], dtype=np.int64).reshape(-1, 2)
+        field_positions = np.unique(positions[:, 0])
+        module_positions = np.unique(positions[:, 1])
+
+        values = np.full((len(df), len(field_positions), len(module_positions)), np.nan, dtype=dtype)
+        values[:, np.searchsorted(field_positions, positions[:, 0]), np.searchsorted(module_positions, positions[:, 1])] = \
+            df[columns].to_numpy(dtype=dtype)
+
+        products = df['unique_product_uuid_v2'].to_numpy() if 'unique_product_uuid_v2' in df.columns else df.index.to_numpy()
+        return cls(values, products, [lca_fields[i] for i in field_positions], [lca_modules[i] for i in module_positions])
+
+    def masked(self):
+        """Returns the tensor with the values as a masked array, missing values masked."""
+        if isinstance(self.values, np.ma.MaskedArray):
+            return self
+        return LCATensor(np.ma.masked_invalid(self.values), self.products, self.fields, self.modules)
+
+    def select(self, fields=None, modules=None):
+        """
+        Selects LCA fields (indicators) and modules.
+
+        :param fields: The list of fields to keep. If None, keep all the fields.
+        :param modules: The list of modules to keep. If None, keep all the modules.
+        :return: A new LCATensor.
+        """
+        fields = self.fields if fields is None else list(fields)
+        modules = self.modules if modules is None else list(modules)
+        field_positions = [self.fields.index(field) for field in fields]
+        module_positions = [self.modules.index(module) for module in modules]
+        return LCATensor(self.values[:, field_positions][:, :, module_positions], self.products, fields, modules)
+
+    def scale(self, factors):
+        """
+        Multiplies the values of every product by a factor, e.g. 1 / the scaling factors of
+        a unit to express the values in that unit.
+
+        :param factors: 1-D array with one factor per product.
+        :return: A new LCATensor.
+        """
+        factors = np.asarray(factors, dtype=float)
+        return LCATensor(self.values * factors[:, np.newaxis, np.newaxis], self.products, self.fields, self.modules)
+
+    def sum_modules(self, modules=None):
+        """
+        Sums the values over the modules, ignoring the modules that are not declared.
+
+        :param modules: The modules to sum. If None, sum all the modules.
+        :return: DataFrame (products x fields), NaN where none of the modules are declared.
+        """
+        tensor = self if modules is None else self.select(modules=modules)
+        values = np.ma.getdata(tensor.values)
+        declared = ~np.isnan(values)
+        if isinstance(tensor.values, np.ma.MaskedArray):
+            declared &= ~np.ma.getmaskarray(tensor.values)
+        totals = np.where(declared, values, 0).sum(axis=2)
+        totals[~declared.any(axis=2)] = np.nan
+        return pd.DataFrame(totals, index=self.products, columns=self.fields)
+
+    def to_dataframe(self):
+        """Returns the values as 'material_facts.{field}.{module}' columns, one row per product."""
+        values = np.ma.filled(self.values.astype(float), np.nan) if isinstance(self.values, np.ma.MaskedArray) else self.values
+        columns = [f'material_facts.{field}.{module}' for field in self.fields for module in self.modules]
+        return pd.DataFrame(values.reshape(len(values), -1), index=self.products, columns=columns)
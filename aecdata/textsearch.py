@@ -0,0 +1,160 @@
+import re
+import unicodedata
+import numpy as np
+
+# Columns indexed by default and the weight of their terms
+text_search_columns = {'name': 2.0, 'description': 1.0, 'company': 1.0, 'material_type': 1.0}
+
+# BM25 parameters
+bm25_k1 = 1.2
+bm25_b = 0.75
+
+# Maximum number of (query, product) pairs scored at once by search_batch
+max_batch_cells = 2 ** 17
+
+_word_pattern = re.compile(r'[a-z0-9]+')
+
+
+def get_terms(text):
+    """
+    Splits a text into the terms of the index: its words and the character trigrams of the
+    words, so that misspelled and partial words still match.
+    """
+    if not isinstance(text, str):
+        return []
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode().lower()
+    terms = []
+    for word in _word_pattern.findall(text):
+        terms.append(word)
+        padded = f' {word} '
+        terms.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return terms
+
+
+class TextIndex:
+    """
+    In-memory BM25 index of the text of the products (name, description, company and
+    material type), over words and character trigrams.
+
+    The postings of every term (the products containing it and their BM25 weight) are stored
+    as NumPy arrays, so a query sums the postings of its terms without scanning the products.
+    """
+
+    def __init__(self, df, columns=None):
+        """
+        :param df: The DataFrame of the products.
+        :param columns: dict mapping the columns to index to the weight of their terms.
+                        If None, use text_search_columns.
+        """
+        if columns is None:
+            columns = text_search_columns
+        columns = {column: weight for column, weight in columns.items() if column in df.columns}
+        self.n_documents = len(df)
+
+        vocabulary = {}
+        term_ids, document_ids, term_weights = [], [], []
+        for column, weight in columns.items():
+            # Texts like company names repeat, they are split once
+            text_term_ids = {}
+            for document, text in enumerate(df[column].to_numpy()):
+                # Missing values and lists (e.g. building_applications) have no text
+                if not isinstance(text, str):
+                    continue
+                if text not in text_term_ids:
+                    text_term_ids[text] = [vocabulary.setdefault(term, len(vocabulary)) for term in get_terms(text)]
+                ids = text_term_ids[text]
+                term_ids.extend(ids)
+                document_ids.extend([document] * len(ids))
+                term_weights.extend([weight] * len(ids))
+        self.vocabulary = vocabulary
+
+        term_ids = np.array(term_ids, dtype=np.int64)
+        document_ids = np.array(document_ids, dtype=np.int64)
+        term_weights = np.array(term_weights, dtype=float)
+
+        # Weighted term frequencies of every (term, document) pair, sorted by term
+        keys, inverse = np.unique(term_ids * self.n_documents + document_ids, return_inverse=True)
+        frequencies = np.bincount(inverse, weights=term_weights)
+        terms, documents = np.divmod(keys, self.n_documents)
+
+        lengths = np.bincount(document_ids, weights=term_weights, minlength=self.n_documents)
+        average_length = lengths.mean() if self.n_documents else 0
+        document_frequencies = np.bincount(terms, minlength=len(vocabulary))
+        idf = np.log1p((self.n_documents - document_frequencies + 0.5) / (document_frequencies + 0.5))
+
+        norms = bm25_k1 * (1 - bm25_b + bm25_b * lengths[documents] / max(average_length, 1e-12))
+        self.weights = (idf[terms] * frequencies * (bm25_k1 + 1) / (frequencies + norms)).astype(np.float32)
+        self.documents = documents.astype(np.int32)
+        self.offsets = np.searchsorted(terms, np.arange(len(vocabulary) + 1))
+
+    def search(self, query, k=10):
+        """
+        Ranks the products for a query.
+
+        :param query: The text to search.
+        :param k: The maximum number of results.
+        :return: tuple (positions, scores) with the row positions of the best matches and their
+                 BM25 scores, from the best match.
+        """
+        return self.search_batch([query], k)[0]
+
+    def search_batch(self, queries, k=10):
+        """
+        Ranks the products for several queries at once. Only the products in the postings of
+        the query terms are scored, the cost depends on the postings and not on the number of
+        products.
+
+        :return: list with the (positions, scores) of every query.
+        """
+        n_documents = max(self.n_documents, 1)
+        chunk_size = max(1, max_batch_cells // n_documents)
+        results = []
+        for start in range(0, len(queries), chunk_size):
+            results.extend(self._search_chunk(queries[start:start + chunk_size], k, n_documents))
+        return results
+
+    def _search_chunk(self, queries, k, n_documents):
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+        postings, query_ids = [], []
+        for query_id, query in enumerate(queries):
+            for term in get_terms(query):
+                term_id = self.vocabulary.get(term)
+                if term_id is not None:
+                    postings.append(slice(self.offsets[term_id], self.offsets[term_id + 1]))
+                    query_ids.append(query_id)
+        if not postings or k <= 0:
+            return [empty for _ in queries]
+        lengths = [posting.stop - posting.start for posting in postings]
+        keys = np.repeat(np.array(query_ids, dtype=np.int64) * n_documents, lengths)
+        keys += np.concatenate([self.documents[posting] for posting in postings])
+        weights = np.concatenate([self.weights[posting] for posting in postings])
+
+        # Score of the (query, product) pairs of the postings
+        n_pairs = len(queries) * n_documents
+        if 2 * len(keys) < n_pairs:
+            # Few postings: the pairs found are numbered in a buffer spanning every pair, which
+            # is not initialized, only the entries of the pairs found are written and read
+            pair_ids = np.empty(n_pairs, dtype=np.int64)
+            positions = np.arange(len(keys))
+            pair_ids[keys] = positions
+            pairs = keys[pair_ids[keys] == positions]
+            pair_ids[pairs] = np.arange(len(pairs))
+            scores = np.bincount(pair_ids[keys], weights=weights, minlength=len(pairs))
+        else:
+            # Postings covering most products are summed densely, and only the products scoring
+            # at least the k-th best score of their query are ranked
+            scores = np.bincount(keys, weights=weights, minlength=n_pairs).reshape(len(queries), n_documents)
+            threshold = np.partition(scores, n_documents - k, axis=1)[:, n_documents - k:n_documents - k + 1] if k < n_documents else 0
+            # Matched products have a positive score
+            pairs = np.flatnonzero(scores >= np.maximum(threshold, np.finfo(float).tiny))
+            scores = scores.ravel()[pairs]
+        match_queries, matches = np.divmod(pairs, n_documents)
+
+        # The k best matches of every query, from the best match and by position on ties
+        order = np.lexsort((matches, -scores, match_queries))
+        match_queries, matches, scores = match_queries[order], matches[order], scores[order]
+        bounds = np.searchsorted(match_queries, np.arange(len(queries) + 1))
+        kept = (np.arange(len(order)) - bounds[match_queries] < k) & (scores > 0)
+        bounds = np.searchsorted(match_queries[kept], np.arange(len(queries) + 1))
+        matches, scores = matches[kept], scores[kept].astype(np.float32)
+        return [(matches[start:stop], scores[start:stop]) for start, stop in zip(bounds[:-1], bounds[1:])]
@@ -497,4 +497,13 @@ lca_fields = []
 for category,fields in field_description['lca_fields'].items():
     lca_fields += list(fields.keys())
 
-lca_modules = list(field_description['lca_modules'].keys())
\ No newline at end of file
+lca_modules = list(field_description['lca_modules'].keys())
+
+# Flattened DataFrame columns of the LCA fields, in (field, module) order
+lca_columns = [f'material_facts.{field}.{module}' for field in lca_fields for module in lca_modules]
+
+# Position of every LCA column in the (field, module) grid
+lca_column_positions = {column: divmod(i, len(lca_modules)) for i, column in enumerate(lca_columns)}
+
+# Columns expressed per declared unit, which are scaled when converting to another unit
+scalable_columns = lca_columns + [f'material_facts.{field}' for field in mf_num_fields]
@@ -0,0 +1,128 @@
+import random
+import uuid
+from aecdata.utils import field_description, lca_fields, lca_modules, mf_num_fields, mf_perc_fields, unit_categories
+
+# Conversion of the units of every category from its primary unit
+unit_conversions = {
+    'm': 1, 'ft': 3.28084, 'in': 39.3701,
+    'm2': 1, 'ft2': 10.7639, 'in2': 1550.0031,
+    'm3': 1, 'ft3': 35.3147, 'in3': 61023.7441,
+    'kg': 1, 'lb': 2.20462, 'mt': 0.001, 'ust': 0.00110231,
+    'piece': 1,
+}
+
+product_types = ['Insulation', 'Brick', 'Plasterboard', 'Timber Panel', 'Ceramic Tile', 'Concrete Block',
+                 'Steel Section', 'Glass Pane', 'Carpet', 'Paint', 'Membrane', 'Cladding Panel']
+material_types = ['Mineral Wool', 'Clay', 'Gypsum', 'Wood', 'Ceramic', 'Concrete', 'Steel', 'Glass',
+                  'Wool', 'Polymer', 'Bitumen', 'Aluminium']
+families = ['Natural', 'Mineral', 'Metal', 'Synthetic', 'Composite']
+building_applications = ['External Wall', 'Internal Wall', 'Roof', 'Floor', 'Ceiling', 'Facade', 'Foundation']
+building_types = ['Residential', 'Commercial', 'Industrial', 'Education', 'Healthcare']
+countries = {'United Kingdom': 'Europe', 'France': 'Europe', 'Germany': 'Europe', 'Italy': 'Europe',
+             'United States': 'North America', 'Canada': 'North America', 'China': 'Asia', 'India': 'Asia',
+             'Australia': 'Oceania', 'Brazil': 'South America'}
+compliances = ['EN 15804+A1', 'EN 15804+A2', 'ISO 14025', 'ISO 21930']
+certificate_subtypes = ['Specific Dataset', 'Average Dataset', 'Representative Dataset', 'Generic Dataset', 'Template Dataset']
+words = ['acoustic', 'thermal', 'board', 'recycled', 'low', 'carbon', 'fire', 'resistant', 'natural', 'rigid',
+         'lightweight', 'high', 'density', 'panel', 'system', 'coated', 'modular', 'durable', 'insulating', 'premium']
+
+
+def generate_products(n_products, seed=0, lca_density=0.3, n_companies=None):
+    """
+    Generates a deterministic synthetic catalogue of products with the structure returned by
+    the API (utils.field_description): product fields, physical properties and technical
+    parameters at the top level, and nested material facts with LCA modules and scaling factors.
+
+    :param n_products: The number of products.
+    :param seed: Seed of the random generator, the same seed gives the same catalogue.
+    :param lca_density: The probability of every (LCA field, module) value to be declared.
+    :param n_companies: The number of companies. If None, one for every 50 products.
+    :return: list of products (dicts).
+    """
+    rng = random.Random(seed)
+    if n_companies is None:
+        n_companies = max(1, n_products // 50)
+    companies = [f'Company {i}' for i in range(n_companies)]
+    country_names = list(countries)
+    numeric_parameters = [field for field, description in field_description['technical_parameters'].items()
+                          if 'unit' in description and not field.endswith('_estimated')]
+    text_parameters = ['retail_price', 'fire_performance', 'color', 'texture']
+
+    products = []
+    for i in range(n_products):
+        product_type = rng.choice(product_types)
+        material_type = rng.choice(material_types)
+        country = rng.choice(country_names)
+        product = {
+            'unique_product_uuid_v2': str(uuid.UUID(int=rng.getrandbits(128))),
+            'name': f'{rng.choice(words).title()} {material_type} {product_type} {i}',
+            'description': ' '.join(rng.choices(words, k=rng.randint(5, 25))),
+            'company': rng.choice(companies),
+            'product_type': product_type,
+            'product_type_family': rng.choice(families),
+            'material_type': material_type,
+            'material_type_family': rng.choice(families),
+            'building_applications': rng.sample(building_applications, rng.randint(1, 3)),
+            'building_types': rng.sample(building_types, rng.randint(1, 2)),
+            'manufacturing_location': f'{country} plant {rng.randint(1, 20)}',
+            'country': country,
+            'city': f'City {rng.randint(1, 200)}',
+            'manufacturing_continent': countries[country],
+            'product_url': f'https://app.2050-materials.com/product/details_designer/product-{i}/',
+            'product_slug': f'product-{i}',
+            'updated': f'20{rng.randint(20, 25)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+        }
+
+        # Physical properties, sparse
+        for field in ['density', 'grammage', 'linear_density', 'mass_per_piece', 'thickness', 'cross_sectional_area']:
+            if rng.random() < 0.5:
+                product[field] = rng.lognormvariate(3, 1.5) if field != 'thickness' else rng.uniform(0.005, 0.3)
+                product[f'{field}_estimated'] = rng.random() < 0.3
+
+        # Technical parameters, sparse
+        for field in numeric_parameters:
+            if rng.random() < 0.2:
+                product[field] = rng.lognormvariate(1, 1)
+        for field in text_parameters:
+            if rng.random() < 0.3:
+                product[field] = f'{field} {rng.randint(1, 8)}'
+
+        material_facts = {
+            'declared_unit': rng.choice(list(unit_categories)),
+            'data_source': rng.choice(['EPD', 'EPD', 'Generic']),
+            'certificate_subtype': rng.choice(certificate_subtypes),
+            'compliances': rng.sample(compliances, rng.randint(0, 2)),
+            'language': rng.choice(['English', 'French', 'German']),
+            'data_source_link__date_of_issue': f'20{rng.randint(15, 24)}-{rng.randint(1, 12):02d}-01',
+            'data_source_link__certificate_expiry': f'20{rng.randint(25, 30)}-{rng.randint(1, 12):02d}-01',
+            'mass_per_declared_unit': rng.lognormvariate(2, 1.5),
+            'mass_per_declared_unit_estimated': rng.random() < 0.3,
+        }
+        for field in mf_num_fields:
+            if rng.random() < 0.8:
+                material_facts[field] = rng.lognormvariate(1, 1.5) * (-1 if 'biogenic' in field else 1)
+        for field in mf_perc_fields:
+            if rng.random() < 0.5:
+                material_facts[field] = rng.uniform(0, 100)
+
+        # LCA fields, each with a sparse set of declared modules
+        for field in lca_fields:
+            modules = {module: rng.lognormvariate(0, 2) for module in lca_modules if rng.random() < lca_density}
+            if modules:
+                material_facts[field] = modules
+
+        # Scaling factors to the units of the categories the product can be converted to
+        declared_unit = material_facts['declared_unit']
+        scaling_factors = {}
+        for category, units in unit_categories.items():
+            if category != declared_unit and rng.random() < 0.4:
+                continue
+            factor = 1 if category == declared_unit else rng.lognormvariate(0, 2)
+            estimated = category != declared_unit and rng.random() < 0.3
+            for unit in units:
+                scaling_factors[unit] = {'value': factor * unit_conversions[unit], 'estimated': estimated}
+        material_facts['scaling_factors'] = scaling_factors
+
+        product['material_facts'] = material_facts
+        products.append(product)
+    return products
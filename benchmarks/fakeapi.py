@@ -0,0 +1,297 @@
+"""
+Local stand-in for the 2050 Materials API, serving a synthetic catalogue, for load testing
+the client without calling production.
+
+    python -m benchmarks.fakeapi --products 100000 --latency 0.05 --port 8050
+
+Implements the token, refresh, get_products, get_products_open_api and get_product_filters
+endpoints, with paging, latency, token expiry (401) and injected 429 and 5xx errors.
+"""
+import argparse
+import json
+import random
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from aecdata.planner import label_filters, value_filters
+from .catalogue import generate_products
+
+api_path = '/developer/api/'
+
+
+class FakeAPI:
+    """
+    State of the fake API: the catalogue, its filters, the issued tokens and the counters of
+    the requests served.
+    """
+
+    def __init__(self, products, developer_token='developer-token', page_size=200, latency=0.0, latency_jitter=0.0,
+                 token_lifetime=None, error_rate=0.0, throttle_rate=0.0, retry_after=1, capacity=None, seed=0):
+        """
+        :param products: The products served.
+        :param developer_token: The developer token accepted by the token endpoint.
+        :param page_size: The number of products per page.
+        :param latency: The delay in seconds before every response.
+        :param latency_jitter: Maximum random delay in seconds added to latency.
+        :param token_lifetime: Seconds after which API tokens expire and requests get 401. None for no expiry.
+        :param error_rate: Fraction of the product requests answered with a 500, 502 or 503.
+        :param throttle_rate: Fraction of the product requests answered with a 429.
+        :param retry_after: The Retry-After header of the 429 responses, in seconds.
+        :param capacity: The number of requests waiting their latency at the same time, the others
+                         queue so that the latency rises with the concurrency. None for no limit.
+        :param seed: Seed of the latency and error injection.
+        """
+        self.developer_token = developer_token
+        self.page_size = page_size
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.token_lifetime = token_lifetime
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.capacity = capacity
+        self.slots = threading.Semaphore(capacity) if capacity else None
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.api_tokens = {}
+        self.refresh_tokens = set()
+        self.stats = {}
+        self.reset_stats()
+        self.set_products(products)
+
+    def set_products(self, products):
+        self.products = products
+        # The products are encoded once, a page is the concatenation of its products
+        self.encoded_products = [json.dumps(product).encode() for product in products]
+
+        self.filters = {}
+        self.filter_ids = {}
+        for column, key in label_filters.items():
+            labels = sorted({label for product in products for label in self.get_labels(product, column)})
+            self.filters[key] = {'filter_options': [{'id': i + 1, 'value': label} for i, label in enumerate(labels)]}
+            self.filter_ids[key] = {i + 1: label for i, label in enumerate(labels)}
+
+    @staticmethod
+    def get_labels(product, column):
+        value = product.get(column)
+        if value is None:
+            return []
+        return value if isinstance(value, list) else [value]
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {'requests': 0, 'pages': 0, 'bytes': 0, 'errors': 0, 'throttled': 0, 'unauthorized': 0}
+
+    def count(self, **counts):
+        with self.lock:
+            for key, value in counts.items():
+                self.stats[key] += value
+
+    def issue_tokens(self):
+        api_token, refresh_token = secrets.token_hex(16), secrets.token_hex(16)
+        with self.lock:
+            self.api_tokens[api_token] = time.monotonic()
+            self.refresh_tokens.add(refresh_token)
+        return api_token, refresh_token
+
+    def refresh(self, refresh_token):
+        if refresh_token not in self.refresh_tokens:
+            return None
+        api_token = secrets.token_hex(16)
+        with self.lock:
+            self.api_tokens[api_token] = time.monotonic()
+        return api_token
+
+    def is_authorized(self, api_token):
+        issued = self.api_tokens.get(api_token)
+        if issued is None:
+            return False
+        return self.token_lifetime is None or time.monotonic() - issued < self.token_lifetime
+
+    def filter_products(self, parameters):
+        """Returns the positions of the products matching the filters of the query string."""
+        positions = range(len(self.products))
+        for key, values in parameters.items():
+            if key in self.filter_ids:
+                labels = {self.filter_ids[key].get(int(value)) for value in values if value.isdigit()}
+                column = next(column for column, filter_key in label_filters.items() if filter_key == key)
+                positions = [p for p in positions if labels.intersection(self.get_labels(self.products[p], column))]
+            elif key in value_filters.values():
+                column = next(column for column, filter_key in value_filters.items() if filter_key == key)
+                positions = [p for p in positions if self.products[p].get(column) in values]
+            elif key in ('updated_after', 'updated_before'):
+                date = values[0]
+                after = key == 'updated_after'
+                positions = [p for p in positions if self.products[p].get('updated')
+                             and (self.products[p]['updated'] > date if after else self.products[p]['updated'] < date)]
+            elif key == 'updated_between':
+                start, end = values[0].split(',')
+                positions = [p for p in positions if self.products[p].get('updated') and start <= self.products[p]['updated'] <= end]
+        return list(positions)
+
+    def get_page(self, parameters, base_url):
+        """Returns the body of a page of products."""
+        page = int(parameters.pop('page', ['1'])[0])
+        page_size = int(parameters.pop('page_size', [self.page_size])[0])
+        positions = self.filter_products(parameters) if parameters else range(len(self.products))
+        total = len(positions)
+        start = (page - 1) * page_size
+        page_positions = positions[start:start + page_size]
+        has_next = start + page_size < total
+        next_url = f'{base_url}?page={page + 1}' if has_next else None
+        previous_url = f'{base_url}?page={page - 1}' if page > 1 else None
+        header = json.dumps({'TotalProducts': total, 'next': next_url, 'previous': previous_url})[:-1].encode()
+        return header + b', "results": [' + b', '.join(self.encoded_products[p] for p in page_positions) + b']}'
+
+
+class FakeAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def api(self):
+        return self.server.api
+
+    def get_bearer_token(self):
+        authorization = self.headers.get('Authorization', '')
+        return authorization[len('Bearer '):] if authorization.startswith('Bearer ') else None
+
+    def send_body(self, status, body, headers=None):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.api.count(requests=1, bytes=len(body))
+
+    def wait(self):
+        delay = self.api.latency + (self.api.rng.uniform(0, self.api.latency_jitter) if self.api.latency_jitter else 0)
+        if not delay:
+            return
+        if self.api.slots is None:
+            time.sleep(delay)
+        else:
+            with self.api.slots:
+                time.sleep(delay)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.wait()
+
+        if url.path == f'{api_path}token/getapitoken/':
+            if self.get_bearer_token() != self.api.developer_token:
+                return self.send_body(401, {'detail': 'Invalid developer token.'})
+            api_token, refresh_token = self.api.issue_tokens()
+            return self.send_body(200, {'api_token': api_token, 'refresh_token': refresh_token})
+
+        if not self.api.is_authorized(self.get_bearer_token()):
+            self.api.count(unauthorized=1)
+            return self.send_body(401, {'detail': 'Given token not valid for any token type'})
+
+        if url.path == f'{api_path}get_product_filters':
+            return self.send_body(200, self.api.filters)
+
+        if url.path in (f'{api_path}get_products', f'{api_path}get_products_open_api'):
+            draw = self.api.rng.random()
+            if draw < self.api.throttle_rate:
+                self.api.count(throttled=1)
+                return self.send_body(429, {'detail': 'Request was throttled.'}, {'Retry-After': str(self.api.retry_after)})
+            if draw < self.api.throttle_rate + self.api.error_rate:
+                self.api.count(errors=1)
+                return self.send_body(self.api.rng.choice([500, 502, 503]), {'detail': 'Server error.'})
+            parameters = parse_qs(url.query)
+            base_url = f'http://{self.headers.get("Host")}{url.path}'
+            body = self.api.get_page(parameters, base_url)
+            self.api.count(pages=1)
+            return self.send_body(200, body)
+
+        self.send_body(404, {'detail': 'Not found.'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        self.wait()
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        if url.path == f'{api_path}token/refresh/':
+            api_token = self.api.refresh(self.get_bearer_token())
+            if api_token is None:
+                return self.send_body(401, {'detail': 'Token is invalid or expired'})
+            return self.send_body(200, {'api_token': api_token})
+        self.send_body(404, {'detail': 'Not found.'})
+
+
+class FakeAPIServer:
+    """
+    Runs a FakeAPI in a background thread, e.g.
+
+        with FakeAPIServer(FakeAPI(generate_products(10000))) as server:
+            user = User(server.api.developer_token, server.base_url)
+    """
+
+    def __init__(self, api, host='127.0.0.1', port=0):
+        self.api = api
+        self.server = ThreadingHTTPServer((host, port), FakeAPIHandler)
+        self.server.daemon_threads = True
+        self.server.api = api
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Local fake 2050 Materials API serving a synthetic catalogue.')
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8050)
+    parser.add_argument('--developer-token', default='developer-token')
+    parser.add_argument('--page-size', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--latency-jitter', type=float, default=0.0)
+    parser.add_argument('--token-lifetime', type=float, default=None)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--capacity', type=int, default=None)
+    arguments = parser.parse_args(arguments)
+
+    api = FakeAPI(generate_products(arguments.products, seed=arguments.seed), arguments.developer_token, arguments.page_size,
+                  arguments.latency, arguments.latency_jitter, arguments.token_lifetime, arguments.error_rate,
+                  arguments.throttle_rate, capacity=arguments.capacity, seed=arguments.seed)
+    server = FakeAPIServer(api, arguments.host, arguments.port)
+    print(f'Serving {arguments.products} products at {server.base_url}')
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+Times the main operations of ProductData and ProductStatistics on synthetic catalogues.
+
+    python -m benchmarks.run --sizes 1000 10000 100000 --output results.json
+    python -m benchmarks.run --compare before.json after.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import aecdata
+from aecdata import ProductData, ProductStatistics
+from .catalogue import generate_products
+
+benchmark_names = ['construction', 'df_to_list', 'convert_df_to_unit', 'scale_products_by_unit_and_amount',
+                   'to_epdx', 'filter_df_by_dict', 'statistics_construction', 'get_statistics']
+
+
+def time_call(function, repeat):
+    """Returns the wall times in seconds of repeat calls of function, and its last result."""
+    times = []
+    result = None
+    for _ in range(repeat):
+        # The messages printed by the methods are not part of the output of the benchmark
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = function()
+            times.append(time.perf_counter() - start)
+    return times, result
+
+
+def get_benchmarks(products, seed=0, n_lines=1000):
+    """
+    Returns the benchmarks for a catalogue, as a dict mapping their names to functions of the
+    ProductData (and ProductStatistics) instances built by construction.
+    """
+    rng = random.Random(seed)
+    lines = rng.sample(products, min(n_lines, len(products)))
+    products_info = {}
+    for product in lines:
+        units = list(product['material_facts']['scaling_factors']) + ['declared_unit']
+        products_info[product['unique_product_uuid_v2']] = {'unit': rng.choice(units), 'amount': rng.uniform(1, 100)}
+    filters = {'product_type': ['Insulation', 'Brick', 'Plasterboard'], 'building_applications': ['Roof', 'Facade']}
+
+    return {
+        'construction': lambda state: ProductData(products),
+        'df_to_list': lambda state: state['product_data'].df_to_list(state['product_data'].dataframe),
+        'convert_df_to_unit': lambda state: state['product_data'].convert_df_to_unit(state['product_data'].dataframe, 'kg', 2),
+        'scale_products_by_unit_and_amount': lambda state: state['product_data'].scale_products_by_unit_and_amount(products_info),
+        'to_epdx': lambda state: state['product_data'].to_epdx(),
+        'filter_df_by_dict': lambda state: state['product_data'].filter_df_by_dict(state['product_data'].dataframe, filters),
+        'statistics_construction': lambda state: ProductStatistics(state['product_data'], 'kg'),
+        'get_statistics': lambda state: state['product_statistics'].get_statistics(group_by=['product_type', 'material_facts.declared_unit']),
+    }
+
+
+def run(sizes, repeat=3, seed=0, lca_density=0.3, benchmarks=None, verbose=True):
+    """
+    Runs the benchmarks on a catalogue of every size.
+
+    :param sizes: The numbers of products of the catalogues.
+    :param repeat: The number of timed calls of every benchmark.
+    :param seed: Seed of the catalogues.
+    :param lca_density: The probability of every (LCA field, module) value to be declared.
+    :param benchmarks: The names of the benchmarks to run. If None, run all of benchmark_names.
+    :return: dict with the 'metadata' of the run and the 'results' of every benchmark and size.
+    """
+    if benchmarks is None:
+        benchmarks = benchmark_names
+    results = []
+    for n_products in sizes:
+        start = time.perf_counter()
+        products = generate_products(n_products, seed=seed, lca_density=lca_density)
+        if verbose:
+            print(f'Generated {n_products} products in {time.perf_counter() - start:.1f} s')
+
+        functions = get_benchmarks(products, seed)
+        state = {}
+        # ProductData and ProductStatistics are always built, the other benchmarks use them
+        for name in benchmark_names:
+            if name not in benchmarks and name not in ('construction', 'statistics_construction'):
+                continue
+            times, result = time_call(lambda: functions[name](state), repeat if name in benchmarks else 1)
+            if name == 'construction':
+                state['product_data'] = result
+            elif name == 'statistics_construction':
+                state['product_statistics'] = result
+            if name not in benchmarks:
+                continue
+            results.append({
+                'benchmark': name,
+                'n_products': n_products,
+                'times': times,
+                'min': min(times),
+                'median': statistics.median(times),
+            })
+            if verbose:
+                print(f'  {name:<36} {min(times):10.4f} s (median {statistics.median(times):.4f} s)')
+
+    return {'metadata': get_metadata(seed, lca_density, repeat), 'results': results}
+
+
+def get_metadata(seed, lca_density, repeat):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'aecdata': getattr(aecdata, '__version__', None),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'seed': seed,
+        'lca_density': lca_density,
+        'repeat': repeat,
+    }
+
+
+def compare(before, after):
+    """
+    Compares two results of run, matching the benchmarks by name and size.
+
+    :return: DataFrame with the minimum times before and after and their ratio (after / before).
+    """
+    def to_df(results):
+        return pd.DataFrame(results['results']).set_index(['benchmark', 'n_products'])['min']
+
+    comparison = pd.concat({'before': to_df(before), 'after': to_df(after)}, axis=1).dropna()
+    comparison['ratio'] = comparison['after'] / comparison['before']
+    return comparison
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of aecdata on synthetic catalogues.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000], help='Numbers of products (1000 to 500000).')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed calls of every benchmark.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--lca-density', type=float, default=0.3, help='Probability of every LCA value to be declared.')
+    parser.add_argument('--benchmarks', nargs='+', choices=benchmark_names, default=None)
+    parser.add_argument('--output', default=None, help='JSON file where the results are saved.')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='Compare two JSON files of results.')
+    arguments = parser.parse_args(arguments)
+
+    if arguments.compare:
+        with open(arguments.compare[0]) as f:
+            before = json.load(f)
+        with open(arguments.compare[1]) as f:
+            after = json.load(f)
+        print(compare(before, after).to_string(float_format=lambda x: f'{x:.4f}'))
+        return
+
+    results = run(arguments.sizes, arguments.repeat, arguments.seed, arguments.lca_density, arguments.benchmarks)
+    if arguments.output:
+        with open(arguments.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Results saved to {arguments.output}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
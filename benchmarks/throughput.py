@@ -0,0 +1,146 @@
+"""
+Measures the download throughput of the client against the local fake API.
+
+    python -m benchmarks.throughput --products 20000 --latency 0.02 --output throughput.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import sys
+import time
+import warnings
+
+import numpy as np
+
+from aecdata import User
+from aecdata.fetch import AIMDController
+from .catalogue import generate_products
+from .fakeapi import FakeAPI, FakeAPIServer
+from .run import get_metadata
+
+fetch_modes = {
+    'get_products': lambda user, **options: user.get_products(openapi=False, **options),
+    'get_products_open_api': lambda user, **options: user.get_products(openapi=True, **options),
+    'get_products_filtered': lambda user, **options: user.get_products(openapi=False, **options, **{'continent': 1}),
+}
+
+
+def measure(user, api, mode, repeat=1, **fetch_options):
+    """
+    Downloads the products with a fetch mode of the client.
+
+    :param fetch_options: Options of get_products (page_size, max_concurrency).
+    :return: dict with the pages and bytes per second, the p50 and p99 latency of the page
+             requests in seconds, the final and highest number of requests in flight, and the
+             number of products, pages and errors.
+    """
+    latencies = []
+    request_products_page = user.request_products_page
+
+    def timed_request_products_page(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return request_products_page(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    user.request_products_page = timed_request_products_page
+    api.reset_stats()
+    n_products, errors, concurrency = 0, [], []
+    start = time.perf_counter()
+    try:
+        for _ in range(repeat):
+            controller = AIMDController(maximum=fetch_options.get('max_concurrency', 8))
+            options = {key: value for key, value in fetch_options.items() if key != 'max_concurrency'}
+            try:
+                with contextlib.redirect_stdout(io.StringIO()), warnings.catch_warnings():
+                    warnings.simplefilter('ignore', UserWarning)
+                    n_products += len(fetch_modes[mode](user, controller=controller, **options))
+            except Exception as e:
+                errors.append(str(e))
+            concurrency.extend(limit for _, limit in controller.history)
+    finally:
+        elapsed = time.perf_counter() - start
+        del user.request_products_page
+
+    stats = dict(api.stats)
+    return {
+        'mode': mode,
+        'seconds': elapsed,
+        'products': n_products,
+        'pages': stats['pages'],
+        'bytes': stats['bytes'],
+        'pages_per_second': stats['pages'] / elapsed,
+        'bytes_per_second': stats['bytes'] / elapsed,
+        'latency_p50': float(np.percentile(latencies, 50)) if latencies else None,
+        'latency_p99': float(np.percentile(latencies, 99)) if latencies else None,
+        'final_concurrency': concurrency[-1],
+        'max_concurrency': max(concurrency),
+        'server_errors': stats['errors'],
+        'throttled': stats['throttled'],
+        'unauthorized': stats['unauthorized'],
+        'errors': errors,
+    }
+
+
+def run(n_products=10000, modes=None, repeat=1, seed=0, verbose=True, fetch_options=None, **api_options):
+    """
+    Serves a synthetic catalogue with the fake API and measures every fetch mode.
+
+    :param n_products: The number of products of the catalogue.
+    :param modes: The fetch modes to measure. If None, all of fetch_modes.
+    :param fetch_options: dict of options of get_products (page_size, max_concurrency).
+    :param api_options: Options of FakeAPI (page_size, latency, error_rate...).
+    :return: dict with the 'metadata' of the run and the 'results' of every mode.
+    """
+    if modes is None:
+        modes = list(fetch_modes)
+    api = FakeAPI(generate_products(n_products, seed=seed), seed=seed, **api_options)
+    results = []
+    with FakeAPIServer(api) as server:
+        user = User(api.developer_token, server.base_url)
+        for mode in modes:
+            result = measure(user, api, mode, repeat, **(fetch_options or {}))
+            results.append(result)
+            if verbose:
+                print(f"{mode:<24} {result['pages_per_second']:8.1f} pages/s {result['bytes_per_second'] / 2 ** 20:8.2f} MiB/s "
+                      f"p50 {result['latency_p50'] * 1000:7.1f} ms p99 {result['latency_p99'] * 1000:7.1f} ms "
+                      f"concurrency {result['final_concurrency']} (max {result['max_concurrency']})"
+                      + (f" {len(result['errors'])} failed" if result['errors'] else ''))
+
+    metadata = get_metadata(seed, None, repeat)
+    metadata.update({'products': n_products, **api_options, **(fetch_options or {})})
+    return {'metadata': metadata, 'results': results}
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Throughput of the client against the local fake API.')
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--modes', nargs='+', choices=list(fetch_modes), default=None)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--page-size', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--latency-jitter', type=float, default=0.0)
+    parser.add_argument('--token-lifetime', type=float, default=None)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--capacity', type=int, default=None, help='Requests served at the same time by the fake API.')
+    parser.add_argument('--client-page-size', type=int, default=None, help='page_size requested by the client.')
+    parser.add_argument('--max-concurrency', type=int, default=8, help='Highest number of requests in flight of the client.')
+    parser.add_argument('--output', default=None, help='JSON file where the results are saved.')
+    arguments = parser.parse_args(arguments)
+
+    results = run(arguments.products, arguments.modes, arguments.repeat, arguments.seed, page_size=arguments.page_size,
+                  latency=arguments.latency, latency_jitter=arguments.latency_jitter, token_lifetime=arguments.token_lifetime,
+                  error_rate=arguments.error_rate, throttle_rate=arguments.throttle_rate, capacity=arguments.capacity,
+                  fetch_options={'page_size': arguments.client_page_size, 'max_concurrency': arguments.max_concurrency})
+    if arguments.output:
+        with open(arguments.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Results saved to {arguments.output}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from aecdata.cache import ResultCache, get_dataframe_fingerprint
+from aecdata.productdata import ProductStatistics
+from benchmarks.catalogue import generate_products
+
+
+def test_fingerprint_depends_on_dtypes_and_values():
+    frames = [
+        pd.DataFrame({'a': [12.0, None]}),
+        pd.DataFrame({'a': np.array([12.0, None], dtype=object)}),
+        pd.DataFrame({'a': np.array([12, None], dtype=object)}),
+        pd.DataFrame({'a': np.array(['12', None], dtype=object)}),
+        pd.DataFrame({'a': pd.array(['12', None], dtype='string')}),
+        pd.DataFrame({'a': pd.array([12, None], dtype='Int64')}),
+        pd.DataFrame({'a': [[12.0], None]}),
+    ]
+    fingerprints = [get_dataframe_fingerprint(df) for df in frames]
+    assert len(set(fingerprints)) == len(frames)
+    assert fingerprints == [get_dataframe_fingerprint(df.copy()) for df in frames]
+    assert get_dataframe_fingerprint(pd.DataFrame({'a': [12.0, 13.0]})) != get_dataframe_fingerprint(pd.DataFrame({'a': [12.0, 14.0]}))
+
+
+def test_result_cache_evicts_least_recently_used():
+    cache = ResultCache(max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == (True, 1)
+    cache.set('c', 3)
+    assert cache.get('b') == (False, None)
+    assert cache.get('a') == (True, 1) and cache.get('c') == (True, 3)
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_result_cache_evicts_by_size():
+    df = pd.DataFrame({'value': np.zeros(1000)})
+    size = int(df.memory_usage(deep=True).sum())
+    cache = ResultCache(max_bytes=2 * size + 10)
+    for key in 'abc':
+        cache.set(key, df)
+    assert list(cache.entries) == ['b', 'c'] and cache.n_bytes == 2 * size
+    # Results larger than the cache are not kept
+    cache.set('d', pd.DataFrame({'value': np.zeros(3000)}))
+    assert cache.get('d') == (False, None) and list(cache.entries) == ['b', 'c']
+
+
+def test_result_cache_persists_to_directory(tmp_path):
+    ResultCache(cache_dir=str(tmp_path)).set('a', {'value': 1})
+    cache = ResultCache(cache_dir=str(tmp_path))
+    assert cache.get('a') == (True, {'value': 1})
+    cache.clear()
+    assert ResultCache(cache_dir=str(tmp_path)).get('a') == (False, None)
+
+
+@pytest.fixture
+def statistics():
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        statistics = ProductStatistics(generate_products(300, seed=4), unit='kg')
+    statistics.enable_cache()
+    return statistics
+
+
+def test_get_statistics_is_memoized(statistics):
+    options = {'statistical_metrics': ['count', 'mean', 'quartiles', 'outlier_ids'], 'n_jobs': None}
+    first = statistics.get_statistics(**options)
+    assert (statistics.cache.hits, statistics.cache.misses) == (0, 1)
+    # n_jobs does not change the result
+    pd.testing.assert_frame_equal(statistics.get_statistics(**{**options, 'n_jobs': 2}), first)
+    assert (statistics.cache.hits, statistics.cache.misses) == (1, 1)
+    statistics.get_statistics(**{**options, 'method': 'zscore'})
+    assert (statistics.cache.hits, statistics.cache.misses) == (1, 2)
+
+
+def test_cached_results_are_not_shared_with_callers(statistics):
+    options = {'statistical_metrics': ['count', 'quartiles', 'outlier_ids']}
+    first = statistics.get_statistics(**options)
+    column = next(column for column in first.columns if column.endswith('.outlier_ids') and first[column].map(len).any())
+    expected = first[column].map(list).tolist()
+    for ids in first[column]:
+        ids.append(-1)
+    quartiles = next(column for column in first.columns if column.endswith('.quartiles'))
+    first[quartiles].dropna().iloc[0][:] = -1
+
+    second = statistics.get_statistics(**options)
+    assert second[column].tolist() == expected
+    assert (second[quartiles].dropna().iloc[0] != -1).all()
+    assert statistics.cache.hits == 1
+
+
+def test_cache_is_invalidated_when_the_data_changes(statistics):
+    options = {'statistical_metrics': ['count', 'mean']}
+    before = statistics.get_statistics(**options)
+    df = statistics.dataframe.copy()
+    field = 'material_facts.manufacturing'
+    df[field] = df[field].map(lambda x: x * 2 if x is not None else None)
+    statistics.dataframe = df
+
+    after = statistics.get_statistics(**options)
+    assert statistics.cache.misses == 2
+    np.testing.assert_allclose(after[f'{field}.mean'].to_numpy(float), 2 * before[f'{field}.mean'].to_numpy(float))
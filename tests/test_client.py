@@ -0,0 +1,64 @@
+import json
+import os
+
+import pytest
+
+from aecdata.client import User
+from aecdata.spool import manifest_name
+from benchmarks.catalogue import generate_products
+from benchmarks.fakeapi import FakeAPI, FakeAPIServer
+
+
+def interrupt(directory, pages_left):
+    """Marks the last pages_left pages of a download as not done."""
+    path = os.path.join(directory, manifest_name)
+    with open(path) as f:
+        manifest = json.load(f)
+    manifest['pages_done'] = manifest['pages_done'][:-pages_left]
+    with open(path, 'w') as f:
+        json.dump(manifest, f)
+
+
+@pytest.fixture
+def server():
+    with FakeAPIServer(FakeAPI(generate_products(200, seed=0), page_size=50)) as server:
+        yield server
+
+
+@pytest.mark.filterwarnings('ignore:You are retrieving all products')
+def test_download_products_resumes_missing_pages(server, tmp_path):
+    user = User(server.api.developer_token, server.base_url)
+    user.download_products(str(tmp_path))
+    interrupt(str(tmp_path), 2)
+    server.api.reset_stats()
+    product_data = user.download_products(str(tmp_path))
+
+    # Page 1 to check TotalProducts and the two missing pages
+    assert server.api.stats['pages'] == 3
+    assert len(product_data.dataframe) == 200
+
+
+@pytest.mark.filterwarnings('ignore:You are retrieving all products')
+def test_download_products_restarts_when_total_products_changed(server, tmp_path):
+    user = User(server.api.developer_token, server.base_url)
+    user.download_products(str(tmp_path))
+    interrupt(str(tmp_path), 2)
+    server.api.set_products(generate_products(230, seed=1))
+
+    with pytest.warns(UserWarning, match='number of products changed'):
+        product_data = user.download_products(str(tmp_path))
+    assert len(product_data.dataframe) == 230
+
+
+def test_get_filters_mapping_returns_copies(server):
+    user = User(server.api.developer_token, server.base_url)
+    mapping = user.get_filters_mapping()
+    filter_key = next(key for key, label_to_id in mapping.items() if label_to_id)
+    label = next(iter(mapping[filter_key]))
+    identifier = mapping[filter_key][label]
+
+    mapping[filter_key][label] = -1
+    mapping.clear()
+
+    assert user.get_filters_mapping()[filter_key][label] == identifier
+    assert user.get_filter_index().get_id(filter_key, label) == identifier
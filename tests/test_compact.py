@@ -0,0 +1,16 @@
+import pandas as pd
+
+from aecdata.productdata import ProductData
+from benchmarks.catalogue import generate_products
+
+
+def test_compact_stores_repeated_text_as_categorical():
+    product_data = ProductData(generate_products(300, seed=0))
+    expected = product_data.dataframe.copy()
+
+    product_data.compact()
+
+    df = product_data.dataframe
+    for column in ['company', 'product_type', 'country', 'material_type', 'material_facts.declared_unit']:
+        assert isinstance(df[column].dtype, pd.CategoricalDtype), column
+    assert df['company'].astype(object).tolist() == expected['company'].tolist()
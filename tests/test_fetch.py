@@ -0,0 +1,148 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from aecdata.client import User
+from aecdata.fetch import AIMDController, PageFetcher
+from benchmarks.catalogue import generate_products
+from benchmarks.fakeapi import FakeAPI, FakeAPIServer
+
+page_size = 20
+
+
+@pytest.fixture
+def server():
+    with FakeAPIServer(FakeAPI(generate_products(300, seed=0), page_size=page_size)) as server:
+        yield server
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Records the delays slept instead of sleeping."""
+    delays, lock = [], threading.Lock()
+
+    def sleep(delay):
+        with lock:
+            delays.append(delay)
+
+    monkeypatch.setattr(time, 'sleep', sleep)
+    return delays
+
+
+def fetch_all(fetcher, n_pages):
+    pages = {}
+    fetcher.fetch(range(1, n_pages + 1), lambda page, data: pages.__setitem__(page, data['results']))
+    return [product for page in sorted(pages) for product in pages[page]]
+
+
+def test_aimd_controller_grows_and_backs_off():
+    controller = AIMDController(initial=2, maximum=4, backoff=0.5)
+    for _ in range(20):
+        controller.on_success(0.1)
+    assert controller.limit == 4
+    controller.on_throttle()
+    assert controller.limit == 2
+    # The requests in flight during the back off do not cut the window again
+    controller.on_error()
+    assert controller.limit == 2
+    for _ in range(2):
+        controller.on_success(0.1)
+    assert controller.limit == 3
+    controller.on_error()
+    assert controller.limit == 1
+    # A rising latency backs off as well
+    for _ in range(3):
+        controller.on_success(0.1)
+    controller.on_success(1.0)
+    assert controller.limit == 1
+    assert [limit for _, limit in controller.history] == [2, 3, 4, 2, 3, 1, 2, 3, 1]
+
+
+def test_fetch_retries_throttled_and_failed_pages(server, sleeps):
+    server.api.throttle_rate, server.api.error_rate, server.api.retry_after = 0.2, 0.2, 7
+    user = User(server.api.developer_token, server.base_url)
+    fetcher = PageFetcher(user, filters={'page_size': page_size}, controller=AIMDController(maximum=4), max_retries=30,
+                          retry_delay=0.01)
+
+    products = fetch_all(fetcher, 300 // page_size)
+
+    # No page is lost or repeated
+    assert [product['unique_product_uuid_v2'] for product in products] == \
+           [product['unique_product_uuid_v2'] for product in server.api.products]
+    stats = server.api.stats
+    assert stats['throttled'] and stats['errors']
+    assert stats['pages'] == 300 // page_size
+    # One retry per failed request: after the Retry-After of 429s, with exponential backoff for 5xx
+    assert len(sleeps) == stats['throttled'] + stats['errors']
+    assert sleeps.count(7.0) == stats['throttled']
+    assert all(delay == 7.0 or any(delay == 0.01 * 2 ** retries for retries in range(30)) for delay in sleeps)
+
+
+def test_fetch_page_backs_off_exponentially_then_raises(server, sleeps):
+    server.api.error_rate = 1.0
+    user = User(server.api.developer_token, server.base_url)
+    fetcher = PageFetcher(user, max_retries=3, retry_delay=0.5)
+
+    with pytest.raises(requests.HTTPError):
+        fetcher.fetch_page(1)
+    assert sleeps == [0.5, 1.0, 2.0]
+    assert server.api.stats['errors'] == 4
+
+
+def test_fetch_refreshes_expired_token_once(server, sleeps):
+    events = []
+    user = User(server.api.developer_token, server.base_url, hooks=[events.append])
+    expired_token = user.api_token
+    server.api.api_tokens.clear()
+    fetcher = PageFetcher(user, filters={'page_size': page_size}, controller=AIMDController(initial=4, maximum=4))
+
+    products = fetch_all(fetcher, 300 // page_size)
+
+    assert len(products) == 300
+    assert user.api_token != expired_token
+    # The requests in flight with the expired token share one refresh
+    assert [event['success'] for event in events if event['event'] == 'token_refresh'] == [True]
+    assert 1 <= server.api.stats['unauthorized'] <= 4
+    assert not sleeps
+
+
+def test_fetch_raises_when_the_refreshed_token_is_rejected(server, sleeps):
+    user = User(server.api.developer_token, server.base_url)
+    server.api.api_tokens.clear()
+    server.api.refresh_tokens.clear()
+
+    with pytest.raises(Exception, match='Unauthorized'):
+        PageFetcher(user).fetch_page(1)
+    assert server.api.stats['unauthorized'] == 2
+
+
+class InFlight:
+    """Hook recording the highest number of requests in flight."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = self.highest = 0
+
+    def __call__(self, event):
+        with self.lock:
+            if event['event'] == 'request_start':
+                self.current += 1
+                self.highest = max(self.highest, self.current)
+            elif event['event'] == 'request_end':
+                self.current -= 1
+
+
+@pytest.mark.filterwarnings('ignore:You are retrieving all products')
+def test_get_products_is_sequential_unless_max_concurrency_is_given(server):
+    server.api.latency = 0.02
+    in_flight = InFlight()
+    user = User(server.api.developer_token, server.base_url, hooks=[in_flight])
+
+    assert len(user.get_products(page_size=page_size)) == 300
+    assert in_flight.highest == 1
+
+    products = user.get_products(page_size=page_size, max_concurrency=4, controller=AIMDController(initial=4, maximum=4))
+    assert len(products) == 300
+    assert in_flight.highest > 1
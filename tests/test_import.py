@@ -0,0 +1,41 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+heavy_modules = ['pandas', 'numpy', 'pyarrow', 'requests']
+
+# Seconds allowed to import the light entry points, far above their cost without the heavy
+# dependencies and below the cost of pandas alone
+import_budget = 0.2
+
+
+def run_import(statement):
+    """Runs an import statement in a fresh interpreter, returns its time and the heavy modules loaded."""
+    code = (
+        'import json, sys, time\n'
+        'start = time.perf_counter()\n'
+        f'{statement}\n'
+        'seconds = time.perf_counter() - start\n'
+        f'print(json.dumps({{"seconds": seconds, "loaded": [m for m in {heavy_modules!r} if m in sys.modules]}}))\n'
+    )
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+@pytest.mark.parametrize('statement', ['import aecdata', 'from aecdata.utils import production_base_url'])
+def test_light_import(statement):
+    result = run_import(statement)
+    assert result['loaded'] == []
+    assert result['seconds'] < import_budget
+
+
+def test_user_does_not_load_dataframes():
+    result = run_import('from aecdata import User')
+    assert result['loaded'] == ['requests']
+
+
+def test_dataframe_features_load_on_access():
+    result = run_import('import aecdata; aecdata.ProductData')
+    assert {'pandas', 'numpy'} <= set(result['loaded'])
@@ -0,0 +1,81 @@
+import copy
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from aecdata.productdata import ProductStatistics
+from aecdata.profiling import profile
+from benchmarks.catalogue import generate_products
+
+metrics = ['count', 'mean', 'median', 'standard_deviation', 'minimum', 'maximum', 'range', 'quartiles']
+
+
+def get_changes(products, n_changes, seed):
+    """Returns updated copies of n_changes products (with scaled values) and new products."""
+    rng = np.random.default_rng(seed)
+    updated = copy.deepcopy([products[i] for i in rng.choice(len(products), n_changes, replace=False)])
+    for product in updated:
+        for key, value in product['material_facts'].items():
+            if isinstance(value, float):
+                product['material_facts'][key] = value * rng.choice([0.1, 1.5, -1, 50])
+    return updated + generate_products(5, seed=seed + 1000)
+
+
+def assert_statistics_equal(statistics_df, expected_df):
+    assert list(statistics_df.columns) == list(expected_df.columns)
+    assert len(statistics_df) == len(expected_df)
+    for column in statistics_df.columns:
+        if column.endswith('.quartiles'):
+            for quartiles, expected in zip(statistics_df[column], expected_df[column]):
+                np.testing.assert_allclose(quartiles, expected, rtol=1e-9)
+        elif pd.api.types.is_numeric_dtype(expected_df[column]):
+            np.testing.assert_allclose(statistics_df[column].to_numpy(float), expected_df[column].to_numpy(float), rtol=1e-7, atol=1e-12)
+        else:
+            assert statistics_df[column].tolist() == expected_df[column].tolist()
+
+
+@pytest.fixture(scope='module')
+def products():
+    return generate_products(800, seed=3)
+
+
+@pytest.mark.parametrize('method, sqrt_tranf', [('IQR', True), ('IQR', False), ('zscore', True), ('repeated_zscore', True), (None, True)])
+def test_apply_changes_matches_recomputed_statistics(products, method, sqrt_tranf):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        statistics = ProductStatistics(copy.deepcopy(products), unit='kg')
+    options = {'statistical_metrics': metrics, 'group_by': ['product_type', 'building_applications'],
+               'remove_outliers': method is not None, 'method': method or 'IQR', 'sqrt_tranf': sqrt_tranf}
+    statistics.track_statistics(**options)
+
+    for seed in range(3):
+        changes = get_changes(products, 25, seed)
+        statistics_df = statistics.apply_changes(changes, deleted_uuids=[product['unique_product_uuid_v2'] for product in changes[:3]])
+
+    assert_statistics_equal(statistics_df, statistics.get_statistics(**options))
+
+
+def test_apply_changes_cost_depends_on_the_changes(products):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        statistics = ProductStatistics(copy.deepcopy(products), unit='kg')
+    statistics.track_statistics(statistical_metrics=metrics)
+    dataframe = statistics._dataframe
+    changes = get_changes(products, 20, seed=0)
+
+    with profile() as profiler:
+        statistics.apply_changes(changes)
+
+    # No stage processes the catalogue, and the DataFrame is only rebuilt when it is read
+    rows = [record['rows'] for record in profiler.records if record['rows'] is not None]
+    assert rows and max(rows) <= 4 * len(changes)
+    assert statistics._dataframe is dataframe
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        changed_df = ProductStatistics(changes, unit='kg').dataframe
+    changed_uuids = {product['unique_product_uuid_v2'] for product in changes}
+    expected_uuids = set(dataframe['unique_product_uuid_v2']) - changed_uuids | set(changed_df['unique_product_uuid_v2'])
+    assert sorted(statistics.dataframe['unique_product_uuid_v2']) == sorted(expected_uuids)
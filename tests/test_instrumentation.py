@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+
+from aecdata.client import User
+from aecdata.instrumentation import Instrumentation
+from aecdata.productdata import ProductData
+from aecdata.streaming import decode_page
+from benchmarks.catalogue import generate_products
+from benchmarks.fakeapi import FakeAPI, FakeAPIServer
+
+
+@pytest.fixture
+def server():
+    with FakeAPIServer(FakeAPI(generate_products(120, seed=0), page_size=25)) as server:
+        yield server
+
+
+def get_products_url(server, user):
+    return f'{server.base_url}developer/api/get_products?page=1', {'Authorization': f'Bearer {user.api_token}'}
+
+
+def test_streamed_error_response_is_closed_without_hooks(server):
+    user = User(server.api.developer_token, server.base_url)
+    server.api.error_rate = 1.0
+    url, headers = get_products_url(server, user)
+
+    response, data = Instrumentation().request('GET', url, 'get_products', decode=decode_page, headers=headers)
+
+    assert not response.ok and data is None
+    assert response.raw.closed
+
+
+def test_decode_errors_reach_the_hooks(server):
+    user = User(server.api.developer_token, server.base_url)
+    url, headers = get_products_url(server, user)
+    events = []
+
+    def decode(chunks):
+        raise RuntimeError('decoder failed')
+
+    with pytest.raises(RuntimeError):
+        Instrumentation([events.append]).request('GET', url, 'get_products', decode=decode, headers=headers)
+    end = events[-1]
+    assert end['event'] == 'request_end' and end['status'] == 200
+    assert end['error'] == 'RuntimeError: decoder failed'
+
+
+@pytest.mark.filterwarnings('ignore')
+def test_get_product_data_matches_get_products(server):
+    user = User(server.api.developer_token, server.base_url)
+
+    expected = ProductData(user.get_products()).dataframe
+    df = user.get_product_data().dataframe
+
+    pd.testing.assert_frame_equal(df, expected)
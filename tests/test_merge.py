@@ -0,0 +1,123 @@
+import copy
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from aecdata.compact import expand_dataframe
+from aecdata.productdata import ProductData
+from benchmarks.catalogue import generate_products
+
+key = 'unique_product_uuid_v2'
+
+
+@pytest.fixture
+def products():
+    return generate_products(40, seed=0)
+
+
+def get_versions(products, updated):
+    """Copies of the products with the given 'updated' dates and a name telling them apart."""
+    versions = copy.deepcopy(products)
+    for product, date in zip(versions, updated):
+        product['updated'] = date
+        product['name'] = f"{product['name']} ({date})"
+    return versions
+
+
+def get_overlapping_versions(products):
+    """Second versions of products[10:30], each newer, older, as recent or without date."""
+    dates = ['2030-01-01', '2000-01-01', None, 'tie']
+    updated = [dates[i % 4] for i in range(20)]
+    updated = [product['updated'] if date == 'tie' else date for product, date in zip(products[10:30], updated)]
+    return get_versions(products[10:30], updated)
+
+
+def get_expected_names(*inputs):
+    """Reference of the latest record of every product, the last one on ties and dated records first."""
+    latest = {}
+    for products in inputs:
+        for product in products:
+            date = pd.Timestamp(product['updated']) if product.get('updated') else None
+            previous = latest.get(product[key])
+            if previous is None or (date is not None and (previous[0] is None or date >= previous[0])):
+                latest[product[key]] = (date, product['name'])
+    return {uuid: name for uuid, (date, name) in latest.items()}
+
+
+def get_names(product_data):
+    df = expand_dataframe(product_data.dataframe)
+    assert df[key].is_unique
+    return dict(zip(df[key], df['name']))
+
+
+def test_concat_keeps_the_latest_record(products):
+    first, second = products[:30], get_overlapping_versions(products)
+
+    product_data = ProductData.concat([first, second, products[30:]])
+
+    assert get_names(product_data) == get_expected_names(first, second, products[30:])
+    # Every outcome is covered: newer, older, undated and tied records
+    names = get_names(product_data)
+    assert sum('(2030-01-01)' in names[product[key]] for product in second) == 5
+    assert sum(names[product[key]] == product['name'] for product in second) == 10
+    assert len(product_data.data) == 40
+
+
+def test_upsert_keeps_the_latest_record(products):
+    second = get_overlapping_versions(products)
+    product_data = ProductData(products[:30])
+
+    product_data.upsert(ProductData(second)).upsert(products[30:])
+
+    assert get_names(product_data) == get_expected_names(products[:30], second, products[30:])
+
+
+@pytest.mark.parametrize('compacted', [[True, False], [False, True], [True, True]])
+def test_concat_of_compacted_and_plain_inputs(products, compacted):
+    first, second = products[:30], get_overlapping_versions(products)
+    items = [ProductData(copy.deepcopy(inputs)) for inputs in (first, second)]
+    for item, compact in zip(items, compacted):
+        if compact:
+            item.compact()
+    expected = ProductData.concat([first, second])
+
+    product_data = ProductData.concat(items)
+
+    assert get_names(product_data) == get_expected_names(first, second)
+    # Compacted inputs stay compacted only if they all are
+    assert product_data.compact_options == ({'float32': False} if all(compacted) else None)
+    df = expand_dataframe(product_data.dataframe) if all(compacted) else product_data.dataframe
+    pd.testing.assert_frame_equal(df.astype(object).replace({np.nan: None}),
+                                  expected.dataframe.astype(object).replace({np.nan: None}))
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_columns_present_in_only_one_input(products, compact):
+    first = copy.deepcopy(products[:20])
+    for product in first:
+        product['only_first'] = 'first'
+    second = get_overlapping_versions(products)
+    for product in second:
+        product['only_second'] = 1.5
+        del product['city']
+    items = [ProductData(first), ProductData(second)]
+    if compact:
+        for item in items:
+            item.compact()
+
+    product_data = ProductData.concat(items)
+
+    df = product_data.dataframe
+    assert get_names(product_data) == get_expected_names(first, second)
+    from_second = df[key].isin([product[key] for product in second]) & df['name'].isin([product['name'] for product in second])
+    assert from_second.any() and not from_second.all()
+    assert df.loc[from_second, 'only_second'].eq(1.5).all()
+    assert df.loc[~from_second, 'only_second'].isna().all()
+    assert df.loc[from_second, 'city'].isna().all()
+    assert df.loc[from_second, 'only_first'].isna().all()
+    assert (df.loc[~from_second & df[key].isin([product[key] for product in first]), 'only_first'] == 'first').all()
+    if compact:
+        # Missing values of Categorical and float columns are NaN, the dtypes are kept
+        assert isinstance(df['only_first'].dtype, pd.CategoricalDtype)
+        assert df['only_second'].dtype == np.float64
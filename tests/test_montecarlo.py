@@ -0,0 +1,94 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from aecdata.montecarlo import sample_totals
+from aecdata.productdata import ProductStatistics
+from benchmarks.catalogue import generate_products
+
+field = 'material_facts.manufacturing'
+
+
+@pytest.fixture
+def statistics():
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return ProductStatistics(generate_products(400, seed=1), unit='kg')
+
+
+def get_products_info(statistics, n_lines=8):
+    df = statistics.dataframe
+    uuids = df.loc[df[field].notna(), 'unique_product_uuid_v2'].head(n_lines)
+    return {uuid: {'unit': 'kg', 'amount': line + 1.5} for line, uuid in enumerate(uuids)}
+
+
+def set_value_per_product_type(statistics):
+    """Gives every product the same value as the other products of its product_type."""
+    df = statistics.dataframe.copy()
+    values = {product_type: code + 1.0 for code, product_type in enumerate(df['product_type'].unique())}
+    df[field] = df['product_type'].map(values).astype(object)
+    statistics.dataframe = df
+
+
+@pytest.mark.parametrize('distribution', ['quartiles', 'normal', 'lognormal'])
+def test_sample_totals_of_degenerate_distributions_are_the_point_total(distribution):
+    quantities = np.array([1.5, 2.0, 4.0])
+    values = np.array([2.0, 0.5, 3.0])
+    samples = sample_totals(quantities, 1000, distribution, mean=values, standard_deviation=np.zeros(3),
+                            quantiles=np.repeat(values[:, None], 5, axis=1), fixed_total=10, seed=0)
+    np.testing.assert_allclose(samples, 10 + quantities @ values, rtol=1e-6)
+
+
+def test_fixed_seed_gives_the_same_totals(statistics):
+    products_info = get_products_info(statistics)
+    options = {'uncertain': 'all', 'n_samples': 5000, 'return_samples': True}
+
+    summary, samples = statistics.simulate_totals(products_info, field, seed=3, **options)
+    again, samples_again = statistics.simulate_totals(products_info, field, seed=3, **options)
+    _, other_samples = statistics.simulate_totals(products_info, field, seed=4, **options)
+
+    pd.testing.assert_series_equal(again, summary)
+    np.testing.assert_array_equal(samples_again, samples)
+    assert not np.array_equal(other_samples, samples)
+    assert summary['standard_deviation'] > 0
+
+
+@pytest.mark.filterwarnings('ignore:.*uncertain lines have no distribution')
+@pytest.mark.parametrize('distribution', ['quartiles', 'normal', 'lognormal'])
+@pytest.mark.parametrize('group_by', [None, ['product_type', 'country']])
+def test_degenerate_group_distributions_give_the_point_total(statistics, distribution, group_by):
+    set_value_per_product_type(statistics)
+    products_info = get_products_info(statistics)
+
+    summary, samples = statistics.simulate_totals(products_info, field, group_by=group_by, distribution=distribution,
+                                                  uncertain='all', n_samples=2000, seed=0, return_samples=True)
+
+    expected = sum(info['amount'] * statistics.dataframe.set_index('unique_product_uuid_v2').loc[uuid, field]
+                   for uuid, info in products_info.items())
+    assert summary['point_total'] == expected
+    np.testing.assert_allclose(samples, expected, rtol=1e-6)
+    assert summary['standard_deviation'] == pytest.approx(0, abs=1e-4)
+
+
+def test_groups_mixing_values_are_sampled(statistics):
+    set_value_per_product_type(statistics)
+    products_info = get_products_info(statistics)
+
+    # The countries mix products of every product_type
+    summary = statistics.simulate_totals(products_info, field, group_by=['country'], uncertain='all', seed=0)
+
+    assert summary['standard_deviation'] > 0
+
+
+def test_percentiles_of_the_samples_are_returned(statistics):
+    products_info = get_products_info(statistics)
+
+    summary, samples = statistics.simulate_totals(products_info, field, percentiles=(2.5, 50, 90), uncertain='all',
+                                                  n_samples=3000, seed=1, return_samples=True)
+
+    assert list(summary.index) == ['point_total', 'mean', 'standard_deviation', 'p2.5', 'p50', 'p90']
+    np.testing.assert_allclose(summary[['p2.5', 'p50', 'p90']].to_numpy(float), np.percentile(samples, [2.5, 50, 90]))
+    assert summary['mean'] == pytest.approx(samples.mean())
+    assert summary['p2.5'] <= summary['p50'] <= summary['p90']
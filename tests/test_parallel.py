@@ -0,0 +1,67 @@
+import os
+import tempfile
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from aecdata.groupstats import get_group_statistics, get_group_statistics_parallel
+from aecdata.productdata import ProductStatistics
+from benchmarks.catalogue import generate_products
+
+metrics = ['count', 'mean', 'median', 'standard_deviation', 'minimum', 'maximum', 'quartiles', 'range',
+           'coefficient_of_variation', 'outlier_ids']
+
+
+@pytest.fixture
+def temporary_directory(tmp_path, monkeypatch):
+    """Directory where the memory-mapped arrays shared with the workers are written."""
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    return tmp_path
+
+
+def assert_object_arrays_equal(column, expected):
+    assert column.shape == expected.shape
+    for value, expected_value in zip(column.flat, expected.flat):
+        if isinstance(expected_value, np.ndarray):
+            np.testing.assert_array_equal(value, expected_value)
+        elif isinstance(expected_value, list):
+            assert value == expected_value
+        else:
+            assert pd.isna(value) and pd.isna(expected_value)
+
+
+@pytest.mark.parametrize('method', ['IQR', 'zscore', 'repeated_zscore'])
+def test_parallel_group_statistics_match_serial_run(temporary_directory, method):
+    rng = np.random.default_rng(0)
+    values = rng.lognormal(size=(3000, 7))
+    values[rng.random(values.shape) < 0.2] = np.nan
+    values[rng.random(values.shape) < 0.01] *= 100
+    codes = rng.integers(0, 25, len(values))
+    # Ids different from the row positions, which the workers report
+    row_ids = np.arange(len(values)) * 10 + 7
+
+    expected_has_statistics, expected = get_group_statistics(values, codes, 25, metrics, method=method, row_ids=row_ids)
+    has_statistics, statistics = get_group_statistics_parallel(values, codes, 25, metrics, n_jobs=3, row_ids=row_ids,
+                                                              method=method)
+
+    np.testing.assert_array_equal(has_statistics, expected_has_statistics)
+    for metric in metrics:
+        if expected[metric].dtype == object:
+            assert_object_arrays_equal(statistics[metric], expected[metric])
+        else:
+            np.testing.assert_array_equal(statistics[metric], expected[metric])
+    assert any(ids for ids in expected['outlier_ids'].flat if isinstance(ids, list))
+    # The memory-mapped files are removed
+    assert not os.listdir(temporary_directory)
+
+
+def test_get_statistics_with_n_jobs_matches_serial_run(temporary_directory):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        statistics = ProductStatistics(generate_products(500, seed=2), unit='kg')
+    options = {'group_by': ['product_type', 'building_applications'], 'statistical_metrics': metrics}
+
+    pd.testing.assert_frame_equal(statistics.get_statistics(n_jobs=2, **options), statistics.get_statistics(n_jobs=None, **options))
+    assert not os.listdir(temporary_directory)
@@ -0,0 +1,146 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+import pytest
+
+from aecdata import profiling
+from aecdata.profiling import Profiler, profile, profiled, stage
+
+
+class Clock:
+    """Replaces time.perf_counter with a clock advanced by the test."""
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, 'perf_counter', clock)
+    return clock
+
+
+def test_nested_stages_record_their_depth():
+    with profile() as profiler:
+        with stage('outer', 10):
+            with stage('middle'):
+                with stage('inner', 3):
+                    pass
+            with stage('middle'):
+                pass
+
+    records = [(record['stage'], record['depth'], record['rows']) for record in profiler.records]
+    assert records == [('inner', 2, 3), ('middle', 1, None), ('middle', 1, None), ('outer', 0, 10)]
+
+
+def test_stages_are_only_recorded_while_profiling():
+    profiler = Profiler()
+    with stage('before'):
+        pass
+    with profiler:
+        # A profiler started twice records the stages once
+        profiler.start()
+        with stage('during'):
+            pass
+    with stage('after'):
+        pass
+
+    assert [record['stage'] for record in profiler.records] == ['during']
+    assert stage('idle') is profiling._null_stage
+
+
+def test_threads_have_their_own_depth():
+    def worker():
+        with stage('worker'):
+            pass
+
+    with profile() as profiler:
+        with stage('main'):
+            thread = threading.Thread(target=worker)
+            thread.start()
+            thread.join()
+
+    records = {record['stage']: record for record in profiler.records}
+    assert records['worker']['depth'] == 0 and records['main']['depth'] == 0
+    assert records['worker']['thread'] != records['main']['thread']
+
+
+def test_table_aggregates_the_calls_of_every_stage(clock):
+    @profiled('decorated', rows=lambda values: len(values))
+    def decorated(values):
+        clock.advance(0.5)
+
+    with profile() as profiler:
+        for seconds, rows in [(1.0, 10), (3.0, 20), (2.0, None)]:
+            with stage('repeated', rows):
+                clock.advance(seconds)
+        with stage('without_rows'):
+            clock.advance(0.25)
+        decorated([1, 2, 3])
+        decorated([4])
+
+    table = profiler.table().set_index('stage')
+    assert list(table.index) == ['repeated', 'decorated', 'without_rows']
+    assert table.loc['repeated', ['calls', 'total_seconds', 'mean_seconds', 'max_seconds', 'rows']].tolist() == [3, 6.0, 2.0, 3.0, 30]
+    assert table.loc['decorated', ['calls', 'total_seconds', 'rows']].tolist() == [2, 1.0, 4]
+    assert table.loc['without_rows', 'calls'] == 1 and pd.isna(table.loc['without_rows', 'rows'])
+    assert table['peak_memory'].isna().all()
+    assert Profiler().table().empty
+
+
+def test_memory_peaks_include_the_nested_stages():
+    size = 2 ** 22
+    tracing = tracemalloc.is_tracing()
+    with profile(memory=True) as profiler:
+        with stage('outer'):
+            kept = bytearray(size)
+            with stage('inner'):
+                temporary = bytearray(2 * size)
+                del temporary
+            with stage('small'):
+                pass
+            del kept
+
+    records = {record['stage']: record for record in profiler.records}
+    assert 2 * size <= records['inner']['peak_memory'] < 3 * size
+    # The peak of outer includes the memory it holds while inner runs
+    assert records['outer']['peak_memory'] >= 3 * size
+    assert records['small']['peak_memory'] < size
+    assert profiler.table().set_index('stage').loc['inner', 'peak_memory'] == records['inner']['peak_memory']
+    # tracemalloc is stopped if the profiler started it
+    assert tracemalloc.is_tracing() == tracing
+
+
+def test_chrome_trace(clock, tmp_path):
+    with profile(memory=True) as profiler:
+        clock.advance(1.0)
+        with stage('ProductData.outer', 5):
+            clock.advance(0.5)
+            with stage('ProductStatistics.inner'):
+                clock.advance(0.25)
+
+    path = tmp_path / 'trace.json'
+    trace = profiler.to_chrome_trace(str(path))
+
+    with open(path) as f:
+        assert json.load(f) == trace
+    assert trace['displayTimeUnit'] == 'ms'
+    outer, inner = trace['traceEvents']
+    assert (outer['name'], outer['cat'], outer['ph']) == ('ProductData.outer', 'ProductData', 'X')
+    assert (outer['ts'], outer['dur']) == (1e6, 0.75e6)
+    assert (inner['name'], inner['cat'], inner['ts'], inner['dur']) == ('ProductStatistics.inner', 'ProductStatistics', 1.5e6, 0.25e6)
+    assert outer['args']['rows'] == 5 and inner['args']['rows'] is None
+    assert 'peak_memory' in outer['args']
+    assert outer['pid'] == inner['pid'] == os.getpid()
+    assert outer['tid'] == inner['tid'] == threading.get_ident()
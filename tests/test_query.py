@@ -0,0 +1,27 @@
+import pandas as pd
+import pytest
+
+from aecdata.query import query_positions, ColumnIndex
+
+
+def get_df():
+    return pd.DataFrame({
+        'density': [10.0, 25.0, 30.0, None],
+        'building_applications': [['Wall', 'Roof'], ['Floor'], None, ['Roof']],
+    })
+
+
+def test_list_columns_match_membership():
+    df = get_df()
+    assert query_positions(df, {'building_applications': ('==', 'Roof')}).tolist() == [0, 3]
+    assert query_positions(df, {'building_applications': ('not in', ['Roof'])}).tolist() == [1, 2]
+    assert query_positions(df, {'building_applications': ['Floor'], 'density': ('between', 20, 40)}).tolist() == [1]
+
+
+@pytest.mark.parametrize('condition', [('<', 'Roof'), ('>=', 'Roof'), ('between', 'A', 'Z')])
+def test_range_operators_on_list_columns_raise(condition):
+    df = get_df()
+    with pytest.raises(ValueError, match='list column'):
+        query_positions(df, {'building_applications': condition})
+    with pytest.raises(ValueError, match='list column'):
+        query_positions(df, {'building_applications': condition}, {'building_applications': ColumnIndex(df['building_applications'])})
@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from aecdata.productdata import ProductData
+from aecdata.search import AlternativesIndex, alternative_features
+from benchmarks.catalogue import generate_products
+
+field = 'material_facts.total_co2e_kg_mf'
+partition_by = ['product_type', 'material_facts.declared_unit']
+
+
+@pytest.fixture(scope='module')
+def product_data():
+    return ProductData(generate_products(600, seed=2))
+
+
+def get_reference_alternatives(df, uuid, k, unit):
+    """Brute force reference of the alternatives: a scan of all the products."""
+    features = [feature for feature in alternative_features if feature in df.columns]
+    values = df[features].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = np.log(np.where(values > 0, values, np.nan))
+    values = (values - np.nanmean(values, axis=0)) / np.nanstd(values, axis=0)
+    factors = df[f'material_facts.scaling_factors.{unit}.value'].to_numpy(dtype=float)
+    unit_values = df[field].to_numpy(dtype=float) / factors
+
+    position = df.index.get_loc(df.index[df['unique_product_uuid_v2'] == uuid][0])
+    same_partition = np.ones(len(df), dtype=bool)
+    for column in partition_by:
+        same_partition &= (df[column] == df[column].iloc[position]).to_numpy()
+    rows = []
+    for candidate in np.flatnonzero(same_partition & (unit_values < unit_values[position])):
+        common = ~np.isnan(values[candidate]) & ~np.isnan(values[position])
+        distance = np.mean((values[candidate, common] - values[position, common]) ** 2) if common.any() else np.inf
+        rows.append((distance, unit_values[candidate], candidate))
+    rows.sort()
+    return rows[:k]
+
+
+def test_alternatives_match_a_brute_force_scan(product_data):
+    df = product_data.dataframe
+    uuids = df.loc[df[field].notna() & df['material_facts.scaling_factors.kg.value'].notna(), 'unique_product_uuid_v2']
+    n_found = 0
+    for uuid in uuids.iloc[:60]:
+        alternatives = product_data.find_alternatives(uuid, k=4, unit='kg')
+        expected = get_reference_alternatives(df, uuid, 4, 'kg')
+
+        np.testing.assert_allclose(alternatives['distance'].to_numpy(), [row[0] for row in expected])
+        np.testing.assert_allclose(alternatives['value'].to_numpy(), [row[1] for row in expected])
+        assert list(alternatives.index) == [df.index[row[2]] for row in expected]
+        n_found += len(alternatives)
+    assert n_found > 60
+
+
+def test_alternatives_are_lower_and_in_the_partition_of_the_product(product_data):
+    df = product_data.dataframe
+    uuids = df.loc[df[field].notna() & df['material_facts.scaling_factors.m2.value'].notna(), 'unique_product_uuid_v2']
+    for uuid in uuids.iloc[:30]:
+        product = df[df['unique_product_uuid_v2'] == uuid].iloc[0]
+        product_value = product[field] / product['material_facts.scaling_factors.m2.value']
+
+        alternatives = product_data.find_alternatives(uuid, k=10, unit='m2')
+
+        assert (alternatives['value'] < product_value).all()
+        np.testing.assert_allclose(alternatives['value'], alternatives[field].astype(float) / alternatives['material_facts.scaling_factors.m2.value'].astype(float))
+        for column in partition_by:
+            assert (alternatives[column] == product[column]).all()
+        assert uuid not in alternatives['unique_product_uuid_v2'].tolist()
+
+
+def test_alternatives_in_several_partitions_of_a_list_column(product_data):
+    df = product_data.dataframe
+    uuid = df.loc[df[field].notna(), 'unique_product_uuid_v2'].iloc[0]
+    applications = set(df.loc[df['unique_product_uuid_v2'] == uuid, 'building_applications'].iloc[0])
+
+    alternatives = product_data.find_alternatives(uuid, k=50, unit='declared_unit', partition_by=['building_applications'])
+
+    assert len(alternatives) and alternatives['unique_product_uuid_v2'].is_unique
+    assert all(applications & set(values) for values in alternatives['building_applications'])
+
+
+def test_ties_at_the_kth_distance_keep_the_lowest_values():
+    # Products 1 to 4 are at the same distance of product 0, product 5 further away
+    df = pd.DataFrame({
+        'unique_product_uuid_v2': [f'uuid-{i}' for i in range(7)],
+        'product_type': ['Brick'] * 6 + ['Paint'],
+        'material_facts.declared_unit': ['kg'] * 7,
+        'density': [100.0, 200.0, 200.0, 200.0, 200.0, 400.0, 100.0],
+        field: [10.0, 6.0, 3.0, 5.0, 4.0, 1.0, 1.0],
+    })
+    index = AlternativesIndex(df, features=['density'])
+
+    positions, distances, values = index.query('uuid-0', k=2, unit='declared_unit', field=field)
+
+    assert positions.tolist() == [2, 4]
+    assert values.tolist() == [3.0, 4.0]
+    assert distances[0] == distances[1]
+    positions, _, _ = index.query('uuid-0', k=5, unit='declared_unit', field=field)
+    assert positions.tolist() == [2, 4, 3, 1, 5]
+
+
+def test_query_errors(product_data):
+    df = product_data.dataframe
+    index = product_data.get_alternatives_index()
+    missing = df.loc[df[field].isna(), 'unique_product_uuid_v2'].iloc[0]
+
+    with pytest.raises(ValueError, match='not found'):
+        index.query('unknown-uuid')
+    with pytest.raises(ValueError, match='has no'):
+        index.query(missing, unit='declared_unit')
+    with pytest.raises(ValueError, match='not available'):
+        index.query(df['unique_product_uuid_v2'].iloc[0], field='unknown_field')
+    with pytest.raises(ValueError, match='not available'):
+        index.query(df['unique_product_uuid_v2'].iloc[0], unit='unknown_unit')
@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from aecdata.sketches import StatisticsSketch
+
+
+def make_sketch(seed, fields=('x',)):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'product_type': rng.choice(['a', 'b'], 200), 'estimated': False})
+    for field in fields:
+        df[field] = rng.normal(size=len(df))
+    return StatisticsSketch(fields=list(fields)).update(df)
+
+
+def test_merge_does_not_modify_merged_sketches():
+    first, second = make_sketch(1), make_sketch(2)
+    expected = first.get_statistics(statistical_metrics=['count', 'mean', 'median'])
+
+    accumulator = StatisticsSketch(fields=['x']).merge(first).merge(second)
+
+    pd.testing.assert_frame_equal(first.get_statistics(statistical_metrics=['count', 'mean', 'median']), expected)
+    assert accumulator.field_sketches[(('a',), 'x')].moments.n > first.field_sketches[(('a',), 'x')].moments.n
+
+
+def test_merge_rejects_different_fields():
+    with pytest.raises(ValueError):
+        make_sketch(1).merge(make_sketch(2, fields=('y',)))
@@ -0,0 +1,67 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from aecdata.snapshot import write_snapshot, read_snapshot
+
+
+def get_df(version):
+    return pd.DataFrame({'value': np.full(1000, float(version)), 'company': pd.Categorical(['a', 'b'] * 500)})
+
+
+def test_republish_is_atomic_for_attached_readers(tmp_path):
+    directory = str(tmp_path / 'catalogue')
+    write_snapshot(directory, get_df(0), {'version': 0})
+    attached, _ = read_snapshot(directory)
+
+    errors, stop = [], threading.Event()
+
+    def attach():
+        while not stop.is_set():
+            try:
+                df, metadata = read_snapshot(directory)
+                assert (df['value'] == metadata['version']).all()
+            except Exception as error:
+                errors.append(error)
+                return
+
+    readers = [threading.Thread(target=attach) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    for version in range(1, 30):
+        write_snapshot(directory, get_df(version), {'version': version})
+    stop.set()
+    for reader in readers:
+        reader.join()
+
+    assert not errors
+    assert (attached['value'] == 0).all()
+    df, metadata = read_snapshot(directory)
+    assert metadata['version'] == 29 and (df['value'] == 29).all()
+    # The current and the previous versions are kept
+    assert len([entry for entry in os.scandir(directory) if entry.is_dir()]) == 2
+
+
+def test_snapshot_round_trip_keeps_dtypes(tmp_path):
+    df = pd.DataFrame({
+        'float': [1.5, np.nan, 3.0],
+        'int': np.array([1, 2, 3], dtype=np.int64),
+        'nullable_int': pd.array([1, None, 3], dtype='Int64'),
+        'nullable_bool': pd.array([True, None, False], dtype='boolean'),
+        'datetime': pd.to_datetime(['2024-01-01', None, '2024-03-01']),
+        'datetime_tz': pd.to_datetime(['2024-01-01', None, '2024-03-01']).tz_localize('Europe/London'),
+        'text': pd.array(['a', None, 'c'], dtype='string'),
+        'category': pd.Categorical(['x', None, 'x']),
+        'lists': [['Wall'], None, ['Roof', 'Wall']],
+        'objects': np.array([1, 'b', None], dtype=object),
+    }, index=pd.Index([10, 20, 30]))
+    directory = str(tmp_path / 'snapshot')
+    write_snapshot(directory, df)
+
+    attached, _ = read_snapshot(directory)
+
+    # The numerical columns are memory-mapped, the other ones keep their dtype
+    assert not attached['int'].to_numpy().flags.writeable
+    pd.testing.assert_frame_equal(attached.copy(), df)
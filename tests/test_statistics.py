@@ -0,0 +1,160 @@
+import copy
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from aecdata.productdata import ProductData, ProductStatistics
+from benchmarks.catalogue import generate_products
+
+metrics = ['count', 'mean', 'median', 'standard_deviation', 'minimum', 'maximum', 'quartiles', 'range',
+           'coefficient_of_variation', 'outlier_ids']
+fields = ['material_facts.manufacturing', 'density', 'material_facts.total_biogenic_co2e', 'material_facts.recycled_content']
+min_count = 4
+
+
+def remove_outliers(series, method, sqrt_tranf):
+    """Per group reference of the outlier removal: returns the values kept and the outlier ids."""
+    sign = 1.0
+    if sqrt_tranf:
+        # Majority negative values are flipped, the values left negative are discarded
+        if (series < 0).sum() > len(series) / 2:
+            sign = -1.0
+        series = np.sqrt(series[series * sign >= 0] * sign)
+
+    outlier_ids = []
+    if method == 'zscore':
+        outliers = ((series - series.mean()) / series.std()).abs() > 1.96
+        outlier_ids = series.index[outliers].tolist()
+        series = series[~outliers]
+    elif method == 'repeated_zscore':
+        z_max = np.inf
+        while z_max > 6:
+            z_scores = ((series - series.mean()) / series.std()).abs()
+            outliers = z_scores > 1.96
+            outlier_ids.extend(series.index[outliers].tolist())
+            series = series[~outliers]
+            z_max = z_scores.max()
+    elif method == 'IQR':
+        Q1, Q3 = series.quantile(0.25), series.quantile(0.75)
+        outliers = ~series.between(Q1 - 1.5 * (Q3 - Q1), Q3 + 1.5 * (Q3 - Q1))
+        outlier_ids = series.index[outliers].tolist()
+        series = series[~outliers]
+
+    if sqrt_tranf:
+        series = sign * series ** 2
+    return series, outlier_ids
+
+
+def get_reference_statistics(df, group_by, method, sqrt_tranf):
+    """Returns a dict mapping (group values, field) to the metrics, one group and field at a time."""
+    df = df[df['estimated'] == False]
+    keys = df[group_by]
+    for group in group_by:
+        if keys[group].map(lambda x: isinstance(x, list)).any():
+            keys = keys.explode(group)
+    keys = keys.dropna()
+    keys = keys[~keys.reset_index().duplicated().to_numpy()]
+
+    reference = {}
+    for group_values, group_keys in keys.groupby(group_by):
+        labels = pd.unique(group_keys.index)
+        if len(labels) < min_count:
+            continue
+        for field in fields:
+            series = df.loc[labels, field].astype(float).dropna()
+            if len(series) < min_count:
+                continue
+            outlier_ids = []
+            if method is not None:
+                series, outlier_ids = remove_outliers(series, method, sqrt_tranf)
+            if len(series) < min_count:
+                reference[group_values, field] = {'count': 0, 'outlier_ids': []}
+                continue
+            mean, std = series.mean(), series.std()
+            reference[group_values, field] = {
+                'total_count': len(labels),
+                'count': len(series),
+                'mean': mean,
+                'median': series.median(),
+                'standard_deviation': std,
+                'minimum': series.min(),
+                'maximum': series.max(),
+                'quartiles': [series.quantile(0.25), series.median(), series.quantile(0.75), series.max()],
+                'range': series.max() - series.min(),
+                'coefficient_of_variation': std / mean if mean else np.nan,
+                'outlier_ids': outlier_ids,
+            }
+    return reference
+
+
+@pytest.fixture(scope='module')
+def statistics():
+    products = copy.deepcopy(generate_products(600, seed=3))
+    # A majority negative field with a few positive values
+    for product in products[::10]:
+        value = product['material_facts'].get('total_biogenic_co2e')
+        if isinstance(value, float):
+            product['material_facts']['total_biogenic_co2e'] = abs(value)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return ProductStatistics(products, unit='kg')
+
+
+@pytest.mark.parametrize('group_by', [['product_type'], ['product_type', 'building_applications']])
+@pytest.mark.parametrize('method, sqrt_tranf', [('IQR', True), ('IQR', False), ('zscore', True), ('zscore', False),
+                                                ('repeated_zscore', True), ('repeated_zscore', False), (None, True)])
+def test_get_statistics_matches_per_group_reference(statistics, group_by, method, sqrt_tranf):
+    statistics_df = statistics.get_statistics(group_by=group_by, fields=fields, statistical_metrics=metrics,
+                                              remove_outliers=method is not None, method=method or 'IQR',
+                                              sqrt_tranf=sqrt_tranf, min_count=min_count)
+    reference = get_reference_statistics(statistics.dataframe, group_by, method, sqrt_tranf)
+
+    rows = {tuple(row[group] for group in group_by): row for _, row in statistics_df.iterrows()}
+    assert set(rows) == {group_values for group_values, _ in reference}
+    n_outliers = 0
+    for (group_values, field), expected in reference.items():
+        row = rows[group_values]
+        assert row[f'{field}.count'] == expected['count']
+        assert row[f'{field}.outlier_ids'] == expected['outlier_ids']
+        n_outliers += len(expected['outlier_ids'])
+        if not expected['count']:
+            assert np.isnan(row[f'{field}.mean'])
+            continue
+        assert row['total_count'] == expected['total_count']
+        for metric in ['mean', 'median', 'standard_deviation', 'minimum', 'maximum', 'range', 'coefficient_of_variation']:
+            np.testing.assert_allclose(row[f'{field}.{metric}'], expected[metric], rtol=1e-9, err_msg=f'{group_values} {field}.{metric}')
+        np.testing.assert_allclose(row[f'{field}.quartiles'], expected['quartiles'], rtol=1e-9)
+    assert (n_outliers > 0) == (method is not None)
+
+
+def test_sqrt_transform_keeps_the_sign_of_majority_negative_fields(statistics):
+    # Intentional change: the transform is applied to the flipped values and the statistics keep
+    # the original sign, the minority positive values are discarded. np.sqrt used to fail on the
+    # object columns, the transform was skipped and these fields were reported with a flipped sign
+    field = 'material_facts.total_biogenic_co2e'
+    statistics_df = statistics.get_statistics(fields=[field], statistical_metrics=['count', 'mean', 'maximum'],
+                                              group_by=['product_type'], method='IQR', sqrt_tranf=True)
+    assert (statistics_df[f'{field}.mean'] < 0).all()
+    assert (statistics_df[f'{field}.maximum'] <= 0).all()
+
+    all_values = statistics.get_statistics(fields=[field], statistical_metrics=['maximum'], group_by=['product_type'],
+                                           remove_outliers=False)
+    assert (all_values[f'{field}.maximum'] > 0).any()
+
+
+@pytest.mark.parametrize('unit', ['declared_unit', 'kg', 'm2'])
+def test_converted_dataframe_has_the_layout_of_the_products(unit):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        statistics = ProductStatistics(generate_products(300, seed=3), unit=unit)
+        # The DataFrame built back from the converted products, as ProductStatistics once did
+        expected = ProductData(statistics.df_to_list(statistics.dataframe)).dataframe
+    df = statistics.dataframe
+
+    assert list(df.columns) == list(expected.columns)
+    assert df.dtypes.to_dict() == expected.dtypes.to_dict()
+    assert df['estimated'].dtype == bool
+    assert all(df[column].dtype == bool for column in df.columns if column.startswith('material_facts.scaling_factors.')
+               and column.endswith('.estimated') and df[column].notna().all())
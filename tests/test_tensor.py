@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from aecdata.productdata import ProductData
+from aecdata.tensor import LCATensor
+from aecdata.utils import lca_column_positions
+from benchmarks.catalogue import generate_products
+
+
+@pytest.fixture
+def product_data():
+    return ProductData(generate_products(200, seed=5))
+
+
+def get_lca_columns(df):
+    return [column for column in df.columns if column in lca_column_positions]
+
+
+@pytest.mark.parametrize('masked', [False, True])
+def test_to_dataframe_gives_back_the_source_columns(product_data, masked):
+    df = product_data.dataframe
+    columns = get_lca_columns(df)
+
+    result = product_data.lca_tensor(masked=masked).to_dataframe()
+
+    assert result.index.tolist() == df['unique_product_uuid_v2'].tolist()
+    assert set(columns) <= set(result.columns)
+    # None values of the source are NaN
+    expected = df[columns].to_numpy(dtype=float)
+    assert np.isnan(expected).any() and not np.isnan(expected).all()
+    np.testing.assert_array_equal(result[columns].to_numpy(), expected)
+    # The modules of a field absent from the source are NaN
+    assert result.drop(columns=columns).isna().all().all()
+
+
+def test_masked_values_are_the_missing_values(product_data):
+    tensor = product_data.lca_tensor()
+    masked = product_data.lca_tensor(masked=True)
+
+    assert isinstance(masked.values, np.ma.MaskedArray)
+    np.testing.assert_array_equal(np.ma.getmaskarray(masked.values), np.isnan(tensor.values))
+    np.testing.assert_array_equal(masked.values.filled(np.nan), tensor.values)
+
+
+def test_round_trip_through_from_dataframe(product_data):
+    tensor = product_data.lca_tensor()
+
+    again = LCATensor.from_dataframe(tensor.to_dataframe())
+
+    assert again.fields == tensor.fields and again.modules == tensor.modules
+    assert again.products.tolist() == tensor.products.tolist()
+    np.testing.assert_array_equal(again.values, tensor.values)
+
+
+def test_compacted_float32_tensor(product_data):
+    df = product_data.dataframe
+    columns = get_lca_columns(df)
+    expected = df[columns].to_numpy(dtype=np.float32)
+
+    tensor = product_data.compact(float32=True).lca_tensor()
+
+    assert tensor.values.dtype == np.float32
+    np.testing.assert_array_equal(tensor.to_dataframe()[columns].to_numpy(), expected)
+
+
+def test_sum_modules_is_nan_only_without_any_declared_module():
+    columns = list(lca_column_positions)[:2]
+    df = pd.DataFrame({
+        'unique_product_uuid_v2': ['a', 'b', 'c'],
+        columns[0]: [1.0, np.nan, None],
+        columns[1]: np.array([2.0, 3.0, None], dtype=object),
+    })
+
+    tensor = LCATensor.from_dataframe(df)
+    result = tensor.to_dataframe()
+    totals = tensor.sum_modules()
+
+    assert result.columns.tolist() == columns
+    np.testing.assert_array_equal(result.to_numpy(), [[1.0, 2.0], [np.nan, 3.0], [np.nan, np.nan]])
+    np.testing.assert_array_equal(totals.iloc[:, 0].to_numpy(), [3.0, 3.0, np.nan])
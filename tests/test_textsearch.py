@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+import aecdata.textsearch as textsearch
+from aecdata.textsearch import TextIndex
+
+
+def get_df(n):
+    rng = np.random.default_rng(0)
+    words = ['insulation', 'panel', 'plasterboard', 'acoustic', 'thermal', 'brick', 'concrete', 'timber']
+    return pd.DataFrame({
+        'name': [' '.join(rng.choice(words, 3)) for _ in range(n)],
+        'company': [f'Company {i % 40}' for i in range(n)],
+        'building_applications': [['Wall', 'Roof'] if i % 2 else None for i in range(n)],
+    })
+
+
+def test_index_skips_list_values():
+    df = get_df(50)
+    index = TextIndex(df, {'name': 2.0, 'building_applications': 1.0})
+    positions, _ = index.search('wall')
+    assert len(positions) == 0
+
+
+def test_search_batch_matches_search(monkeypatch):
+    df = get_df(2000)
+    index = TextIndex(df)
+    queries = ['insulation panel', 'plasterbord', 'Company 12', 'zzzz', 'acoustic thermal brick', 'timber']
+    expected = [index.search(query, 5) for query in queries]
+    # Several chunks of queries
+    monkeypatch.setattr(textsearch, 'max_batch_cells', 2 * len(df))
+    for (positions, scores), (expected_positions, expected_scores) in zip(index.search_batch(queries, 5), expected):
+        np.testing.assert_array_equal(positions, expected_positions)
+        np.testing.assert_array_equal(scores, expected_scores)
+
+    positions, scores = expected[0]
+    assert 0 < len(positions) <= 5
+    assert np.all(np.diff(scores) <= 0)
+    assert len(expected[3][0]) == 0
+
+
+def test_search_scores_the_postings_of_rare_terms():
+    df = get_df(2000)
+    df.loc[1234, 'name'] = 'xylophone'
+    index = TextIndex(df)
+    positions, scores = index.search('xylophone', 3)
+    assert positions.tolist() == [1234] and scores[0] > 0